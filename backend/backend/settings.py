@@ -34,13 +34,36 @@ load_dotenv()
 SECRET_KEY = os.getenv('SECRET_KEY')
 if not SECRET_KEY:
     raise Exception('SECRET_KEY is not set in environment')
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
+# Письма ставятся в очередь OutboxEmail и отправляются командой `python manage.py send_outbox`.
+# EMAIL_OUTBOX_EAGER=True — отправлять очередь сразу в процессе запроса (для локальной разработки).
+EMAIL_OUTBOX_EAGER = os.getenv('EMAIL_OUTBOX_EAGER', 'False') == 'True'
+
+# Фоновый импорт прайс-листов: файлы сохраняются в MEDIA_ROOT/imports,
+# задания разбирает команда `python manage.py run_import_jobs`.
+# IMPORT_JOBS_EAGER=True — выполнять импорт сразу в запросе (без воркера).
+MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', BASE_DIR / 'media'))
+IMPORT_JOBS_EAGER = os.getenv('IMPORT_JOBS_EAGER', 'False') == 'True'
+IMPORT_JOBS_CACHE = 'shared'
+
+# Накладные заказов (команда `python manage.py send_invoices`) кэшируются на диске по версии заказа
+INVOICE_ROOT = MEDIA_ROOT / 'invoices'
+
+# Кэш ответов каталога (ProductListView): записи хранятся в CATALOG_CACHE,
+# поколения магазинов/категорий для инвалидации — в общем для всех процессов кэше.
+CATALOG_CACHE = 'catalog'
+CATALOG_CACHE_GENERATIONS = 'shared'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Состояния магазинов (принимают ли заказы) кэшируются в памяти процесса;
+# версия для их инвалидации — в общем для всех процессов кэше.
+SHOP_STATE_CACHE = 'shared'
 
 
 
@@ -63,15 +86,44 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'shop.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'shop.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'shop.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Кэш аутентификации по токену (shop.authentication.CachedTokenAuthentication): LRU в памяти процесса
+# на TOKEN_AUTH_CACHE_SIZE токенов, запись живёт TOKEN_AUTH_CACHE_TTL секунд (0 — кэш выключен).
+# TOKEN_AUTH_SHARED_CACHE — псевдоним кэша второго уровня, общего для процессов (например, Redis).
+# Версии пользователей для сброса записей во всех процессах — в общем кэше TOKEN_AUTH_VERSIONS_CACHE.
+TOKEN_AUTH_CACHE_SIZE = int(os.getenv('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.getenv('TOKEN_AUTH_CACHE_TTL', 60))
+TOKEN_AUTH_SHARED_CACHE = os.getenv('TOKEN_AUTH_SHARED_CACHE') or None
+TOKEN_AUTH_VERSIONS_CACHE = 'shared'
+
+# Кодировщик JSON для API: 'auto' (orjson, затем msgspec, затем стандартный json) или имя явно
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+
+# Метрики запросов (shop.middleware.RequestMetricsMiddleware): число SQL-запросов и время добавляются
+# в ответ заголовками X-Query-Count и Server-Timing при REQUEST_METRICS_HEADERS (по умолчанию — при DEBUG).
+# QUERY_BUDGET_STRICT — превышение query_budget представления роняет запрос, а не только пишется в лог.
+REQUEST_METRICS_HEADERS = os.getenv('REQUEST_METRICS_HEADERS', str(DEBUG)) == 'True'
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+
 
 MIDDLEWARE = [
+    # Первым: в замер попадают запросы к базе и время всех остальных middleware
+    'shop.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -108,10 +160,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Транзакция сразу берёт блокировку записи: иначе транзакция, которая сначала читает
+        # (проверка пакета корзины), при записи получает "database is locked", не дожидаясь соседей
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        # Тестовая база — файл, как и рабочая: SQLite в памяти (shared cache) не ждёт снятия блокировки,
+        # и тесты параллельных запросов падали бы с "database table is locked"
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Общий для веб-процессов и воркеров кэш: прогресс импортов, поколения каталога.
+    # Для нескольких серверов замените на django.core.cache.backends.redis.RedisCache.
+    'shared': {
+        'BACKEND': os.getenv('SHARED_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('SHARED_CACHE_LOCATION', str(BASE_DIR / 'cache' / 'shared')),
+    },
+    # Ответы каталога: LRU в памяти процесса с ограничением по числу записей и TTL
+    'catalog': {
+        'BACKEND': os.getenv('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CATALOG_CACHE_LOCATION', 'catalog'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -130,6 +212,31 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Хэширование паролей (shop.hashers). PASSWORD_HASHER — алгоритм новых хэшей: pbkdf2, scrypt
+# или argon2 (нужен пакет argon2-cffi). Хэши других алгоритмов и хэши с прежней стоимостью
+# по-прежнему принимаются и пересчитываются по текущей политике при входе пользователя.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHER_CLASSES = {
+    'pbkdf2': 'shop.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'shop.hashers.ScryptPasswordHasher',
+    'argon2': 'shop.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = sorted(PASSWORD_HASHER_CLASSES.values(),
+                          key=lambda path: path != PASSWORD_HASHER_CLASSES[PASSWORD_HASHER])
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 1_000_000))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.getenv('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.getenv('PASSWORD_SCRYPT_PARALLELISM', 1))
+# Предел памяти OpenSSL на одно вычисление scrypt (0 — 32 МиБ по умолчанию OpenSSL)
+PASSWORD_SCRYPT_MAXMEM = int(os.getenv('PASSWORD_SCRYPT_MAXMEM', 64 * 1024 * 1024))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 102400))
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 8))
+# Хэши вычисляются в пуле из PASSWORD_HASHING_WORKERS потоков (0 — в потоке запроса),
+# ещё PASSWORD_HASHING_QUEUE вычислений ждут очереди, остальные запросы сразу получают 503.
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASHING_QUEUE = int(os.getenv('PASSWORD_HASHING_QUEUE', 4 * PASSWORD_HASHING_WORKERS))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
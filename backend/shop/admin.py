@@ -9,5 +9,10 @@ admin.site.register(ProductInfo)
 admin.site.register(Parameter)
 admin.site.register(ProductParameter)
 admin.site.register(Contact)
-admin.site.register(Order)
 admin.site.register(OrderItem)
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    # Order.__str__ выводит email покупателя: без select_related список заказов — запрос на каждую строку
+    list_select_related = ['user']
@@ -0,0 +1,21 @@
+from rest_framework.authentication import TokenAuthentication
+
+from shop.utils import token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кэшем «токен → пользователь» (см. shop.utils.token_cache):
+    LRU с TTL в памяти процесса и, при TOKEN_AUTH_SHARED_CACHE, общий кэш вторым уровнем.
+    Запрос к Token + User выполняется только при промахе.
+
+    Кэш сбрасывается во всех процессах при удалении токена и при любом сохранении
+    пользователя (в том числе смене is_active), см. shop.signals.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.put(key, token)
+        return token.user, token
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from shop.utils import hashing
+
+
+class PooledHasherMixin:
+    """
+    Вычисляет хэш в ограниченном пуле потоков shop.utils.hashing.
+    verify() алгоритмов PBKDF2 и scrypt вызывает encode(), поэтому тоже выполняется в пуле.
+    """
+
+    def encode(self, *args, **kwargs):
+        return hashing.run(super().encode, *args, **kwargs)
+
+
+class PBKDF2PasswordHasher(PooledHasherMixin, hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 с числом итераций PASSWORD_PBKDF2_ITERATIONS.
+    Хэши с другим числом итераций пересчитываются при следующем входе пользователя.
+    """
+
+    @property
+    def iterations(self) -> int:
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(PooledHasherMixin, hashers.ScryptPasswordHasher):
+    """
+    scrypt со стоимостью PASSWORD_SCRYPT_WORK_FACTOR (N), PASSWORD_SCRYPT_BLOCK_SIZE (r)
+    и PASSWORD_SCRYPT_PARALLELISM (p); каждое вычисление занимает около 128 * N * r байт памяти.
+    """
+
+    @property
+    def work_factor(self) -> int:
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self) -> int:
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self) -> int:
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self) -> int:
+        return settings.PASSWORD_SCRYPT_MAXMEM
+
+
+class Argon2PasswordHasher(PooledHasherMixin, hashers.Argon2PasswordHasher):
+    """
+    Argon2id (нужен пакет argon2-cffi) со стоимостью PASSWORD_ARGON2_TIME_COST,
+    PASSWORD_ARGON2_MEMORY_COST (КиБ) и PASSWORD_ARGON2_PARALLELISM.
+    """
+
+    @property
+    def time_cost(self) -> int:
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self) -> int:
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self) -> int:
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+    def verify(self, password, encoded):
+        # Argon2 проверяет пароль без encode()
+        return hashing.run(super().verify, password, encoded)
@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from shop.authentication import CachedTokenAuthentication
+from shop.models import User
+from shop.utils import token_cache
+from shop.utils.db import QueryCounter
+from shop.views.cart import CartView
+
+
+class Command(BaseCommand):
+    help = ('Измеряет накладные расходы аутентификации на запрос: TokenAuthentication против '
+            'CachedTokenAuthentication (кэш процесса и общий кэш), отдельно и в составе запроса cart/. '
+            'Созданные данные удаляются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов в каждом режиме')
+        parser.add_argument('--shared-cache', default='shared', help='Псевдоним общего кэша для режима shared')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(email='benchmark-auth@example.com', password=None)
+        key = Token.objects.get(user=user).key
+        factory = APIRequestFactory()
+        try:
+            modes = [
+                ('TokenAuthentication', TokenAuthentication, None, False),
+                ('cached, process LRU', CachedTokenAuthentication, None, False),
+                ('cached, shared tier only', CachedTokenAuthentication, options['shared_cache'], True),
+            ]
+            for name, authentication, shared, drop_local in modes:
+                with override_settings(TOKEN_AUTH_SHARED_CACHE=shared):
+                    token_cache.clear()
+                    auth = self.measure(options['requests'], drop_local, lambda: authentication().authenticate(
+                        factory.get('/api/cart/', HTTP_AUTHORIZATION=f'Token {key}')))
+                    view = CartView.as_view(authentication_classes=[authentication])
+                    request = self.measure(options['requests'] // 10, drop_local, lambda: view(
+                        factory.get('/api/cart/', HTTP_AUTHORIZATION=f'Token {key}')))
+                    stats = token_cache.stats()
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(f'  authenticate(): {auth[0] * 1e6:.1f} us, {auth[1]:.2f} queries')
+                self.stdout.write(f'  GET cart/:      {request[0] * 1e6:.1f} us, {request[1]:.2f} queries')
+                if authentication is CachedTokenAuthentication:
+                    self.stdout.write(f'  cache: {stats}')
+        finally:
+            user.delete()
+            token_cache.clear()
+
+    def measure(self, repeat: int, drop_local: bool, call) -> tuple[float, float]:
+        """
+        :return: Медиана времени вызова (сек) и среднее число запросов к базе
+        """
+        call()  # прогрев: первый вызов заполняет кэш
+        timings = []
+        with QueryCounter() as counter:
+            for _ in range(repeat):
+                if drop_local:
+                    token_cache.clear(reset_stats=False)
+                start = time.perf_counter()
+                call()
+                timings.append(time.perf_counter() - start)
+        return statistics.median(timings), counter.count / repeat
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import random
+import tempfile
+import tracemalloc
+from typing import IO, Iterator
+
+import yaml
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import User
+from shop.utils.feeds import open_feed, CSV_PARAMETER_PREFIX
+from shop.utils.importer import PriceListImporter
+
+
+def generate_categories(categories: int = 20) -> list[dict]:
+    return [{'id': 900000 + i, 'name': f'Категория {i}'} for i in range(categories)]
+
+
+def generate_goods(size: int, categories: int = 20, parameters: int = 8, seed: int = 0) -> Iterator[dict]:
+    """
+    Генерирует товары синтетического прайс-листа по одному.
+    """
+    rnd = random.Random(seed)
+    for i in range(size):
+        yield {
+            'id': i,
+            'category': 900000 + rnd.randrange(categories),
+            'model': f'model/{i}',
+            'name': f'Товар {i // 3}',
+            'price': rnd.randint(100, 100000),
+            'price_rrc': rnd.randint(100, 100000),
+            'quantity': rnd.randint(0, 50),
+            'parameters': {f'Параметр {p}': rnd.randint(1, 20) for p in range(parameters)},
+        }
+
+
+def generate_price_list(size: int, shop_name: str = 'Benchmark shop', categories: int = 20,
+                        parameters: int = 8, seed: int = 0) -> dict:
+    """
+    Генерирует синтетический прайс-лист заданного размера в формате PartnerUpdate.
+    """
+    return {
+        'shop': shop_name,
+        'categories': generate_categories(categories),
+        'goods': list(generate_goods(size, categories, parameters, seed)),
+    }
+
+
+def write_price_list(stream: IO, fmt: str, size: int, shop_name: str = 'Benchmark shop',
+                     categories: int = 20, parameters: int = 8) -> None:
+    """
+    Пишет синтетический прайс-лист в файл в формате yaml, jsonl или csv, не держа его в памяти.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    goods = generate_goods(size, categories, parameters)
+    if fmt == 'jsonl':
+        text.write(json.dumps({'shop': shop_name, 'categories': generate_categories(categories)},
+                              ensure_ascii=False) + '\n')
+        for item in goods:
+            text.write(json.dumps(item, ensure_ascii=False) + '\n')
+    elif fmt == 'csv':
+        columns = ['id', 'category', 'category_name', 'name', 'model', 'price', 'price_rrc', 'quantity']
+        columns += [f'{CSV_PARAMETER_PREFIX}Параметр {p}' for p in range(parameters)]
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        for item in goods:
+            writer.writerow([item['id'], item['category'], f'Категория {item["category"] - 900000}', item['name'],
+                             item['model'], item['price'], item['price_rrc'], item['quantity'],
+                             *item['parameters'].values()])
+    else:
+        text.write(yaml.safe_dump({'shop': shop_name, 'categories': generate_categories(categories)},
+                                  allow_unicode=True, sort_keys=False))
+        text.write('goods:\n')
+        for item in goods:
+            text.write(yaml.safe_dump([item], allow_unicode=True, sort_keys=False))
+    text.flush()
+    text.detach()
+
+
+def apply_churn(data: dict, churn: float, seed: int = 1) -> dict:
+    """
+    Меняет цену у доли `churn` товаров и убирает из файла столько же товаров.
+    """
+    rnd = random.Random(seed)
+    goods = [dict(item) for item in data['goods']]
+    count = int(len(goods) * churn)
+    for item in rnd.sample(goods, count):
+        item['price'] += 1
+    for item in rnd.sample(goods, count // 2):
+        goods.remove(item)
+    return {**data, 'goods': goods}
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость импорта прайс-листа (строк/сек и число запросов) на синтетических данных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--churn', type=float, default=0.01,
+                            help='Доля изменившихся товаров при повторном импорте в режиме diff')
+        parser.add_argument('--format', choices=['yaml', 'jsonl', 'csv'], default=None,
+                            help='Импортировать из файла в этом формате и замерить пиковую память')
+
+    def handle(self, *args, **options):
+        if options['format']:
+            return self.benchmark_file(options)
+
+        self.stdout.write(f'{"pass":>8} {"rows":>8} {"written":>8} {"queries":>8} {"seconds":>8} {"rows/sec":>10}')
+        for size in options['sizes']:
+            data = generate_price_list(size)
+            # Всё, что создаёт бенчмарк, откатывается
+            with transaction.atomic():
+                user = User.objects.create_user(email='benchmark-import@example.com', type='shop')
+                initial = PriceListImporter(user, batch_size=options['batch_size']).run(data)
+                repeat = PriceListImporter(user, batch_size=options['batch_size'])\
+                    .run(apply_churn(data, options['churn']))
+                transaction.set_rollback(True)
+
+            for name, stats in (('initial', initial), ('diff', repeat)):
+                written = stats.created + stats.updated + stats.retired
+                self.stdout.write(f'{name:>8} {stats.rows:>8} {written:>8} {stats.queries:>8} '
+                                  f'{stats.duration:>8.2f} {stats.rows_per_sec:>10.0f}')
+
+    def benchmark_file(self, options):
+        fmt = options['format']
+        self.stdout.write(f'{"format":>8} {"rows":>8} {"file MB":>8} {"peak MB":>8} {"seconds":>8} {"rows/sec":>10}')
+        for size in options['sizes']:
+            with tempfile.TemporaryFile() as stream:
+                write_price_list(stream, fmt, size)
+                file_size = stream.tell()
+                stream.seek(0)
+
+                with transaction.atomic():
+                    user = User.objects.create_user(email='benchmark-import@example.com', type='shop')
+                    tracemalloc.start()
+                    feed = open_feed(stream, fmt=fmt, shop='Benchmark shop')
+                    stats = PriceListImporter(user, batch_size=options['batch_size']).run_feed(feed)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    transaction.set_rollback(True)
+
+            self.stdout.write(f'{fmt:>8} {stats.rows:>8} {file_size / 2 ** 20:>8.1f} {peak / 2 ** 20:>8.1f} '
+                              f'{stats.duration:>8.2f} {stats.rows_per_sec:>10.0f}')
@@ -0,0 +1,131 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from shop.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem
+from shop.utils.db import chunked
+from shop.utils.pagination import keyset_filter
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает планы и время запросов каталога и корзины с составными индексами и без них '
+            'на синтетических данных. Все созданные данные и изменения схемы откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=1_000_000, help='Число предложений ProductInfo')
+        parser.add_argument('--shops', type=int, default=50)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=20, help='Сколько раз выполнять каждый запрос')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            queries = self.queries()
+
+            # SQL индексов берём у schema editor, не входя в его контекст:
+            # SQLite не разрешает открывать его внутри транзакции
+            editor = connection.SchemaEditorClass(connection)
+            indexes = [(model, index) for model in (ProductInfo, Order, OrderItem) for index in model._meta.indexes]
+            with connection.cursor() as cursor:
+                for model, index in indexes:
+                    cursor.execute(editor.sql_delete_index % {'name': editor.quote_name(index.name),
+                                                              'table': editor.quote_name(model._meta.db_table)})
+            before = self.measure(queries, options['repeat'])
+
+            with connection.cursor() as cursor:
+                for model, index in indexes:
+                    cursor.execute(str(index.create_sql(model, editor)))
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            after = self.measure(queries, options['repeat'])
+
+            transaction.set_rollback(True)
+
+        for name in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, results in (('without indexes', before), ('with indexes', after)):
+                median, plan = results[name]
+                self.stdout.write(f'  {label}: {median * 1000:.2f} ms')
+                for line in plan.splitlines():
+                    self.stdout.write(f'      {line}')
+
+    def seed(self, options) -> None:
+        self.stdout.write(f'Seeding {options["offers"]} offers and {options["orders"]} orders...')
+        rnd = random.Random(0)
+        shops = Shop.objects.bulk_create([Shop(name=f'Benchmark shop {i}') for i in range(options['shops'])])
+        category = Category.objects.create(name='Benchmark')
+        products = Product.objects.bulk_create([Product(name=f'Товар {i}', category=category) for i in range(1000)])
+
+        offers = (
+            ProductInfo(product=products[i % len(products)], shop=shops[i % len(shops)], external_id=i,
+                        quantity=rnd.randint(0, 100), price=rnd.randint(100, 100000), price_rrc=0)
+            for i in range(options['offers'])
+        )
+        for batch in chunked(offers, 5000):
+            ProductInfo.objects.bulk_create(batch)
+
+        users = User.objects.bulk_create([User(email=f'benchmark-{i}@example.com') for i in range(options['users'])])
+        states = ['new', 'confirmed', 'assembled', 'sent', 'delivered', 'canceled']
+        now = timezone.now()
+        orders = (
+            Order(user=users[i % len(users)], state='basket') if i < len(users) else
+            Order(user=users[i % len(users)], state=rnd.choice(states), confirmed_at=now - timedelta(minutes=i))
+            for i in range(options['orders'])
+        )
+        for batch in chunked(orders, 5000):
+            # Позиция оформленного заказа со снимком магазина — для ленты заказов поставщика
+            items = [OrderItem(order=order, shop=shops[order.pk % len(shops)], quantity=1, price=100)
+                     for order in Order.objects.bulk_create(batch) if order.state != 'basket']
+            OrderItem.objects.bulk_create(items)
+
+        self.shop_id = shops[len(shops) // 2].pk
+        self.user_id = users[len(users) // 2].pk
+        middle = ProductInfo.objects.order_by('price', 'id').values_list('price', 'id')[options['offers'] // 2]
+        self.keyset = middle
+        self.deep_offset = options['offers'] // 2
+        self.feed_cursor = Order.objects.order_by('updated_at', 'id').values_list('updated_at', 'id')\
+            [options['orders'] * 9 // 10]
+
+    def queries(self) -> dict:
+        offers = ProductInfo.objects.filter(is_active=True)
+        history = Order.objects.filter(user_id=self.user_id).exclude(state='basket')
+        price, pk = self.keyset
+        shop_items = OrderItem.objects.filter(shop_id=self.shop_id)
+        feed = Order.objects.filter(Exists(shop_items.filter(order_id=OuterRef('pk'))))
+        return {
+            'products?shop=X&ordering=price': offers.filter(shop_id=self.shop_id).order_by('price')[:20],
+            'products?shop=X&price_min&price_max': offers.filter(shop_id=self.shop_id, price__gte=1000,
+                                                                 price__lte=2000)[:20],
+            f'products?ordering=price&offset={self.deep_offset}': offers.order_by('price', 'id')
+            [self.deep_offset:self.deep_offset + 20],
+            'products?ordering=price&cursor=<middle>': keyset_filter(offers, 'price', price, pk)[:20],
+            'products?ordering=-quantity&limit=20': offers.order_by('-quantity', '-id')[:20],
+            'cart: Order(user, state=basket)': Order.objects.filter(user_id=self.user_id, state='basket'),
+            'order/?cursor=&limit=20': keyset_filter(history, '-confirmed_at')[:20],
+            'order/?cursor=&limit=20&state=delivered': keyset_filter(history.filter(state='delivered'),
+                                                                     '-confirmed_at')[:20],
+            'partner/orders/?cursor=<recent>': keyset_filter(feed, 'updated_at', *self.feed_cursor)[:50],
+            'partner/revenue/': shop_items.exclude(order__state='canceled')
+            .annotate(day=TruncDate('order__confirmed_at')).values('day').order_by('day')
+            .annotate(revenue=Sum(F('price') * F('quantity'))),
+        }
+
+    def measure(self, queries: dict, repeat: int) -> dict:
+        results = {}
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - start)
+            results[name] = (statistics.median(timings), queryset.explain())
+        return results
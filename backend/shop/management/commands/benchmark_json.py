@@ -0,0 +1,81 @@
+import io
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from shop.management.commands.benchmark_serializers import Command as SerializerBenchmark
+from shop.models import Order, ProductInfo
+from shop.serializers import FastProductInfoSerializer, FastCartSerializer, FastOrderSerializer
+from shop.utils import fastjson
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время и память кодирования/разбора JSON стандартным рендерером DRF '
+            'и доступными быстрыми кодировщиками на ответах каталога, корзины и истории заказов. '
+            'Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--catalog', type=int, default=10_000, help='Товаров в «большом списке» (поток)')
+        parser.add_argument('--orders', type=int, default=50)
+        parser.add_argument('--items', type=int, default=5)
+        parser.add_argument('--cart-items', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user, _ = SerializerBenchmark().seed({
+                'page_size': options['catalog'], 'parameters': 5, 'orders': options['orders'],
+                'items': options['items'], 'cart_items': options['cart_items'],
+            })
+            catalog = FastProductInfoSerializer(ProductInfo.objects.order_by('id'), many=True).data
+            payloads = {
+                f'products page ({options["page_size"]})': catalog[:options['page_size']],
+                f'order history ({options["orders"]} x {options["items"]})':
+                    FastOrderSerializer(Order.objects.filter(user=user).exclude(state='basket'), many=True).data,
+                f'cart ({options["cart_items"]} items)':
+                    FastCartSerializer(Order.objects.filter(user=user, state='basket')).data,
+                f'catalog ({len(catalog)})': catalog,
+            }
+            transaction.set_rollback(True)
+
+        drf_renderer, drf_parser = JSONRenderer(), JSONParser()
+        backends = {name: fastjson.get_backend(name) for name in fastjson.available_backends()}
+        self.stdout.write(f'Available backends: {", ".join(backends)}')
+
+        for name, data in payloads.items():
+            expected = drf_renderer.render(data)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {len(expected) / 1024:.0f} KiB'))
+            self.report('DRF JSONRenderer', lambda: drf_renderer.render(data), options['repeat'])
+            for backend_name, backend in backends.items():
+                if fastjson.dumps(data, backend) != expected:
+                    raise CommandError(f'{backend_name}: output differs from JSONRenderer for {name}')
+                self.report(f'{backend_name} encode', lambda: fastjson.dumps(data, backend), options['repeat'])
+
+            self.report('DRF JSONParser', lambda: drf_parser.parse(io.BytesIO(expected)), options['repeat'])
+            for backend_name, backend in backends.items():
+                self.report(f'{backend_name} parse', lambda: fastjson.loads(expected, backend), options['repeat'])
+
+        # Потоковая отдача большого списка: в памяти одна пачка вместо всего ответа
+        self.stdout.write(self.style.MIGRATE_HEADING(f'streamed catalog ({len(catalog)})'))
+        self.report('whole body', lambda: fastjson.dumps(catalog), options['repeat'])
+        self.report('iter_array', lambda: sum(len(chunk) for chunk in fastjson.iter_array(catalog)),
+                    options['repeat'])
+
+    def report(self, label: str, func, repeat: int) -> None:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f'  {label:<18} {statistics.median(timings) * 1000:8.2f} ms   peak {peak / 1024:8.0f} KiB')
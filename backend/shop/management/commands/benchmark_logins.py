@@ -0,0 +1,106 @@
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from shop.models import User
+from shop.views.registration import LoginView
+
+PASSWORD = 'benchmark-Password-1'
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест входа (POST user/login/): логинов в секунду всего и на ядро, задержки, '
+            'число отказов 503 и пересчитанных хэшей. С --legacy-hasher пароли пользователей сначала '
+            'хэшируются прежним алгоритмом, чтобы измерить переход на новую политику. Созданные данные удаляются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Всего попыток входа')
+        parser.add_argument('--users', type=int, default=20, help='Число пользователей')
+        parser.add_argument('--clients', type=int, default=8, help='Параллельных клиентов (потоков)')
+        parser.add_argument('--hasher', help='Алгоритм политики (pbkdf2, scrypt, argon2); по умолчанию PASSWORD_HASHER')
+        parser.add_argument('--legacy-hasher', help='Алгоритм, которым хэшируются пароли перед тестом')
+        parser.add_argument('--workers', type=int, help='Размер пула хэширования (PASSWORD_HASHING_WORKERS)')
+
+    def handle(self, *args, **options):
+        hasher = options['hasher'] or settings.PASSWORD_HASHER
+        legacy = options['legacy_hasher'] or hasher
+        workers = settings.PASSWORD_HASHING_WORKERS if options['workers'] is None else options['workers']
+        try:
+            current, seeded = self.hashers(hasher), self.hashers(legacy)
+        except KeyError as exc:
+            raise CommandError(f'Unknown hasher: {exc}')
+
+        with override_settings(PASSWORD_HASHERS=seeded):
+            # Один хэш на всех: тест измеряет вход, а не подготовку данных
+            encoded = make_password(PASSWORD)
+        users = User.objects.bulk_create(User(email=f'benchmark-login-{number}@example.com', password=encoded,
+                                              is_active=True) for number in range(options['users']))
+        Token.objects.bulk_create(Token(user=user, key=Token.generate_key()) for user in users)
+        try:
+            with override_settings(PASSWORD_HASHERS=current, PASSWORD_HASHING_WORKERS=workers):
+                elapsed, timings, codes = self.run(users, options['logins'], options['clients'])
+            rehashed = User.objects.filter(pk__in=[user.pk for user in users]).exclude(password=encoded).count()
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        cores = min(workers, os.cpu_count() or 1) if workers > 0 else min(options['clients'], os.cpu_count() or 1)
+        ok = codes.get(200, 0)
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{legacy} -> {hasher}, pool workers: {workers}, '
+                                                     f'clients: {options["clients"]}, cores used: {cores}'))
+        self.stdout.write(f'  successful logins: {ok}/{options["logins"]}, responses: {dict(sorted(codes.items()))}')
+        self.stdout.write(f'  throughput: {ok / elapsed:.1f} logins/s, {ok / elapsed / cores:.1f} logins/s per core')
+        self.stdout.write(f'  latency: p50 {statistics.median(timings) * 1000:.1f} ms, '
+                          f'p95 {statistics.quantiles(timings, n=20)[-1] * 1000:.1f} ms')
+        self.stdout.write(f'  rehashed passwords: {rehashed}/{len(users)}')
+
+    @staticmethod
+    def hashers(name: str) -> list[str]:
+        """
+        PASSWORD_HASHERS, в котором новые хэши создаёт алгоритм name, а остальные алгоритмы остаются в прежнем порядке.
+
+        :raises KeyError: если алгоритм неизвестен
+        """
+        first = settings.PASSWORD_HASHER_CLASSES[name]
+        return [first] + [path for path in settings.PASSWORD_HASHERS if path != first]
+
+    def run(self, users: list[User], logins: int, clients: int) -> tuple[float, list[float], dict[int, int]]:
+        """
+        Выполняет logins входов из clients потоков, пользователи берутся по кругу.
+
+        :return: Общее время (сек), задержки отдельных входов и число ответов по кодам
+        """
+        factory = APIRequestFactory()
+        view = LoginView.as_view()
+
+        def client(numbers: range) -> list[tuple[float, int]]:
+            results = []
+            try:
+                for number in numbers:
+                    request = factory.post('/api/user/login/', {'email': users[number % len(users)].email,
+                                                                'password': PASSWORD}, format='json')
+                    start = time.perf_counter()
+                    response = view(request)
+                    results.append((time.perf_counter() - start, response.status_code))
+            finally:
+                connections.close_all()
+            return results
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            batches = list(pool.map(client, [range(number, logins, clients) for number in range(clients)]))
+        elapsed = time.perf_counter() - start
+        timings, codes = [], {}
+        for batch in batches:
+            for timing, code in batch:
+                timings.append(timing)
+                codes[code] = codes.get(code, 0) + 1
+        return elapsed, timings, codes
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+
+from shop.models import User, Shop, Category, Product, ProductInfo, Contact, Order, OrderItem
+from shop.utils import inventory
+
+
+class Command(BaseCommand):
+    help = ('Подтверждает много корзин с одним «горячим» товаром из параллельных потоков: '
+            'измеряет пропускную способность и проверяет, что товар не продан сверх остатка. '
+            'Созданные данные удаляются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=400, help='Число подтверждаемых корзин')
+        parser.add_argument('--stock', type=int, default=250, help='Остаток горячего товара')
+        parser.add_argument('--lines', type=int, default=5,
+                            help='Дополнительных позиций в каждой корзине (в случайном порядке)')
+
+    def handle(self, *args, **options):
+        hot, others, baskets = self.seed(options)
+        try:
+            outcomes, elapsed = self.confirm_all(baskets, options['threads'])
+            stock = ProductInfo.objects.get(pk=hot).quantity
+            confirmed = Order.objects.filter(pk__in=[pk for pk, _, _ in baskets], state='confirmed').count()
+            remaining = dict(ProductInfo.objects.filter(pk__in=others).values_list('id', 'quantity'))
+        finally:
+            self.cleanup(hot)
+
+        self.stdout.write(f'{len(baskets)} confirmations from {options["threads"]} threads in {elapsed:.2f} s '
+                          f'({len(baskets) / elapsed:.0f} confirmations/sec)')
+        self.stdout.write(', '.join(f'{name}: {count}' for name, count in sorted(outcomes.items())))
+        self.stdout.write(f'hot SKU stock: {options["stock"]} -> {stock}, confirmed orders: {confirmed}')
+
+        sold = options['stock'] - stock
+        expected = min(options['stock'], len(baskets))
+        if outcomes['error'] or sold != confirmed or confirmed != expected or outcomes['confirmed'] != confirmed:
+            raise CommandError('Stock does not match confirmed orders')
+        if any(quantity != options['orders'] - confirmed for quantity in remaining.values()):
+            raise CommandError('Stock of other lines does not match confirmed orders')
+        self.stdout.write(self.style.SUCCESS('No oversell: sold units match confirmed orders'))
+
+    def confirm_all(self, baskets: list[tuple[int, User, Contact]], threads: int) -> tuple[Counter, float]:
+        outcomes = Counter()
+        lock = threading.Lock()
+        queue = iter(baskets)
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            local = Counter()
+            try:
+                barrier.wait()
+                while True:
+                    with lock:
+                        basket = next(queue, None)
+                    if basket is None:
+                        break
+                    try:
+                        local['confirmed' if inventory.confirm_order(*basket) else 'not found'] += 1
+                    except inventory.OutOfStock:
+                        local['out of stock'] += 1
+                    except OperationalError:
+                        local['error'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    outcomes.update(local)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return outcomes, time.perf_counter() - start
+
+    def seed(self, options) -> tuple[int, list[int], list[tuple[int, User, Contact]]]:
+        rnd = random.Random(0)
+        shop = Shop.objects.create(name='Benchmark reservations shop')
+        category = Category.objects.create(name='Benchmark reservations')
+        products = Product.objects.bulk_create([Product(name=f'Товар {i}', category=category)
+                                                for i in range(options['lines'] + 1)])
+        infos = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, external_id=i, price=100, price_rrc=100,
+                        quantity=options['stock'] if i == 0 else options['orders'])
+            for i, product in enumerate(products)
+        ])
+        hot, others = infos[0].pk, [info.pk for info in infos[1:]]
+
+        users = User.objects.bulk_create([User(email=f'benchmark-reservations-{i}@example.com')
+                                          for i in range(options['orders'])])
+        contacts = Contact.objects.bulk_create([Contact(user=user, city='Москва', street='Тверская', phone='1')
+                                                for user in users])
+        orders = Order.objects.bulk_create([Order(user=user, state='basket') for user in users])
+        items = []
+        for order in orders:
+            # Позиции создаются в случайном порядке: блокировки всё равно берутся по возрастанию id
+            for pk in rnd.sample([hot, *others], len(others) + 1):
+                items.append(OrderItem(order=order, product_info_id=pk, quantity=1))
+        OrderItem.objects.bulk_create(items)
+        return hot, others, [(order.pk, user, contact) for order, user, contact in zip(orders, users, contacts)]
+
+    def cleanup(self, hot: int) -> None:
+        info = ProductInfo.objects.select_related('shop', 'product__category').get(pk=hot)
+        User.objects.filter(email__startswith='benchmark-reservations-').delete()
+        info.shop.delete()
+        info.product.category.delete()
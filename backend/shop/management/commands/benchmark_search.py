@@ -0,0 +1,73 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import Shop, Category, Product, ProductInfo, ProductParameter, Parameter
+from shop.utils import search
+from shop.utils.db import chunked
+
+BRANDS = ['Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Sony', 'LG', 'Lenovo', 'Asus']
+KINDS = ['Смартфон', 'Планшет', 'Ноутбук', 'Телевизор', 'Наушники', 'Чехол', 'Ёлочная гирлянда', 'Зарядка']
+COLORS = ['черный', 'белый', 'серебристый', 'золотой', 'синий']
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время поиска товаров по прежнему фильтру `product__name__icontains` '
+            'и по полнотекстовому индексу на синтетических данных. Все данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=200_000, help='Число предложений ProductInfo')
+        parser.add_argument('--products', type=int, default=20_000, help='Число различных товаров')
+        parser.add_argument('--repeat', type=int, default=20, help='Сколько раз выполнять каждый запрос')
+        parser.add_argument('--queries', nargs='+', default=['apple', 'смартфон samsung', 'елочн', 'черн', 'xyz'])
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            offers = ProductInfo.objects.filter(is_active=True)
+            for query in options['queries']:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'name={query}'))
+                variants = (
+                    ('icontains', offers.filter(product__name__icontains=query)),
+                    ('search', search.search(offers, query)),
+                    ('search, ranked', search.search(offers, query, ranked=True)),
+                )
+                for label, queryset in variants:
+                    median, count = self.measure(queryset, options['repeat'])
+                    self.stdout.write(f'  {label:<15} {median * 1000:8.2f} ms  (first page of {count} matches)')
+            transaction.set_rollback(True)
+
+    def seed(self, options) -> None:
+        self.stdout.write(f'Seeding {options["offers"]} offers...')
+        rnd = random.Random(0)
+        shop = Shop.objects.create(name='Benchmark shop')
+        category = Category.objects.create(name='Benchmark')
+        products = Product.objects.bulk_create([
+            Product(name=f'{rnd.choice(KINDS)} {rnd.choice(BRANDS)} {i}', category=category)
+            for i in range(options['products'])
+        ])
+        color = Parameter.objects.create(name='Цвет')
+
+        offers = (
+            ProductInfo(product=products[i % len(products)], shop=shop, external_id=i, model=f'M-{i}',
+                        quantity=1, price=rnd.randint(100, 100000), price_rrc=0)
+            for i in range(options['offers'])
+        )
+        for batch in chunked(offers, 5000):
+            created = ProductInfo.objects.bulk_create(batch)
+            ProductParameter.objects.bulk_create([
+                ProductParameter(product_info=info, parameter=color, value=rnd.choice(COLORS)) for info in created
+            ])
+            search.reindex(info.pk for info in created)
+
+    def measure(self, queryset, repeat: int) -> tuple[float, int]:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = queryset.count()
+            list(queryset[:20])
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings), count
@@ -0,0 +1,97 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from shop.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem
+from shop.serializers import (ProductInfoSerializer, CartSerializer, OrderSerializer,
+                              FastProductInfoSerializer, FastCartSerializer, FastOrderSerializer)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает DRF-сериализаторы каталога, корзины и заказов с их быстрыми аналогами '
+            '(время с учётом запросов) и проверяет, что JSON совпадает байт в байт. Данные откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Товаров на странице каталога')
+        parser.add_argument('--parameters', type=int, default=5, help='Параметров у каждого товара')
+        parser.add_argument('--orders', type=int, default=20, help='Заказов в истории пользователя')
+        parser.add_argument('--items', type=int, default=5, help='Позиций в каждом заказе')
+        parser.add_argument('--cart-items', type=int, default=100, help='Позиций в корзине')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        with transaction.atomic():
+            user, infos = self.seed(options)
+            products = ProductInfo.objects.filter(pk__in=infos).order_by('price')
+            orders = Order.objects.filter(user=user).exclude(state='basket')
+            cart = Order.objects.get(user=user, state='basket')
+            cases = {
+                f'products (page of {options["page_size"]})': (
+                    lambda: ProductInfoSerializer(products.select_related('product', 'shop')
+                                                  .prefetch_related('product_parameters__parameter'), many=True).data,
+                    lambda: FastProductInfoSerializer(products, many=True).data,
+                ),
+                f'orders ({options["orders"]} x {options["items"]} items)': (
+                    lambda: OrderSerializer(orders.prefetch_related('ordered_items'), many=True).data,
+                    lambda: FastOrderSerializer(orders, many=True).data,
+                ),
+                f'cart ({options["cart_items"]} items)': (
+                    lambda: CartSerializer(Order.objects.get(pk=cart.pk)).data,
+                    lambda: FastCartSerializer(Order.objects.filter(pk=cart.pk)).data,
+                ),
+            }
+            for name, (slow, fast) in cases.items():
+                if renderer.render(slow()) != renderer.render(fast()):
+                    raise CommandError(f'{name}: fast serializer output differs from DRF')
+                slow_time = self.measure(slow, renderer, options['repeat'])
+                fast_time = self.measure(fast, renderer, options['repeat'])
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(f'  DRF:  {slow_time * 1000:8.2f} ms')
+                self.stdout.write(f'  fast: {fast_time * 1000:8.2f} ms  (x{slow_time / fast_time:.1f}, identical JSON)')
+            transaction.set_rollback(True)
+
+    def seed(self, options) -> tuple[User, list[int]]:
+        rnd = random.Random(0)
+        user = User.objects.create(email='benchmark-serializers@example.com')
+        shop = Shop.objects.create(name='Benchmark shop')
+        category = Category.objects.create(name='Benchmark')
+        parameters = Parameter.objects.bulk_create([Parameter(name=f'Параметр {i}') for i in range(options['parameters'])])
+
+        count = max(options['page_size'], options['cart_items'], options['items'])
+        products = Product.objects.bulk_create([Product(name=f'Товар {i}', category=category) for i in range(count)])
+        infos = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, external_id=i, model=f'M-{i}', quantity=10,
+                        price=rnd.randint(100, 100000), price_rrc=0)
+            for i, product in enumerate(products)
+        ])
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info=info, parameter=parameter, value=str(rnd.randint(1, 100)))
+            for info in infos for parameter in parameters
+        ])
+
+        orders = Order.objects.bulk_create([Order(user=user, state='new') for _ in range(options['orders'])])
+        cart = Order.objects.create(user=user, state='basket')
+        items = [
+            OrderItem(order=order, product_info=info, quantity=rnd.randint(1, 5), price=info.price,
+                      product_name=f'Товар {info.external_id}', shop_name=shop.name)
+            for order in orders for info in rnd.sample(infos, options['items'])
+        ]
+        OrderItem.objects.bulk_create(items + [OrderItem(order=cart, product_info=info, quantity=1)
+                                               for info in infos[:options['cart_items']]])
+        for order in orders:
+            order.total = sum(item.price * item.quantity for item in items if item.order is order)
+        Order.objects.bulk_update(orders, ['total'])
+        return user, [info.pk for info in infos[:options['page_size']]]
+
+    def measure(self, serialize, renderer, repeat: int) -> float:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            renderer.render(serialize())
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
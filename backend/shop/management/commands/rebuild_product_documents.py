@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import ProductInfo
+from shop.utils import documents
+from shop.utils.db import chunked
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает готовые JSON-документы всех предложений (например, после изменения сериализатора).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--missing', action='store_true', help='Собрать только отсутствующие документы')
+
+    def handle(self, *args, **options):
+        ids = ProductInfo.objects.order_by('id')
+        if options['missing']:
+            ids = ids.filter(document__isnull=True)
+        written = 0
+        with transaction.atomic():
+            for batch in chunked(ids.values_list('id', flat=True).iterator(chunk_size=options['batch_size']),
+                                 options['batch_size']):
+                written += documents.rebuild(batch)
+        self.stdout.write(self.style.SUCCESS(f'Product documents rebuilt: {written}'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from shop.models import ProductInfo, ProductSearchDocument
+from shop.utils import search
+from shop.utils.db import chunked
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковые документы всех предложений и оптимизирует полнотекстовый индекс.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        written = 0
+        ids = ProductInfo.objects.order_by('id').values_list('id', flat=True)
+        with transaction.atomic():
+            # Документы удалённых предложений удаляются каскадно, но на всякий случай чистим «сирот»
+            ProductSearchDocument.objects.filter(product_info__isnull=True).delete()
+            for batch in chunked(ids.iterator(chunk_size=options['batch_size']), options['batch_size']):
+                written += search.reindex(batch)
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('rebuild')")
+                cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('optimize')")
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {written} documents written'))
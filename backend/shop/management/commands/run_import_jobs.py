@@ -0,0 +1,52 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shop.utils.jobs import claim_next_job, run_import_job
+
+
+def worker_loop(poll_interval: float, once: bool) -> None:
+    """
+    Цикл одного воркера: забирает задания из очереди и выполняет их.
+    """
+    while True:
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_import_job(job)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задания импорта прайс-листов из очереди ImportJob.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов-воркеров')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Пауза (сек) между проверками пустой очереди')
+        parser.add_argument('--once', action='store_true', help='Выполнить все задания из очереди и выйти')
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            worker_loop(options['poll_interval'], options['once'])
+            return
+
+        # Соединения с базой не должны наследоваться дочерними процессами
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=worker_loop, args=(options['poll_interval'], options['once']), daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {len(processes)} import workers')
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
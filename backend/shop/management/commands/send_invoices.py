@@ -0,0 +1,107 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from shop.models import Order, User
+from shop.utils import invoices
+from shop.utils.outbox import enqueue
+
+# Заказы в этих состояниях накладных не получают, но отмечаются как обработанные
+SKIPPED_STATES = ('canceled',)
+
+
+class Command(BaseCommand):
+    help = ('Рассылает накладные по новым оформленным заказам: администраторам (is_staff), покупателям '
+            'и поставщикам. Накладные отрисовываются пулом процессов и кэшируются на диске по версии заказа; '
+            'письма уходят через очередь send_outbox. Файлы старше 30 дней удаляются. '
+            'Запускайте периодически (cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Число процессов отрисовки')
+        parser.add_argument('--chunk', type=int, default=100, help='Заказов в одном задании пула (один запрос)')
+        parser.add_argument('--digest', action='store_true',
+                            help='Вместо письма на каждый заказ отправить администраторам и поставщикам '
+                                 'по одной сводке за все новые заказы')
+
+    def handle(self, *args, **options):
+        invoices.prune()
+        # Частичный индекс order_invoice_pending_idx: читаются только ещё не разосланные заказы
+        pending = list(Order.objects.filter(invoiced_at__isnull=True).exclude(state='basket').order_by('id')
+                       .values_list('id', 'state'))
+        skipped = [pk for pk, state in pending if state in SKIPPED_STATES]
+        order_ids = [pk for pk, state in pending if state not in SKIPPED_STATES]
+        if skipped:
+            Order.objects.filter(pk__in=skipped, invoiced_at__isnull=True).update(invoiced_at=timezone.now())
+        if not order_ids:
+            self.stdout.write('No new orders')
+            return
+
+        admins = list(User.objects.filter(is_staff=True, is_active=True).exclude(email='')
+                      .values_list('email', flat=True))
+        chunks = [order_ids[start:start + options['chunk']] for start in range(0, len(order_ids), options['chunk'])]
+        claimed = []
+        for rendered in self.render(chunks, options['workers']):
+            claimed += self.send_orders(rendered, admins, per_order=not options['digest'])
+        if options['digest'] and claimed:
+            self.send_digests(claimed, admins)
+        self.stdout.write(f'Invoices for {len(claimed)} orders queued')
+
+    def render(self, chunks: list[list[int]], workers: int):
+        """
+        Отрисовывает накладные пачками заказов: в пуле процессов или, при одном воркере, в текущем.
+        """
+        if workers <= 1:
+            yield from map(invoices.render_orders, chunks)
+            return
+        # Соединения с базой не должны наследоваться дочерними процессами
+        connections.close_all()
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            yield from pool.map(invoices.render_orders, chunks)
+
+    def send_orders(self, rendered: list[dict], admins: list[str], per_order: bool) -> list[int]:
+        """
+        Ставит письма с накладными в очередь. Каждый заказ сначала отмечается условным
+        UPDATE: параллельный запуск команды не разошлёт накладные повторно.
+
+        :param per_order: Отправить администраторам и поставщикам письмо по каждому заказу
+            (иначе — только покупателям, остальным уйдёт сводка)
+        :return: id заказов, отмеченных этим запуском
+        """
+        now = timezone.now()
+        claimed = []
+        with transaction.atomic():
+            for order in rendered:
+                if not Order.objects.filter(pk=order['order'], invoiced_at__isnull=True).update(invoiced_at=now):
+                    continue
+                claimed.append(order['order'])
+                subject = f'Накладная по заказу №{order["order"]}'
+                enqueue(subject, 'Накладная по вашему заказу во вложении.', [order['email']],
+                        attachments=[order['files']['html']])
+                if not per_order:
+                    continue
+                if admins:
+                    enqueue(subject, f'Оформлен заказ №{order["order"]}, накладная во вложении.', admins,
+                            attachments=[order['files']['html'], order['files']['csv']])
+                for shop in order['shops']:
+                    if shop['email']:
+                        enqueue(subject, 'Накладная на товары вашего магазина во вложении.', [shop['email']],
+                                attachments=[shop['files']['html'], shop['files']['csv']])
+        return claimed
+
+    def send_digests(self, order_ids: list[int], admins: list[str]) -> None:
+        """
+        Сводки по заказам этого запуска: одна администраторам и по одной каждому поставщику.
+        """
+        name = timezone.now().strftime('%Y%m%d-%H%M%S')
+        digest, shops = invoices.render_digests(order_ids, name)
+        subject = f'Сводка заказов ({len(order_ids)}) на {timezone.localdate():%d.%m.%Y}'
+        with transaction.atomic():
+            if admins:
+                enqueue(subject, 'Сводная накладная по новым заказам во вложении.', admins, attachments=[digest])
+            for email, path in shops.values():
+                if email:
+                    enqueue(subject, 'Сводная накладная по заказам товаров вашего магазина во вложении.', [email],
+                            attachments=[path])
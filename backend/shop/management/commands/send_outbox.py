@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.utils.outbox import BATCH_SIZE, send_pending
+
+
+class Command(BaseCommand):
+    help = ('Отправляет письма из очереди OutboxEmail пачками через одно SMTP-соединение; '
+            'неотправленные повторяются с экспоненциальной задержкой.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Сколько писем отправлять через одно соединение')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Пауза (сек) между проверками пустой очереди')
+        parser.add_argument('--once', action='store_true', help='Отправить готовые письма и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_pending(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} not sent')
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
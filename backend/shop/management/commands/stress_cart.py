@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, IntegrityError, OperationalError
+
+from shop.models import User, Shop, Category, Product, ProductInfo, Order, OrderItem
+from shop.utils import cart
+
+
+def legacy_add(user, product_info_id: int, quantity: int) -> None:
+    """
+    Прежняя логика CartAddView: get_or_create корзины и чтение-изменение-запись позиции.
+    """
+    product_info = ProductInfo.objects.get(id=product_info_id, is_active=True)
+    basket, _ = Order.objects.get_or_create(user=user, state='basket')
+    try:
+        item = OrderItem.objects.get(order=basket, product_info=product_info)
+        item.quantity += quantity
+        item.save()
+    except OrderItem.DoesNotExist:
+        OrderItem.objects.create(order=basket, product_info=product_info, quantity=quantity)
+
+
+class Command(BaseCommand):
+    help = ('Нагружает одну корзину добавлениями из многих потоков и проверяет, '
+            'что итоговые количества совпадают с суммой добавлений. Созданные данные удаляются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--adds', type=int, default=200, help='Добавлений в каждом потоке')
+        parser.add_argument('--products', type=int, default=5, help='Разных товаров в корзине')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Прогнать прежнюю логику get/modify/save для сравнения')
+
+    def handle(self, *args, **options):
+        user, infos = self.seed(options['products'])
+        try:
+            expected, errors, elapsed = self.hammer(user, infos, options)
+            actual = Counter(dict(OrderItem.objects.filter(order__user=user, order__state='basket')
+                                  .values_list('product_info_id', 'quantity')))
+            baskets = Order.objects.filter(user=user, state='basket').count()
+        finally:
+            self.cleanup(user, infos)
+
+        total = options['threads'] * options['adds']
+        self.stdout.write(f'{total} adds from {options["threads"]} threads in {elapsed:.2f} s '
+                          f'({total / elapsed:.0f} adds/sec)')
+        lost = sum((expected - actual).values())
+        self.stdout.write(f'baskets: {baskets}, errors: {len(errors)}, lost increments: {lost}')
+        for error in errors[:5]:
+            self.stdout.write(f'  {error}')
+
+        if baskets != 1 or errors or actual != expected:
+            raise CommandError('Cart quantities do not match the adds')
+        self.stdout.write(self.style.SUCCESS('Cart quantities match'))
+
+    def hammer(self, user, infos: list[int], options) -> tuple[Counter, list[str], float]:
+        expected = Counter()
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker(seed: int):
+            rnd = random.Random(seed)
+            added = Counter()
+            try:
+                barrier.wait()
+                for _ in range(options['adds']):
+                    product_info_id, quantity = rnd.choice(infos), rnd.randint(1, 3)
+                    try:
+                        if options['legacy']:
+                            legacy_add(user, product_info_id, quantity)
+                        else:
+                            cart.add_item(cart.get_basket_id(user), product_info_id, quantity)
+                        added[product_info_id] += quantity
+                    except (IntegrityError, OperationalError, Order.MultipleObjectsReturned) as e:
+                        with lock:
+                            errors.append(f'{type(e).__name__}: {e}')
+            finally:
+                connection.close()
+                with lock:
+                    expected.update(added)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return expected, errors, time.perf_counter() - start
+
+    def seed(self, products: int) -> tuple[User, list[int]]:
+        user = User.objects.create(email='stress-cart@example.com')
+        shop = Shop.objects.create(name='Stress cart shop')
+        category = Category.objects.create(name='Stress cart')
+        items = Product.objects.bulk_create([Product(name=f'Товар {i}', category=category) for i in range(products)])
+        infos = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, external_id=i, quantity=1000, price=100, price_rrc=100)
+            for i, product in enumerate(items)
+        ])
+        return user, [info.pk for info in infos]
+
+    def cleanup(self, user, infos: list[int]) -> None:
+        info = ProductInfo.objects.select_related('shop', 'product__category').get(pk=infos[0])
+        user.delete()
+        info.shop.delete()
+        info.product.category.delete()
@@ -0,0 +1,64 @@
+import logging
+import time
+
+from django.conf import settings
+
+from shop.utils import metrics
+from shop.utils.db import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+
+def query_budget(request) -> int | None:
+    """
+    Бюджет SQL-запросов представления: атрибут query_budget класса — число,
+    словарь {метод: число} или функция от запроса; None — бюджет не задан.
+    """
+    match = request.resolver_match
+    view_class = getattr(match.func, 'view_class', None) if match else None
+    budget = getattr(view_class, 'query_budget', None)
+    if callable(budget):
+        return budget(request)
+    if isinstance(budget, dict):
+        return budget.get(request.method)
+    return budget
+
+
+class RequestMetricsMiddleware:
+    """
+    Считает для каждого запроса SQL-запросы, время в базе, время сериализации ответа
+    (см. FastJSONRenderer) и полное время обработки, и накапливает их по эндпоинтам
+    (shop.utils.metrics, отдаются на metrics/).
+
+    При REQUEST_METRICS_HEADERS метрики добавляются в ответ заголовками X-Query-Count
+    и Server-Timing. Превышение query_budget представления пишется в лог, а при
+    QUERY_BUDGET_STRICT (в тестах, см. shop.utils.testing) — прерывает запрос ошибкой.
+    Тело потоковых ответов (выгрузка каталога) отдаётся после замера и в него не входит.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with metrics.collect() as current, QueryCounter() as counter:
+            response = self.get_response(request)
+        current.queries = counter.count
+        current.db_time = counter.duration
+        current.total = time.perf_counter() - start
+        current.budget = query_budget(request)
+
+        match = request.resolver_match
+        metrics.record(metrics.endpoint_key(request.method, match.route if match else None), current,
+                       response.status_code)
+        # Для тестов: метрики доступны у ответа тестового клиента
+        response.metrics = current
+        if settings.REQUEST_METRICS_HEADERS:
+            response['X-Query-Count'] = str(current.queries)
+            response['Server-Timing'] = current.server_timing()
+        if current.over_budget:
+            message = f'{request.method} {request.path}: {current.queries} queries, budget {current.budget}'
+            if settings.QUERY_BUDGET_STRICT:
+                raise metrics.QueryBudgetExceeded(message)
+            logger.warning('Query budget exceeded: %s', message)
+        return response
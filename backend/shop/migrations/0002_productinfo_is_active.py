@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FTS_TABLE = 'shop_productsearch_fts'
+DOCUMENT_TABLE = 'shop_productsearchdocument'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        text, content='{DOCUMENT_TABLE}', content_rowid='product_info_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.product_info_id, new.text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.product_info_id, old.text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.product_info_id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.product_info_id, new.text);
+    END""",
+]
+SQLITE_BACKWARD = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f"CREATE INDEX productsearch_tsv_idx ON {DOCUMENT_TABLE} USING gin (to_tsvector('simple', text))",
+    f'CREATE INDEX productsearch_trgm_idx ON {DOCUMENT_TABLE} USING gin (text gin_trgm_ops)',
+]
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS productsearch_trgm_idx',
+    'DROP INDEX IF EXISTS productsearch_tsv_idx',
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def fill_documents(apps, schema_editor):
+    """
+    Заполняет поисковые документы для существующих предложений
+    (та же нормализация, что в shop.utils.search.build_text).
+    """
+    ProductInfo = apps.get_model('shop', 'ProductInfo')
+    ProductParameter = apps.get_model('shop', 'ProductParameter')
+    ProductSearchDocument = apps.get_model('shop', 'ProductSearchDocument')
+
+    values = {}
+    for info_id, value in ProductParameter.objects.order_by('parameter_id').values_list('product_info_id', 'value'):
+        values.setdefault(info_id, []).append(value)
+
+    documents = []
+    for pk, name, model, description in ProductInfo.objects.values_list('id', 'product__name', 'model', 'description'):
+        parts = (name, model, description, *values.get(pk, ()))
+        text = ' '.join(part for part in parts if part).lower().replace('ё', 'е')
+        documents.append(ProductSearchDocument(product_info_id=pk, text=text))
+    ProductSearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='shop.productinfo')),
+                ('text', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_facets(apps, schema_editor):
+    """
+    Строит индекс фасетов и счётчики по существующим параметрам предложений.
+    """
+    ProductParameter = apps.get_model('shop', 'ProductParameter')
+    FacetValue = apps.get_model('shop', 'FacetValue')
+    ProductFacet = apps.get_model('shop', 'ProductFacet')
+
+    values = {}
+    facets = []
+    counts = {}
+    rows = ProductParameter.objects.values_list('product_info_id', 'product_info__is_active', 'parameter_id', 'value')
+    for info_id, is_active, parameter_id, value in rows:
+        key = (parameter_id, value)
+        if key not in values:
+            values[key] = FacetValue(parameter_id=parameter_id, value=value)
+        counts[key] = counts.get(key, 0) + int(is_active)
+        facets.append((info_id, key))
+
+    for key, facet_value in values.items():
+        facet_value.product_count = counts[key]
+    FacetValue.objects.bulk_create(values.values(), batch_size=1000)
+    ProductFacet.objects.bulk_create(
+        [ProductFacet(product_info_id=info_id, facet_value_id=values[key].pk) for info_id, key in facets],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_values', to='shop.parameter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet_value', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_facets', to='shop.facetvalue')),
+                ('product_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='shop.productinfo')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='facetvalue',
+            constraint=models.UniqueConstraint(fields=('parameter', 'value'), name='unique_facet_value'),
+        ),
+        migrations.AddIndex(
+            model_name='productfacet',
+            index=models.Index(fields=['product_info', 'facet_value'], name='productfacet_info_value_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productfacet',
+            constraint=models.UniqueConstraint(fields=('facet_value', 'product_info'), name='unique_product_facet'),
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDocument',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='shop.productinfo')),
+                ('data', models.BinaryField()),
+            ],
+        ),
+    ]
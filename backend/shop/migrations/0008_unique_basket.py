@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:46
+
+from django.db import migrations, models
+
+
+def merge_baskets(apps, schema_editor):
+    """
+    Сливает лишние корзины пользователя в самую раннюю: количества одинаковых
+    товаров складываются, пустые дубликаты удаляются.
+    """
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+
+    baskets = {}
+    for pk, user_id in Order.objects.filter(state='basket').order_by('id').values_list('id', 'user_id'):
+        baskets.setdefault(user_id, []).append(pk)
+
+    for keep, *duplicates in (ids for ids in baskets.values() if len(ids) > 1):
+        items = {item.product_info_id: item for item in OrderItem.objects.filter(order_id=keep)}
+        for item in OrderItem.objects.filter(order_id__in=duplicates).order_by('id'):
+            if item.product_info_id in items:
+                items[item.product_info_id].quantity += item.quantity
+            else:
+                items[item.product_info_id] = OrderItem(order_id=keep, product_info_id=item.product_info_id,
+                                                        quantity=item.quantity)
+        OrderItem.objects.filter(order_id__in=duplicates).delete()
+        OrderItem.objects.bulk_update([item for item in items.values() if item.pk], ['quantity'])
+        OrderItem.objects.bulk_create([item for item in items.values() if not item.pk])
+        Order.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_documents'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_baskets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 'basket')), fields=('user',), name='unique_user_basket'),
+        ),
+    ]
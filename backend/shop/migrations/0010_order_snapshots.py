@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_snapshots(apps, schema_editor):
+    """
+    Заполняет снимки позиций и суммы уже оформленных заказов по текущему каталогу.
+    """
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+
+    items = OrderItem.objects.exclude(order__state='basket')\
+        .values_list('id', 'order_id', 'quantity', 'product_info__price', 'product_info__product__name',
+                     'product_info__shop__name')
+    totals = {}
+    snapshots = []
+    for pk, order_id, quantity, price, product_name, shop_name in items.iterator(chunk_size=2000):
+        snapshots.append(OrderItem(pk=pk, price=price, product_name=product_name, shop_name=shop_name))
+        totals[order_id] = totals.get(order_id, 0) + price * quantity
+    OrderItem.objects.bulk_update(snapshots, ['price', 'product_name', 'shop_name'], batch_size=1000)
+
+    orders = [Order(pk=pk, total=totals.get(pk, 0)) for pk in Order.objects.exclude(state='basket')
+              .values_list('id', flat=True)]
+    Order.objects.bulk_update(orders, ['total'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_order_stock_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=80),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop_name',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_info',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_items', to='shop.productinfo'),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def fill_feed(apps, schema_editor):
+    """
+    Время изменения существующих заказов — время их создания; магазин позиций
+    оформленных заказов берётся из предложения.
+    """
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    ProductInfo = apps.get_model('shop', 'ProductInfo')
+
+    Order.objects.update(updated_at=F('dt'))
+    shops = ProductInfo.objects.filter(pk=OuterRef('product_info_id')).values('shop_id')
+    OrderItem.objects.exclude(order__state='basket').filter(product_info__isnull=False)\
+        .update(shop_id=Subquery(shops))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_order_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordered_items', to='shop.shop'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['shop', 'order'], name='orderitem_shop_order_idx'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
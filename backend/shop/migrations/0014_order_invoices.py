@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_invoiced(apps, schema_editor):
+    """
+    Уже существующие заказы считаются разосланными: первая же рассылка не должна отправить накладные за всю историю.
+    """
+    Order = apps.get_model('shop', 'Order')
+    Order.objects.exclude(state='basket').update(invoiced_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoiced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='attachments',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('invoiced_at__isnull', True)), fields=['id'], name='order_invoice_pending_idx'),
+        ),
+        migrations.RunPython(mark_invoiced, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:33
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def lease_running_jobs(apps, schema_editor):
+    """
+    Задания, выполняющиеся при обновлении, получают аренду: если их воркер уже остановлен,
+    по её истечении они снова попадут в очередь.
+    """
+    ImportJob = apps.get_model('shop', 'ImportJob')
+    ImportJob.objects.filter(state='running').update(lease_expires_at=timezone.now() + timedelta(minutes=5), attempts=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_order_invoices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='lease',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(lease_running_jobs, migrations.RunPython.noop),
+    ]
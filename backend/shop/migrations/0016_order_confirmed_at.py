@@ -0,0 +1,47 @@
+# Generated by Django 5.2.3 on 2026-10-18 21:43
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_confirmed_at(apps, schema_editor):
+    """
+    Время оформления существующих заказов не хранилось. У заказов в состоянии confirmed
+    оно совпадает с временем последнего изменения (подтверждение — последнее изменение),
+    у остальных известна только нижняя граница — время создания корзины.
+    """
+    Order = apps.get_model('shop', 'Order')
+    Order.objects.filter(state='confirmed').update(confirmed_at=F('updated_at'))
+    Order.objects.exclude(state__in=('basket', 'confirmed')).update(confirmed_at=F('dt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_import_job_lease'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_state_dt_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_dt_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='confirmed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_confirmed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'state', 'confirmed_at'], name='order_user_state_conf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'confirmed_at'], name='order_user_confirmed_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django_rest_passwordreset.tokens import get_token_generator
 from django.contrib.auth.base_user import BaseUserManager
 
@@ -43,6 +44,19 @@ STATE_CHOICES = (
     ('canceled', 'Отменён'),
 )
 
+IMPORT_JOB_STATE_CHOICES = (
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершён'),
+    ('failed', 'Ошибка'),
+)
+
+OUTBOX_STATE_CHOICES = (
+    ('pending', 'В очереди'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),
+)
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -102,11 +116,96 @@ class ProductInfo(models.Model):
     price = models.PositiveIntegerField()
     price_rrc = models.PositiveIntegerField()
     description = models.TextField(blank=True)
+    is_active = models.BooleanField(default=True)  # Снято с продажи, если нет в последнем прайс-листе
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info')
         ]
+        indexes = [
+            # Фильтр каталога по магазину с сортировкой/диапазоном по цене
+            models.Index(fields=['shop', 'price'], name='productinfo_shop_price_idx'),
+            # Сортировка и курсорная пагинация по (price, id) и (quantity, id)
+            models.Index(fields=['price', 'id'], name='productinfo_price_id_idx'),
+            models.Index(fields=['quantity', 'id'], name='productinfo_quantity_id_idx'),
+        ]
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Поисковый документ предложения: нормализованный текст из названия, модели,
+    описания и значений параметров. Поверх таблицы строится полнотекстовый
+    индекс (FTS5 в SQLite, tsvector/триграммы в PostgreSQL), см. shop.utils.search.
+    """
+    product_info = models.OneToOneField(ProductInfo, primary_key=True, related_name='search_document',
+                                        on_delete=models.CASCADE)
+    text = models.TextField()
+
+
+class ProductDocument(models.Model):
+    """
+    Готовое JSON-представление предложения (как отдаёт ProductInfoSerializer),
+    пересобираемое при изменении исходных строк, см. shop.utils.documents.
+    """
+    product_info = models.OneToOneField(ProductInfo, primary_key=True, related_name='document',
+                                        on_delete=models.CASCADE)
+    data = models.BinaryField()
+
+
+class ImportJob(models.Model):
+    """
+    Задание на фоновый импорт загруженного прайс-листа.
+    """
+    user = models.ForeignKey(User, related_name='import_jobs', on_delete=models.CASCADE)
+    file = models.FileField(upload_to='imports/', blank=True)
+    format = models.CharField(max_length=10, blank=True)
+    mode = models.CharField(max_length=10, default='diff')
+    shop_name = models.CharField(max_length=50, blank=True)
+    state = models.CharField(choices=IMPORT_JOB_STATE_CHOICES, max_length=10, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    lease = models.CharField(max_length=32, blank=True)  # Метка воркера, захватившего задание
+    # До какого момента задание закреплено за воркером (см. shop.utils.jobs.claim_next_job)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    bytes_total = models.PositiveBigIntegerField(default=0)
+    bytes_processed = models.PositiveBigIntegerField(default=0)
+    stats = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'Import job #{self.pk} ({self.state})'
+
+
+class OutboxEmail(models.Model):
+    """
+    Письмо в очереди на отправку. Запросы только добавляют строку,
+    отправляет фоновый воркер (см. shop.utils.outbox и команду `send_outbox`).
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField()
+    attachments = models.JSONField(default=list, blank=True)  # Пути к прикладываемым файлам
+    state = models.CharField(choices=OUTBOX_STATE_CHOICES, max_length=10, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Когда письмо можно (снова) отправлять: откладывается при захвате воркером и при ошибке отправки
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    lease = models.CharField(max_length=32, blank=True)  # Метка воркера, захватившего письмо
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Выборка очереди воркером: state = 'pending' AND next_attempt_at <= now ORDER BY id
+            models.Index(fields=['state', 'next_attempt_at'], name='outbox_state_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'Email #{self.pk} to {", ".join(self.recipients)} ({self.state})'
 
 
 class Parameter(models.Model):
@@ -127,6 +226,42 @@ class ProductParameter(models.Model):
         ]
 
 
+class FacetValue(models.Model):
+    """
+    Значение параметра как фасет каталога.
+    product_count — число активных предложений с этим значением, поддерживается
+    инкрементально (см. shop.utils.facets) и отдаётся для каталога без фильтров.
+    """
+    parameter = models.ForeignKey(Parameter, related_name='facet_values', on_delete=models.CASCADE)
+    value = models.CharField(max_length=100)
+    product_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['parameter', 'value'], name='unique_facet_value')
+        ]
+
+    def __str__(self):
+        return f'{self.parameter_id}: {self.value}'
+
+
+class ProductFacet(models.Model):
+    """
+    Денормализованный индекс фасетов: пара (предложение, значение параметра)
+    без строк и названий, чтобы фильтрация и подсчёт шли по узким целочисленным индексам.
+    """
+    product_info = models.ForeignKey(ProductInfo, related_name='facets', on_delete=models.CASCADE)
+    facet_value = models.ForeignKey(FacetValue, related_name='product_facets', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet_value', 'product_info'], name='unique_product_facet')
+        ]
+        indexes = [
+            models.Index(fields=['product_info', 'facet_value'], name='productfacet_info_value_idx'),
+        ]
+
+
 class Contact(models.Model):
     user = models.ForeignKey(User, related_name='contacts', on_delete=models.CASCADE)
     city = models.CharField(max_length=50)
@@ -145,7 +280,38 @@ class Order(models.Model):
     user = models.ForeignKey(User, related_name='orders', on_delete=models.CASCADE)
     dt = models.DateTimeField(auto_now_add=True)
     state = models.CharField(choices=STATE_CHOICES, max_length=15, default='basket')  # <- default: корзина
+    confirmed_at = models.DateTimeField(null=True, blank=True)  # Время оформления заказа; у корзины — нет
     contact = models.ForeignKey(Contact, null=True, blank=True, on_delete=models.CASCADE)
+    stock_reserved = models.BooleanField(default=False)  # Товар заказа списан с остатков (см. shop.utils.inventory)
+    total = models.PositiveIntegerField(null=True, blank=True)  # Сумма на момент подтверждения; у корзины — нет
+    updated_at = models.DateTimeField(auto_now=True)  # Для ленты изменений заказов поставщика
+    invoiced_at = models.DateTimeField(null=True, blank=True)  # Накладные разосланы (команда send_invoices)
+
+    class Meta:
+        indexes = [
+            # Корзина пользователя и история заказов с фильтром по состоянию, по времени оформления
+            models.Index(fields=['user', 'state', 'confirmed_at'], name='order_user_state_conf_idx'),
+            # История заказов без фильтра по состоянию: страницы по (confirmed_at, id) читаются по индексу
+            # без сортировки
+            models.Index(fields=['user', 'confirmed_at'], name='order_user_confirmed_idx'),
+            # Лента изменений заказов для поставщиков: курсор по (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+            # Заказы, по которым ещё не разосланы накладные: частичный индекс содержит только их
+            models.Index(fields=['id'], condition=models.Q(invoiced_at__isnull=True), name='order_invoice_pending_idx'),
+        ]
+        constraints = [
+            # У пользователя не больше одной корзины: параллельные запросы не создадут вторую
+            models.UniqueConstraint(fields=['user'], condition=models.Q(state='basket'), name='unique_user_basket'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Заказ, созданный или переведённый из корзины в обход подтверждения (админка, скрипты),
+        # тоже получает время оформления: без него он выпал бы из истории и выручки
+        if self.state != 'basket' and self.confirmed_at is None:
+            self.confirmed_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'confirmed_at'}
+        return super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Order #{self.pk} ({self.state}) for {self.user.email}'
@@ -153,14 +319,31 @@ class Order(models.Model):
 
 
 class OrderItem(models.Model):
+    """
+    Позиция корзины или заказа.
+
+    При подтверждении заказа цена, название товара и магазина копируются в позицию:
+    история заказов читается без обращения к каталогу и не меняется при переимпорте
+    (удалённое предложение лишь обнуляет ссылку product_info).
+    """
     order = models.ForeignKey(Order, related_name='ordered_items', on_delete=models.CASCADE)
-    product_info = models.ForeignKey(ProductInfo, related_name='ordered_items', on_delete=models.CASCADE)
+    product_info = models.ForeignKey(ProductInfo, related_name='ordered_items', null=True, blank=True,
+                                     on_delete=models.SET_NULL)
     quantity = models.PositiveIntegerField()
+    price = models.PositiveIntegerField(null=True, blank=True)
+    product_name = models.CharField(max_length=80, blank=True)
+    shop_name = models.CharField(max_length=50, blank=True)
+    # Магазин позиции на момент подтверждения: заказы поставщика выбираются без обращения к каталогу
+    shop = models.ForeignKey(Shop, related_name='ordered_items', null=True, blank=True, on_delete=models.SET_NULL)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['order', 'product_info'], name='unique_order_item')
         ]
+        indexes = [
+            # Заказы и выручка поставщика
+            models.Index(fields=['shop', 'order'], name='orderitem_shop_order_idx'),
+        ]
 
 
 
@@ -0,0 +1,26 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from shop.utils import fastjson, metrics
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, кодирующий ответы через orjson/msgspec, если они установлены
+    (см. shop.utils.fastjson), с тем же результатом, что и у стандартного рендерера.
+
+    Отформатированный вывод (`Accept: application/json; indent=4`, browsable API)
+    и нестандартные настройки UNICODE_JSON/COMPACT_JSON/STRICT_JSON
+    обрабатываются базовым JSONRenderer.
+
+    Время кодирования учитывается в метриках запроса как время сериализации.
+    """
+    defaults = api_settings.UNICODE_JSON and api_settings.COMPACT_JSON and api_settings.STRICT_JSON
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with metrics.measure_serialization():
+            if not self.defaults or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+                return super().render(data, accepted_media_type, renderer_context)
+            return fastjson.dumps(data)
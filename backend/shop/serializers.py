@@ -1,7 +1,12 @@
+from operator import attrgetter
+from typing import Any, Callable
+
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.db.models import Manager, QuerySet
 from shop.models import (User, ProductInfo, Product, Shop, ProductParameter, Parameter, Order,
-                         OrderItem, Contact, Order, OrderItem, ProductInfo)
+                         OrderItem, Contact, Order, OrderItem, ProductInfo, ImportJob)
+from shop.utils.jobs import job_progress
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -32,6 +37,17 @@ class LoginSerializer(serializers.Serializer):
             return user
         raise serializers.ValidationError("Invalid credentials or inactive user")
 
+class SortedListSerializer(serializers.ListSerializer):
+    """
+    Вложенный список по возрастанию id — в том же порядке, что отдают быстрые сериализаторы.
+    Сортировка в Python, поэтому prefetch_related продолжает работать.
+    """
+
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, Manager) else data
+        return super().to_representation(sorted(items, key=attrgetter('pk')))
+
+
 class ProductParameterSerializer(serializers.ModelSerializer):
     """
     Параметры товара.
@@ -41,6 +57,7 @@ class ProductParameterSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductParameter
         fields = ['name', 'value']
+        list_serializer_class = SortedListSerializer
 
 
 class ProductInfoSerializer(serializers.ModelSerializer):
@@ -55,6 +72,16 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         model = ProductInfo
         fields = ['id', 'product', 'model', 'shop', 'price', 'price_rrc', 'quantity', 'parameters']
 
+class CartItemListSerializer(SortedListSerializer):
+    """
+    Позиции корзины без удалённых из каталога предложений (как в fast_cart_items).
+    """
+
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, Manager) else data
+        return super().to_representation([item for item in items if item.product_info_id is not None])
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     """
     Товары в корзине.
@@ -66,6 +93,7 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'shop', 'price', 'quantity']
+        list_serializer_class = CartItemListSerializer
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -98,26 +126,205 @@ class ContactSerializer(serializers.ModelSerializer):
 
 class OrderItemSerializer(serializers.ModelSerializer):
     """
-    Позиция в заказе.
+    Позиция в заказе: цена и названия на момент подтверждения (без обращения к каталогу).
     """
-    product = serializers.CharField(source='product_info.product.name')
-    shop = serializers.CharField(source='product_info.shop.name')
-    price = serializers.IntegerField(source='product_info.price')
+    product = serializers.CharField(source='product_name')
+    shop = serializers.CharField(source='shop_name')
 
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'shop', 'price', 'quantity']
+        list_serializer_class = SortedListSerializer
 
 class OrderSerializer(serializers.ModelSerializer):
     """
     Заказ пользователя, включая позиции и общую сумму.
     """
     ordered_items = OrderItemSerializer(many=True)
-    total = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
-        fields = ['id', 'state', 'dt', 'ordered_items', 'total']
+        fields = ['id', 'state', 'dt', 'confirmed_at', 'ordered_items', 'total']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Состояние фонового импорта прайс-листа: прогресс, скорость, ошибки и итоговые счётчики.
+    """
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'state', 'mode', 'format', 'created_at', 'started_at', 'finished_at',
+                  'bytes_total', 'progress', 'stats', 'error']
+
+    def get_progress(self, obj: ImportJob) -> dict:
+        return job_progress(obj)
+
+
+class FastSerializer:
+    """
+    Быстрый read-only сериализатор для горячих ответов.
+
+    Строит представление из кортежей `values_list()` вместо экземпляров моделей:
+    пути `fields` разрешаются базой (JOIN), а не цепочкой атрибутов, имена полей
+    и преобразователи подготавливаются один раз на класс. Результат совпадает
+    с ответом соответствующего ModelSerializer байт в байт.
+
+    Интерфейс повторяет DRF: `FastProductInfoSerializer(queryset, many=True).data`.
+    Без many возвращается первый объект выборки (или None).
+    """
+    # (имя в ответе, путь для values_list)
+    fields: tuple[tuple[str, str], ...] = ()
+    # имя в ответе -> преобразование значения (например, формат даты DRF)
+    converters: dict[str, Callable[[Any], Any]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        names = [name for name, _ in cls.fields]
+        cls._names = tuple(names)
+        cls._lookups = tuple(lookup for _, lookup in cls.fields)
+        cls._converters = tuple((names.index(name), convert) for name, convert in cls.converters.items())
+
+    def __init__(self, queryset: QuerySet, many: bool = False):
+        self.queryset = queryset
+        self.many = many
+        self.rows: list[tuple] = []
+
+    def build(self, rows: list[tuple]) -> list[dict]:
+        names, converters = self._names, self._converters
+        items = []
+        for row in rows:
+            if converters:
+                row = list(row)
+                for index, convert in converters:
+                    row[index] = convert(row[index])
+            items.append(dict(zip(names, row)))
+        return items
+
+    def attach(self, items: list[dict]) -> None:
+        """
+        Добавляет вложенные поля (одним запросом на всю выборку).
+        """
+
+    def to_representation(self) -> list[dict]:
+        self.rows = list(self.queryset.values_list(*self._lookups))
+        items = self.build(self.rows)
+        if items:
+            self.attach(items)
+        return items
+
+    def raw(self, index: int, name: str) -> Any:
+        """
+        Значение поля name записи index до преобразования (например, datetime, а не строка
+        в формате DRF) — для курсора, который не должен зависеть от настроек формата.
+        """
+        return self.rows[index][self._names.index(name)]
+
+    @property
+    def data(self) -> list[dict] | dict | None:
+        items = self.to_representation()
+        if self.many:
+            return items
+        return items[0] if items else None
+
+
+class FastProductInfoSerializer(FastSerializer):
+    """
+    Быстрый аналог ProductInfoSerializer.
+    """
+    fields = (('id', 'id'), ('product', 'product__name'), ('model', 'model'), ('shop', 'shop__name'),
+              ('price', 'price'), ('price_rrc', 'price_rrc'), ('quantity', 'quantity'))
+
+    def attach(self, items: list[dict]) -> None:
+        # Тот же фильтр, что и у prefetch_related('product_parameters__parameter'), и тот же порядок,
+        # что у ProductParameterSerializer (по id); название параметра берётся JOIN-ом
+        parameters = {item['id']: [] for item in items}
+        rows = ProductParameter.objects.filter(product_info_id__in=list(parameters)).order_by('product_info_id', 'id')\
+            .values_list('product_info_id', 'parameter__name', 'value')
+        for info_id, name, value in rows:
+            parameters[info_id].append({'name': name, 'value': value})
+        for item in items:
+            item['parameters'] = parameters[item['id']]
+
+
+def fast_cart_items(order_ids: list[int]) -> dict[int, list[dict]]:
+    """
+    Позиции корзин в формате CartItemSerializer (текущие цены каталога), сгруппированные по корзине.
+    Позиции, чьё предложение удалено из каталога, не показываются.
+
+    Порядок задан явно: без него JOIN с каталогом меняет порядок строк, выбранный планировщиком.
+    """
+    items = {pk: [] for pk in order_ids}
+    rows = OrderItem.objects.filter(order_id__in=order_ids, product_info__isnull=False).order_by('order_id', 'id')\
+        .values_list('order_id', 'id', 'product_info__product__name', 'product_info__shop__name',
+                     'product_info__price', 'quantity')
+    for order_id, pk, product, shop, price, quantity in rows:
+        items[order_id].append({'id': pk, 'product': product, 'shop': shop, 'price': price, 'quantity': quantity})
+    return items
+
+
+def fast_order_items(order_ids: list[int]) -> dict[int, list[dict]]:
+    """
+    Позиции заказов в формате OrderItemSerializer, сгруппированные по заказу: только сама таблица позиций.
+    """
+    items = {pk: [] for pk in order_ids}
+    rows = OrderItem.objects.filter(order_id__in=order_ids).order_by('order_id', 'id')\
+        .values_list('order_id', 'id', 'product_name', 'shop_name', 'price', 'quantity')
+    for order_id, pk, product, shop, price, quantity in rows:
+        items[order_id].append({'id': pk, 'product': product, 'shop': shop, 'price': price, 'quantity': quantity})
+    return items
+
+
+class FastCartSerializer(FastSerializer):
+    """
+    Быстрый аналог CartSerializer.
+    """
+    fields = (('id', 'id'), ('state', 'state'))
+
+    def attach(self, items: list[dict]) -> None:
+        ordered_items = fast_cart_items([item['id'] for item in items])
+        for item in items:
+            item['ordered_items'] = ordered_items[item['id']]
+
+
+class FastOrderSerializer(FastSerializer):
+    """
+    Быстрый аналог OrderSerializer.
+    """
+    fields = (('id', 'id'), ('state', 'state'), ('dt', 'dt'), ('confirmed_at', 'confirmed_at'), ('total', 'total'))
+    converters = {'dt': serializers.DateTimeField().to_representation,
+                  'confirmed_at': serializers.DateTimeField().to_representation}
+
+    def attach(self, items: list[dict]) -> None:
+        ordered_items = fast_order_items([item['id'] for item in items])
+        for item in items:
+            item['ordered_items'] = ordered_items[item['id']]
+            # total идёт после позиций, как в OrderSerializer
+            item['total'] = item.pop('total')
+
+
+class FastPartnerOrderSerializer(FastSerializer):
+    """
+    Заказ в ленте поставщика: только позиции его магазина и их сумма (по снимкам цен).
+    """
+    fields = (('id', 'id'), ('state', 'state'), ('dt', 'dt'), ('confirmed_at', 'confirmed_at'),
+              ('updated_at', 'updated_at'))
+    converters = {'dt': serializers.DateTimeField().to_representation,
+                  'confirmed_at': serializers.DateTimeField().to_representation,
+                  'updated_at': serializers.DateTimeField().to_representation}
+
+    def __init__(self, queryset: QuerySet, shop_id: int, many: bool = False):
+        super().__init__(queryset, many)
+        self.shop_id = shop_id
 
-    def get_total(self, obj: Order) -> int:
-        return sum(item.product_info.price * item.quantity for item in obj.ordered_items.all())
+    def attach(self, items: list[dict]) -> None:
+        lines = {item['id']: [] for item in items}
+        rows = OrderItem.objects.filter(order_id__in=list(lines), shop_id=self.shop_id).order_by('order_id', 'id')\
+            .values_list('order_id', 'id', 'product_info_id', 'product_name', 'price', 'quantity')
+        for order_id, pk, product_info, product, price, quantity in rows:
+            lines[order_id].append({'id': pk, 'product_info': product_info, 'product': product,
+                                    'price': price, 'quantity': quantity})
+        for item in items:
+            item['ordered_items'] = lines[item['id']]
+            item['total'] = sum(line['price'] * line['quantity'] for line in lines[item['id']])
@@ -1,8 +1,13 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from shop.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from shop.utils import catalog_cache, documents, facets, search, shop_state, token_cache
+from shop.utils.db import in_bulk_changes
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     """
@@ -15,3 +20,146 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
     """
     if created:
         Token.objects.get_or_create(user=instance)
+    else:
+        # Деактивация и любые изменения пользователя не должны пережить кэш аутентификации
+        token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance=None, **kwargs):
+    """
+    Удалённый токен (выход, удаление пользователя) сразу перестаёт приниматься.
+    """
+    token_cache.invalidate_user(instance.user_id)
+
+
+def _catalog_scope(info_id: int) -> tuple[int, int] | None:
+    """
+    Магазин и категория предложения в базе (None, если его нет).
+    """
+    return ProductInfo.objects.filter(pk=info_id).values_list('shop_id', 'product__category_id').first()
+
+
+@receiver(pre_save, sender=ProductInfo)
+def remember_product_info_scope(sender, instance=None, raw=False, update_fields=None, **kwargs):
+    """
+    Запоминает магазин и категорию предложения до изменения: если его перенесли
+    в другой товар (категорию) или магазин, сбросить нужно и прежние.
+    """
+    if instance.pk is None or raw or (update_fields is not None and not {'product', 'shop'} & set(update_fields)):
+        instance._catalog_scope = None
+    else:
+        instance._catalog_scope = _catalog_scope(instance.pk)
+
+
+@receiver(post_save, sender=ProductInfo)
+def invalidate_product_info(sender, instance=None, **kwargs):
+    """
+    Сбрасывает кэш каталога для магазина и категории изменённого предложения (и прежних,
+    если они изменились).
+
+    Пакетные операции (bulk_create/update) сигналов не порождают,
+    поэтому код, который их выполняет, сбрасывает кэш сам.
+    """
+    shop_ids, category_ids = {instance.shop_id}, set()
+    category_id = Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True).first()
+    if category_id:
+        category_ids.add(category_id)
+    previous = getattr(instance, '_catalog_scope', None)
+    if previous:
+        shop_ids.add(previous[0])
+        category_ids.add(previous[1])
+    catalog_cache.invalidate(shop_ids, category_ids)
+    search.reindex([instance.pk])
+    facets.update([instance.pk])
+    documents.rebuild([instance.pk])
+
+
+@receiver(pre_delete, sender=ProductInfo)
+def remember_deleted_product_info(sender, instance=None, **kwargs):
+    """
+    Запоминает магазин, категорию и значения фасетов удаляемого предложения:
+    после удаления (фасеты удаляются вместе с ним) их уже не прочитать.
+    """
+    if not in_bulk_changes():
+        instance._catalog_scope = _catalog_scope(instance.pk)
+        instance._facet_values = facets.values_of([instance.pk])
+
+
+@receiver(post_delete, sender=ProductInfo)
+def invalidate_deleted_product_info(sender, instance=None, **kwargs):
+    """
+    Сбрасывает кэш каталога и счётчики фасетов удалённого предложения;
+    поисковый и готовый документы удаляются вместе с ним.
+    """
+    scope = getattr(instance, '_catalog_scope', None)
+    if in_bulk_changes() or scope is None:
+        return
+    catalog_cache.invalidate([scope[0]], [scope[1]])
+    facets.recount(instance._facet_values)
+
+
+@receiver(post_save, sender=ProductParameter)
+def invalidate_product_parameter(sender, instance=None, **kwargs):
+    """
+    Сбрасывает кэш каталога для предложения, параметр которого изменился.
+    """
+    scope = _catalog_scope(instance.product_info_id)
+    if scope:
+        catalog_cache.invalidate([scope[0]], [scope[1]])
+        search.reindex([instance.product_info_id])
+        facets.recount(facets.reindex([instance.product_info_id]))
+        documents.rebuild([instance.product_info_id])
+
+
+@receiver(post_delete, sender=ProductParameter)
+def invalidate_deleted_product_parameter(sender, instance=None, origin=None, **kwargs):
+    """
+    Пересобирает поисковый документ, фасеты и готовый документ предложения, у которого
+    удалили параметр (сам параметр или его значение у товара), и сбрасывает кэш каталога.
+
+    Если удаляется само предложение (или его магазин, товар, категория), параметры
+    уходят вместе с ним: пересобирать нечего, а кэш сбросит обработчик удаления предложения.
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if in_bulk_changes() or origin_model not in (ProductParameter, Parameter):
+        return
+    invalidate_product_parameter(sender, instance)
+
+
+@receiver(post_save, sender=Shop)
+def invalidate_shop(sender, instance=None, created=False, **kwargs):
+    catalog_cache.invalidate(shop_ids=[instance.pk])
+    shop_state.invalidate()
+    if not created:
+        documents.rebuild_for_shop(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category(sender, instance=None, **kwargs):
+    catalog_cache.invalidate(category_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Parameter)
+def invalidate_catalog(sender, instance=None, **kwargs):
+    """
+    Товар и параметр входят в предложения многих магазинов — сбрасываем кэш целиком.
+    """
+    catalog_cache.invalidate_all()
+
+
+@receiver(post_save, sender=Product)
+def reindex_product(sender, instance=None, created=False, **kwargs):
+    """
+    Название товара входит в поисковые документы и готовые представления всех его предложений.
+    """
+    if not created:
+        search.reindex_product(instance.pk)
+        documents.rebuild_for_product(instance.pk)
+
+
+@receiver(post_save, sender=Parameter)
+def rebuild_parameter_documents(sender, instance=None, created=False, **kwargs):
+    if not created:
+        documents.rebuild_for_parameter(instance.pk)
@@ -1,3 +1,1073 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import smtplib
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from shop.models import (Category, Contact, ImportJob, Order, OrderItem, OutboxEmail, Parameter, Product,
+                         ProductDocument, ProductInfo, ProductParameter, Shop, User)
+from shop.renderers import FastJSONRenderer
+from shop.serializers import (CartSerializer, FastCartSerializer, FastOrderSerializer, FastProductInfoSerializer,
+                              OrderSerializer, ProductInfoSerializer)
+from shop.utils import cart as cart_ops, fastjson, feeds, inventory, invoices, jobs, outbox, search, token_cache
+from shop.utils.importer import PriceListError, PriceListImporter
+from shop.utils.jobs import claim_next_job, run_import_job
+from shop.utils.testing import QueryBudgetMixin, TemporaryMediaMixin
+from shop.views.cart import CartAddView, CartBatchView, CartRemoveView, CartView
+from shop.views.contact import ContactCreateView, ContactDeleteView, ContactListView
+from shop.views.metrics import MetricsView
+from shop.views.order import OrderDetailView, OrderListView, iter_orders
+from shop.views.partner import PartnerOrderFeed, PartnerRevenue, PartnerState, PartnerUpdate, PartnerUpdateStatus
+from shop.views.product import ProductExportView, ProductListView
+from shop.views.registration import LoginView, RegisterView
+
+PRICE_LIST = 'shop: Связной\ncategories: []\ngoods: []\n'.encode()
+
+
+class MigrationsTests(TestCase):
+    """
+    Каждое изменение моделей сопровождается миграцией в том же коммите.
+    """
+
+    def test_no_missing_migrations(self):
+        out = StringIO()
+        try:
+            call_command('makemigrations', 'shop', check=True, dry_run=True, stdout=out)
+        except SystemExit:
+            self.fail(f'Models have changes without a migration:\n{out.getvalue()}')
+
+
+class FastSerializerTests(APITestCase):
+    """
+    Быстрые сериализаторы и рендерер отдают те же байты, что ModelSerializer с JSONRenderer DRF.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        partner = User.objects.create_user(email='partner@example.com', type='shop', is_active=True)
+        shop = Shop.objects.create(name='Связной', user=partner)
+        category = Category.objects.create(name='Смартфоны')
+        # Имена параметров и товаров не в порядке id: порядок JOIN-а по ним отличается от порядка позиций
+        parameters = [Parameter.objects.create(name=name) for name in ('Цвет', 'Диагональ', 'Объём')]
+        cls.infos = []
+        for number, price in enumerate((300, 100, 200, 150)):
+            info = ProductInfo.objects.create(product=Product.objects.create(name=f'Товар {4 - number}',
+                                                                              category=category),
+                                              shop=shop, external_id=number, price=price, price_rrc=price,
+                                              quantity=10)
+            for parameter in reversed(parameters):
+                ProductParameter.objects.create(product_info=info, parameter=parameter, value=f'{number}"')
+            cls.infos.append(info)
+        cls.user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        cls.contact = Contact.objects.create(user=cls.user, city='Москва', street='Тверская', house='1', phone='1')
+        cls.order = cls.make_basket([cls.infos[0], cls.infos[2], cls.infos[1]])
+        # Остатки в документах каталога обновляются после фиксации транзакции
+        with cls.captureOnCommitCallbacks(execute=True):
+            inventory.confirm_order(cls.order.pk, cls.user, cls.contact)
+        cls.basket = cls.make_basket([cls.infos[3], cls.infos[0], cls.infos[2]])
+
+    @classmethod
+    def make_basket(cls, infos: list[ProductInfo]) -> Order:
+        order = Order.objects.create(user=cls.user, state='basket')
+        for quantity, info in enumerate(infos, start=1):
+            OrderItem.objects.create(order=order, product_info=info, quantity=quantity)
+        return order
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assertSameBytes(self, standard, fast):
+        self.assertEqual(JSONRenderer().render(standard), FastJSONRenderer().render(fast))
+
+    def test_products(self):
+        products = ProductInfo.objects.order_by('price')
+        self.assertSameBytes(
+            ProductInfoSerializer(products.select_related('product', 'shop')
+                                  .prefetch_related('product_parameters__parameter'), many=True).data,
+            FastProductInfoSerializer(products, many=True).data)
+        response = self.client.get('/api/products/', {'ordering': 'price'})
+        self.assertEqual(response.content, JSONRenderer().render(
+            {'count': len(self.infos), 'results': ProductInfoSerializer(products, many=True).data}))
+
+    def test_cart(self):
+        standard = CartSerializer(Order.objects.get(pk=self.basket.pk)).data
+        self.assertSameBytes(standard, FastCartSerializer(Order.objects.filter(pk=self.basket.pk)).data)
+        self.assertEqual([item['id'] for item in standard['ordered_items']],
+                         sorted(item['id'] for item in standard['ordered_items']))
+        self.assertEqual(self.client.get('/api/cart/').content, JSONRenderer().render(standard))
+
+    def test_orders(self):
+        orders = Order.objects.filter(user=self.user).exclude(state='basket')
+        self.assertSameBytes(OrderSerializer(orders.prefetch_related('ordered_items'), many=True).data,
+                             FastOrderSerializer(orders, many=True).data)
+        self.assertEqual(self.client.get(f'/api/order/{self.order.pk}/').content,
+                         JSONRenderer().render(OrderSerializer(Order.objects.get(pk=self.order.pk)).data))
+
+    def test_partner_feed_lines_in_id_order(self):
+        Order.objects.filter(pk=self.order.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        self.client.force_authenticate(User.objects.get(email='partner@example.com'))
+        lines = self.client.get('/api/partner/orders/').json()['Orders'][0]['ordered_items']
+        self.assertEqual([line['id'] for line in lines],
+                         list(OrderItem.objects.filter(order=self.order).order_by('id').values_list('id', flat=True)))
+        self.assertEqual([line['product_info'] for line in lines],
+                         [self.infos[0].pk, self.infos[2].pk, self.infos[1].pk])
+
+    def test_streamed_order_history(self):
+        # У пользователя одна корзина: следующие заказы оформляются из новых
+        self.basket.delete()
+        for infos in ([self.infos[1]], [self.infos[2], self.infos[3]], [self.infos[0]]):
+            with self.captureOnCommitCallbacks(execute=True):
+                inventory.confirm_order(self.make_basket(infos).pk, self.user, self.contact)
+        orders = Order.objects.filter(user=self.user).exclude(state='basket').order_by('-confirmed_at', '-id')
+        expected = JSONRenderer().render(OrderSerializer(orders, many=True).data)
+        response = self.client.get('/api/order/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), expected)
+        # Пачки меньше истории: заказы на стыках пачек не теряются и не повторяются
+        self.assertEqual(b''.join(fastjson.iter_array(iter_orders(orders, batch_size=2), chunk_size=3)), expected)
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class QueryBudgetTests(QueryBudgetMixin, TemporaryMediaMixin, APITransactionTestCase):
+    """
+    Представления укладываются в свои query_budget на «холодном» пути: кэши пусты, корзина
+    ещё не создана. Транзакции фиксируются, поэтому работа on_commit тоже попадает в замер.
+    """
+
+    def setUp(self):
+        self.partner = User.objects.create_user(email='partner@example.com', type='shop', is_active=True)
+        self.shop = Shop.objects.create(name='Связной', user=self.partner)
+        category = Category.objects.create(name='Смартфоны')
+        parameter = Parameter.objects.create(name='Цвет')
+        self.infos = []
+        for number in range(5):
+            info = ProductInfo.objects.create(product=Product.objects.create(name=f'Товар {number}', category=category),
+                                              shop=self.shop, external_id=number, price=100 + number, price_rrc=100,
+                                              quantity=10)
+            ProductParameter.objects.create(product_info=info, parameter=parameter, value='чёрный')
+            self.infos.append(info)
+        self.user = User.objects.create_user(email='buyer@example.com', password='Secret-pass-123', is_active=True)
+        self.contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', house='1', phone='1')
+
+    def client_for(self, user: User | None) -> APIClient:
+        client = APIClient()
+        client.default_format = 'json'
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=user).key}')
+        return client
+
+    def fetch(self, budget: int, user: User | None, method: str, url: str, data=None, **extra):
+        """
+        Запрос с пустыми кэшами: токенов, состояний магазинов и каталога.
+        """
+        for alias in ('default', 'shared', 'catalog'):
+            caches[alias].clear()
+        token_cache.clear()
+        client = self.client_for(user)
+        with self.assertMaxQueries(budget):
+            return getattr(client, method)(url, data, **extra)
+
+    def fill_basket(self) -> Order:
+        order = Order.objects.create(user=self.user, state='basket')
+        for info in self.infos[:3]:
+            OrderItem.objects.create(order=order, product_info=info, quantity=1)
+        return order
+
+    @override_settings(EMAIL_OUTBOX_EAGER=True)
+    def test_register(self):
+        response = self.fetch(RegisterView.query_budget, None, 'post', '/api/user/register/', {
+            'email': 'new@example.com', 'password': 'Secret-pass-123', 'first_name': 'Иван', 'last_name': 'Иванов',
+        })
+        self.assertEqual(response.status_code, 201)
+
+    def test_login_with_legacy_hash(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('Secret-pass-123', hasher='scrypt'))
+        response = self.fetch(LoginView.query_budget, None, 'post', '/api/user/login/',
+                              {'email': self.user.email, 'password': 'Secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('pbkdf2_sha256$'))
+
+    def test_cart(self):
+        self.assertEqual(self.fetch(CartView.query_budget, self.user, 'get', '/api/cart/').status_code, 200)
+
+    def test_cart_add(self):
+        response = self.fetch(CartAddView.query_budget, self.user, 'post', '/api/cart/add/',
+                              {'product_info': self.infos[0].pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+
+    def test_cart_remove(self):
+        item = self.fill_basket().ordered_items.first()
+        response = self.fetch(CartRemoveView.query_budget, self.user, 'post', '/api/cart/remove/',
+                              {'item_id': item.pk})
+        self.assertEqual(response.status_code, 200)
+
+    def test_cart_batch(self):
+        operations = [{'op': 'add', 'product_info': self.infos[0].pk},
+                      {'op': 'set', 'product_info': self.infos[1].pk, 'quantity': 3},
+                      {'op': 'remove', 'product_info': self.infos[2].pk}]
+        for operations in (operations, operations * 10):
+            Order.objects.filter(user=self.user).delete()
+            response = self.fetch(CartBatchView.query_budget, self.user, 'post', '/api/cart/batch/',
+                                  {'operations': operations})
+            self.assertEqual(response.status_code, 200)
+
+    def test_contacts(self):
+        self.assertEqual(self.fetch(ContactListView.query_budget, self.user, 'get', '/api/contacts/').status_code, 200)
+        response = self.fetch(ContactCreateView.query_budget, self.user, 'post', '/api/contacts/add/',
+                              {'city': 'Казань', 'street': 'Баумана', 'house': '2', 'phone': '2'})
+        self.assertEqual(response.status_code, 201)
+        Order.objects.create(user=self.user, state='confirmed', contact=self.contact)
+        response = self.fetch(ContactDeleteView.query_budget, self.user, 'delete', f'/api/contacts/{self.contact.pk}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_orders(self):
+        order = self.fill_basket()
+        self.assertTrue(inventory.confirm_order(order.pk, self.user, self.contact))
+        self.assertEqual(self.fetch(OrderListView.query_budget, self.user, 'get', '/api/order/').status_code, 200)
+        response = self.fetch(OrderDetailView.query_budget, self.user, 'get', f'/api/order/{order.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_partner(self):
+        order = self.fill_basket()
+        inventory.confirm_order(order.pk, self.user, self.contact)
+        Order.objects.filter(pk=order.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        price_list = SimpleUploadedFile('price.yaml', PRICE_LIST)
+        response = self.fetch(PartnerUpdate.query_budget(None), self.partner, 'post', '/api/partner/update/',
+                              {'file': price_list}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['Job']['id']
+        for budget, url in ((PartnerUpdateStatus.query_budget, f'/api/partner/update/{job_id}/'),
+                            (PartnerOrderFeed.query_budget, '/api/partner/orders/'),
+                            (PartnerRevenue.query_budget, '/api/partner/revenue/'),
+                            (PartnerState.query_budget, '/api/partner/state/')):
+            with self.subTest(url=url):
+                self.assertEqual(self.fetch(budget, self.partner, 'get', url).status_code, 200)
+        response = self.fetch(PartnerState.query_budget, self.partner, 'post', '/api/partner/state/', {'state': False})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(IMPORT_JOBS_EAGER=True)
+    def test_partner_update_eager_has_no_budget(self):
+        price_list = SimpleUploadedFile('price.yaml', PRICE_LIST)
+        response = self.client_for(self.partner).post('/api/partner/update/', {'file': price_list},
+                                                      format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.metrics.budget)
+
+    def test_products(self):
+        budget = ProductListView.query_budget
+        for method in ('get', 'head'):
+            with self.subTest(method=method):
+                response = self.fetch(budget[method.upper()], None, method, '/api/products/',
+                                      {'param': 'Цвет:чёрный', 'facets': '1'})
+                self.assertEqual(response.status_code, 200)
+        response = self.fetch(budget['GET'], None, 'get', f'/api/products/{self.infos[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+        response = self.fetch(ProductExportView.query_budget, None, 'get', '/api/products/export/',
+                              {'shop': self.shop.pk})
+        self.assertEqual(response.status_code, 200)
+        response = self.fetch(budget['PATCH'], self.partner, 'patch', f'/api/products/{self.infos[0].pk}/',
+                              {'price': 500})
+        self.assertEqual(response.status_code, 200)
+        response = self.fetch(budget['DELETE'], self.partner, 'delete', f'/api/products/{self.infos[1].pk}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_metrics(self):
+        admin = User.objects.create_user(email='admin@example.com', is_active=True, is_staff=True)
+        self.assertEqual(self.fetch(MetricsView.query_budget, admin, 'get', '/api/metrics/').status_code, 200)
+        self.assertEqual(self.fetch(MetricsView.query_budget, admin, 'delete', '/api/metrics/').status_code, 204)
+
+
+class ConcurrentCartTests(APITransactionTestCase):
+    """
+    Параллельные добавления и пакетные изменения одной корзины (UPSERT в shop.utils.cart)
+    не теряют увеличений и не создают второй корзины или повторной позиции.
+    """
+    threads = 8
+    rounds = 25
+
+    def setUp(self):
+        shop = Shop.objects.create(name='Связной')
+        category = Category.objects.create(name='Смартфоны')
+        self.infos = [
+            ProductInfo.objects.create(product=Product.objects.create(name=f'Товар {number}', category=category),
+                                       shop=shop, external_id=number, price=100, price_rrc=100, quantity=1000)
+            for number in range(self.threads + 3)
+        ]
+        self.user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        token_cache.clear()
+
+    def worker(self, number: int, barrier: threading.Barrier, errors: list[BaseException]) -> None:
+        client = APIClient()
+        client.default_format = 'json'
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=self.user).key}')
+        shared = self.infos[:3]
+        try:
+            barrier.wait()
+            for round_number in range(self.rounds):
+                info = shared[round_number % len(shared)]
+                response = client.post('/api/cart/add/', {'product_info': info.pk, 'quantity': 1})
+                self.assertEqual(response.status_code, 201, response.content)
+                # Свой товар у каждого потока: set задаёт количество, add к общему товару — увеличивает
+                response = client.post('/api/cart/batch/', {'operations': [
+                    {'op': 'set', 'product_info': self.infos[3 + number].pk, 'quantity': round_number + 1},
+                    {'op': 'add', 'product_info': info.pk, 'quantity': 2},
+                ]})
+                self.assertEqual(response.status_code, 200, response.content)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_add_and_batch(self):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+        threads = [threading.Thread(target=self.worker, args=(number, barrier, errors))
+                   for number in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        basket = Order.objects.get(user=self.user, state='basket')
+        rows = list(OrderItem.objects.filter(order=basket).values_list('product_info_id', 'quantity'))
+        self.assertEqual(len(rows), len({product_info_id for product_info_id, _ in rows}))
+
+        expected = Counter()
+        for round_number in range(self.rounds):
+            expected[self.infos[round_number % 3].pk] += 3 * self.threads
+        for number in range(self.threads):
+            expected[self.infos[3 + number].pk] = self.rounds
+        self.assertEqual(dict(rows), dict(expected))
+
+    def test_product_retired_during_batch(self):
+        retired = self.infos[1]
+
+        class RetiringBackend(cart_ops.get_backend().__class__):
+            # Предложение снимается с продажи после проверки пакета, перед записью
+            def add_many(self, basket_id: int, quantities: dict[int, int]) -> None:
+                ProductInfo.objects.filter(pk=retired.pk).update(is_active=False)
+                super().add_many(basket_id, quantities)
+
+        # Очистки выполняются в обратном порядке: clear, затем возврат исходных бэкендов
+        self.addCleanup(cart_ops.BACKENDS.update, dict(cart_ops.BACKENDS))
+        self.addCleanup(cart_ops.BACKENDS.clear)
+        cart_ops.BACKENDS[connection.vendor] = RetiringBackend
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/cart/batch/', {'operations': [
+            {'op': 'add', 'product_info': self.infos[0].pk},
+            {'op': 'set', 'product_info': retired.pk, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['skipped'], [retired.pk])
+        self.assertEqual(list(OrderItem.objects.values_list('product_info_id', flat=True)), [self.infos[0].pk])
+
+
+class OrderStateReservationTests(APITestCase):
+    """
+    Резерв товара следует за статусом заказа, который меняет администратор.
+    """
+
+    def setUp(self):
+        shop = Shop.objects.create(name='Связной')
+        category = Category.objects.create(name='Смартфоны')
+        self.info = ProductInfo.objects.create(product=Product.objects.create(name='Телефон', category=category),
+                                               shop=shop, external_id=1, price=100, price_rrc=100, quantity=5)
+        self.user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        self.contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', house='1', phone='1')
+        self.order = Order.objects.create(user=self.user, state='basket')
+        OrderItem.objects.create(order=self.order, product_info=self.info, quantity=3)
+        self.client.force_authenticate(User.objects.create_user(email='admin@example.com', is_staff=True))
+
+    def set_state(self, state: str):
+        return self.client.patch(f'/api/order/{self.order.pk}/status/', {'state': state}, format='json')
+
+    def assertStock(self, quantity: int, reserved: bool):
+        self.info.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.info.quantity, quantity)
+        self.assertEqual(self.order.stock_reserved, reserved)
+
+    def test_canceled_order_is_reserved_again(self):
+        inventory.confirm_order(self.order.pk, self.user, self.contact)
+        self.assertEqual(self.set_state('canceled').status_code, 200)
+        self.assertStock(5, False)
+        self.assertEqual(self.set_state('confirmed').status_code, 200)
+        self.assertStock(2, True)
+        # Переход между зарезервированными состояниями резерв не меняет
+        self.assertEqual(self.set_state('assembled').status_code, 200)
+        self.assertStock(2, True)
+
+    def test_basket_moved_past_confirmation_is_reserved(self):
+        self.assertEqual(self.set_state('assembled').status_code, 200)
+        self.assertStock(2, True)
+        self.assertEqual(self.order.total, 300)
+        self.assertEqual(self.set_state('basket').status_code, 200)
+        self.assertStock(5, False)
+
+    def test_out_of_stock_is_rejected(self):
+        inventory.confirm_order(self.order.pk, self.user, self.contact)
+        self.set_state('canceled')
+        ProductInfo.objects.filter(pk=self.info.pk).update(quantity=1)
+        response = self.set_state('confirmed')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['items'], [{'product_info': self.info.pk, 'requested': 3, 'available': 1}])
+        self.assertStock(1, False)
+        self.assertEqual(self.order.state, 'canceled')
+
+
+class TokenCacheTests(APITestCase):
+    """
+    Сброс кэша токенов виден всем процессам, а общий кэш не хранит пользователей.
+    """
+
+    def setUp(self):
+        caches['shared'].clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        self.key = Token.objects.get(user=self.user).key
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def test_invalidation_in_another_process(self):
+        self.assertEqual(self.client.get('/api/contacts/').status_code, 200)
+        # Копии токенов этого процесса; сброс ниже выполняет «другой процесс»
+        entries = dict(token_cache._entries)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        token_cache._entries.update(entries)
+        self.assertEqual(self.client.get('/api/contacts/').status_code, 401)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='shared')
+    def test_shared_tier_stores_user_id_only(self):
+        self.assertEqual(self.client.get('/api/contacts/').status_code, 200)
+        data = caches['shared'].get(token_cache._shared_key(self.key))
+        self.assertEqual(set(data), {'user_id', 'is_active', 'version'})
+        self.assertEqual((data['user_id'], data['is_active']), (self.user.pk, True))
+
+        token_cache.clear()
+        token = token_cache.get(self.key)
+        self.assertEqual((token.key, token.user.email), (self.key, self.user.email))
+        self.assertEqual(token_cache.stats()['shared_hits'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.user.pk).save()
+        token_cache.clear()
+        self.assertIsNone(token_cache.get(self.key))
+
+
+class ImportJobLeaseTests(TemporaryMediaMixin, TestCase):
+    """
+    Задание упавшего воркера не остаётся в состоянии running навсегда.
+    """
+
+    def setUp(self):
+        caches[settings.IMPORT_JOBS_CACHE].clear()
+        self.user = User.objects.create_user(email='partner@example.com', type='shop', is_active=True)
+        self.job = ImportJob.objects.create(user=self.user, file=SimpleUploadedFile('price.yaml', PRICE_LIST))
+
+    def expire_lease(self):
+        ImportJob.objects.filter(pk=self.job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_expired_lease_is_reclaimed(self):
+        claimed = claim_next_job()
+        self.assertEqual((claimed.pk, claimed.state, claimed.attempts), (self.job.pk, 'running', 1))
+        self.assertIsNone(claim_next_job())
+
+        # Воркер жив, пока отмечается в кэше, даже после срока аренды в базе
+        jobs._heartbeat(self.job.pk)
+        self.expire_lease()
+        self.assertIsNone(claim_next_job())
+
+        caches[settings.IMPORT_JOBS_CACHE].delete(jobs._heartbeat_key(self.job.pk))
+        reclaimed = claim_next_job()
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (self.job.pk, 2))
+        self.assertNotEqual(reclaimed.lease, claimed.lease)
+        run_import_job(reclaimed)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.state, self.job.lease, self.job.lease_expires_at), ('done', '', None))
+
+    def test_job_that_keeps_killing_workers_fails(self):
+        path = self.job.file.path
+        for _ in range(jobs.MAX_ATTEMPTS):
+            self.assertIsNotNone(claim_next_job())
+            self.expire_lease()
+        self.assertIsNone(claim_next_job())
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.state, self.job.file.name), ('failed', ''))
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_job_file_is_deleted(self):
+        job = ImportJob.objects.create(user=self.user, file=SimpleUploadedFile('broken.yaml', b'goods: 1\n'))
+        path = job.file.path
+        run_import_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.file.name), ('failed', ''))
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(str(path).startswith(str(self.media_root)))
+
+
+class FastJSONTests(TestCase):
+    """
+    Быстрые кодировщики выдают те же байты, что JSONRenderer DRF.
+    """
+    data = {
+        'created_at': datetime(2025, 1, 2, 3, 4, 5, 678000, tzinfo=dt_timezone.utc),
+        'day': date(2025, 1, 2),
+        'name': gettext_lazy('Корзина'),
+        'text': 'строка\u2028с разделителем',
+        'big': 2 ** 70,
+        'total': Decimal('1.5'),
+        'nested': [{1: None, 'ok': True}],
+    }
+
+    def test_backends_match_drf(self):
+        expected = JSONRenderer().render(self.data)
+        for name in fastjson.available_backends():
+            if name == 'msgspec':
+                continue
+            with self.subTest(backend=name):
+                self.assertEqual(fastjson.dumps(self.data, fastjson.get_backend(name)), expected)
+                self.assertEqual(fastjson.loads(expected, fastjson.get_backend(name)), json.loads(expected))
+
+    @skipUnless('msgspec' in fastjson.available_backends(), 'msgspec is not installed')
+    def test_msgspec_differs_only_in_decimals(self):
+        backend = fastjson.get_backend('msgspec')
+        data = dict(self.data, total=1.5)
+        self.assertEqual(fastjson.dumps(data, backend), JSONRenderer().render(data))
+        self.assertEqual(fastjson.dumps({'total': Decimal('1.10')}, backend), b'{"total":1.10}')
+
+
+class OrderConfirmationTimeTests(APITestCase):
+    """
+    Заказы относятся ко времени оформления, а не ко времени создания корзины.
+    """
+
+    def setUp(self):
+        self.partner = User.objects.create_user(email='partner@example.com', type='shop', is_active=True)
+        shop = Shop.objects.create(name='Связной', user=self.partner)
+        category = Category.objects.create(name='Смартфоны')
+        info = ProductInfo.objects.create(product=Product.objects.create(name='Телефон', category=category),
+                                          shop=shop, external_id=1, price=100, price_rrc=100, quantity=5)
+        self.user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        self.contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', house='1', phone='1')
+        self.info = info
+        self.opened = timezone.now() - timedelta(days=3)
+        self.order = self.place_order(self.opened)
+
+    def place_order(self, opened) -> Order:
+        order = Order.objects.create(user=self.user, state='basket')
+        OrderItem.objects.create(order=order, product_info=self.info, quantity=2)
+        Order.objects.filter(pk=order.pk).update(dt=opened)
+        inventory.confirm_order(order.pk, self.user, self.contact)
+        order.refresh_from_db()
+        return order
+
+    def test_revenue_by_confirmation_day(self):
+        self.client.force_authenticate(self.partner)
+        today = timezone.localdate(self.order.confirmed_at).isoformat()
+        response = self.client.get('/api/partner/revenue/')
+        self.assertEqual([(row['day'], row['revenue']) for row in response.json()['Revenue']], [(today, 200)])
+        opened = timezone.localdate(self.opened).isoformat()
+        response = self.client.get('/api/partner/revenue/', {'dt_from': opened, 'dt_to': opened})
+        self.assertEqual(response.json()['Revenue'], [])
+
+    @override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DATETIME_FORMAT='%d.%m.%Y'))
+    def test_history_by_confirmation_time(self):
+        # Корзина открыта раньше, а оформлена позже первого заказа
+        later = self.place_order(self.opened - timedelta(days=1))
+        self.client.force_authenticate(self.user)
+        ids, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get('/api/order/', {'cursor': cursor, 'limit': 1})
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [order['id'] for order in response.json()['results']]
+            cursor = response.json()['next']
+        self.assertEqual(ids, [later.pk, self.order.pk])
+
+        today = timezone.localdate(later.confirmed_at).isoformat()
+        response = self.client.get('/api/order/', {'dt_from': today})
+        orders = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(sorted(order['id'] for order in orders), [self.order.pk, later.pk])
+
+    def test_order_created_outside_confirmation(self):
+        order = Order.objects.create(user=self.user, state='delivered')
+        self.assertIsNotNone(order.confirmed_at)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/order/', {'cursor': '', 'limit': 1})
+        response = self.client.get('/api/order/', {'cursor': response.json()['next'], 'limit': 1})
+        self.assertEqual([order['id'] for order in response.json()['results']], [self.order.pk])
+
+    @override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DATETIME_FORMAT='%d.%m.%Y'))
+    def test_partner_feed_cursor(self):
+        later = self.place_order(self.opened)
+        Order.objects.filter(pk__in=[self.order.pk, later.pk]).update(updated_at=timezone.now() - timedelta(minutes=1))
+        self.client.force_authenticate(self.partner)
+        response = self.client.get('/api/partner/orders/', {'limit': 1})
+        self.assertEqual([order['id'] for order in response.json()['Orders']], [self.order.pk])
+        response = self.client.get('/api/partner/orders/', {'limit': 1, 'cursor': response.json()['next']})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([order['id'] for order in response.json()['Orders']], [later.pk])
+
+
+class CatalogSignalTests(APITestCase):
+    """
+    Удаления и переносы предложений вне импорта сбрасывают кэш каталога, фасеты и документы.
+    """
+
+    def setUp(self):
+        for alias in ('default', 'shared', 'catalog'):
+            caches[alias].clear()
+        self.shop = Shop.objects.create(name='Связной')
+        self.phones = Category.objects.create(name='Смартфоны')
+        color = Parameter.objects.create(name='Цвет')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.info = ProductInfo.objects.create(product=Product.objects.create(name='Телефон', category=self.phones),
+                                                   shop=self.shop, external_id=1, price=100, price_rrc=100, quantity=5)
+            self.parameter = ProductParameter.objects.create(product_info=self.info, parameter=color, value='черный')
+
+    def products(self, **params) -> dict:
+        return self.client.get('/api/products/', params).json()
+
+    def test_deleted_parameter(self):
+        self.assertEqual(self.products(param='Цвет:черный', facets='1')['facets'], {'Цвет': {'черный': 1}})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parameter.delete()
+        self.assertEqual(self.products(param='Цвет:черный')['count'], 0)
+        self.assertEqual(self.products(facets='1')['facets'], {})
+        self.assertEqual(self.products()['results'][0]['parameters'], [])
+        self.assertEqual(self.products(name='черный')['count'], 0)
+
+    def test_deleted_offer(self):
+        self.assertEqual(self.products(shop=self.shop.pk)['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.info.delete()
+        self.assertEqual(self.products(shop=self.shop.pk)['count'], 0)
+        self.assertEqual(self.products(facets='1')['facets'], {})
+
+    def test_offer_moved_to_another_category(self):
+        tablets = Category.objects.create(name='Планшеты')
+        tablet = Product.objects.create(name='Планшет', category=tablets)
+        self.assertEqual(self.products(category=self.phones.pk)['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.info.product = tablet
+            self.info.save()
+        self.assertEqual(self.products(category=self.phones.pk)['count'], 0)
+        self.assertEqual(self.products(category=tablets.pk)['results'][0]['product'], 'Планшет')
+
+
+class PriceListImporterTests(TestCase):
+    """
+    Импорт прайс-листа: счётчики режима diff и ошибки данных.
+    """
+
+    def setUp(self):
+        self.partner = User.objects.create_user(email='partner@example.com', type='shop', is_active=True)
+
+    def price_list(self, *goods: dict) -> dict:
+        return {'shop': 'Связной', 'categories': [{'id': 1, 'name': 'Смартфоны'}], 'goods': [
+            dict({'category': 1, 'model': 'm', 'name': f'Товар {item["id"]}', 'price': 100, 'price_rrc': 100,
+                  'quantity': 5, 'parameters': {'Цвет': 'черный'}}, **item)
+            for item in goods
+        ]}
+
+    def test_invalid_update_is_a_price_list_error(self):
+        PriceListImporter(self.partner).run(self.price_list({'id': 1}))
+        with self.assertRaisesMessage(PriceListError, 'price must not be negative in product 1'):
+            PriceListImporter(self.partner).run(self.price_list({'id': 1, 'price': -5}))
+        self.assertEqual(ProductInfo.objects.get().price, 100)
+
+    def test_diff_import_counts(self):
+        stats = PriceListImporter(self.partner).run(self.price_list({'id': 1}, {'id': 2}, {'id': 3}))
+        self.assertEqual((stats.created, stats.updated, stats.unchanged, stats.retired), (3, 0, 0, 0))
+        ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+        stats = PriceListImporter(self.partner).run(self.price_list(
+            {'id': 1}, {'id': 2, 'price': 150, 'parameters': {'Цвет': 'белый'}}, {'id': 4}))
+        self.assertEqual((stats.rows, stats.created, stats.updated, stats.unchanged, stats.retired, stats.deleted),
+                         (3, 1, 1, 1, 1, 0))
+        offers = {external_id: (pk, price, is_active) for external_id, pk, price, is_active
+                  in ProductInfo.objects.values_list('external_id', 'id', 'price', 'is_active')}
+        self.assertEqual({external_id: offers[external_id][0] for external_id in ids}, ids)
+        self.assertEqual([offers[number][1:] for number in (1, 2, 3, 4)],
+                         [(100, True), (150, True), (100, False), (100, True)])
+        self.assertEqual(ProductParameter.objects.get(product_info_id=ids[2]).value, 'белый')
+
+        # Вернувшееся предложение снова продаётся под прежним id
+        stats = PriceListImporter(self.partner).run(self.price_list({'id': 1}, {'id': 3}))
+        self.assertEqual((stats.updated, stats.unchanged, stats.retired), (1, 1, 2))
+        self.assertTrue(ProductInfo.objects.get(pk=ids[3]).is_active)
+
+    def test_facet_counts_after_retire(self):
+        caches['catalog'].clear()
+        colors = {1: 'черный', 2: 'черный', 3: 'белый'}
+        goods = [{'id': pk, 'parameters': {'Цвет': color}} for pk, color in colors.items()]
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceListImporter(self.partner).run(self.price_list(*goods))
+        client = APIClient()
+        self.assertEqual(client.get('/api/products/', {'facets': 1}).json()['facets'],
+                         {'Цвет': {'белый': 1, 'черный': 2}})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceListImporter(self.partner).run(self.price_list(goods[0], goods[2]))
+        self.assertEqual(client.get('/api/products/', {'facets': 1}).json()['facets'],
+                         {'Цвет': {'белый': 1, 'черный': 1}})
+        data = client.get('/api/products/', {'facets': 1, 'param': 'Цвет:черный'}).json()
+        self.assertEqual((data['count'], data['facets']), (1, {'Цвет': {'черный': 1}}))
+
+    def test_order_snapshot_survives_replace_import(self):
+        PriceListImporter(self.partner).run(self.price_list({'id': 1}))
+        user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        contact = Contact.objects.create(user=user, city='Москва', street='Тверская', house='1', phone='1')
+        order = Order.objects.create(user=user, state='basket')
+        OrderItem.objects.create(order=order, product_info=ProductInfo.objects.get(), quantity=2)
+        inventory.confirm_order(order.pk, user, contact)
+
+        PriceListImporter(self.partner, mode='replace').run(self.price_list({'id': 1, 'price': 150, 'name': 'Новый'}))
+        item = OrderItem.objects.get()
+        self.assertIsNone(item.product_info_id)
+        client = APIClient()
+        client.force_authenticate(user)
+        data = client.get(f'/api/order/{order.pk}/').json()
+        self.assertEqual((data['ordered_items'], data['total']),
+                         ([{'id': item.pk, 'product': 'Товар 1', 'shop': 'Связной', 'price': 100, 'quantity': 2}], 200))
+
+    def test_yaml_goods_before_header(self):
+        for text in ("shop: Связной\ncategories: [{id: 1, name: Смартфоны}]\ngoods: [{id: 1}, {id: 2}]\n",
+                     "goods: [{id: 1}, {id: 2}]\ncategories: [{id: 1, name: Смартфоны}]\nshop: Связной\n"):
+            feed = feeds.read_yaml(StringIO(text))
+            self.assertEqual((feed.shop, [item['id'] for item in feed.goods]), ('Связной', [1, 2]))
+        with self.assertRaisesMessage(PriceListError, 'Missing one of required keys'):
+            feeds.read_yaml(StringIO('goods: []\nshop: Связной\n'))
+
+
+class ProductSearchTests(APITestCase):
+    """
+    Поиск по каталогу: все слова запроса, по началу слова.
+    """
+
+    def setUp(self):
+        caches['catalog'].clear()
+        shop = Shop.objects.create(name='Связной')
+        category = Category.objects.create(name='Смартфоны')
+        ProductInfo.objects.create(product=Product.objects.create(name='Телефон Ёлка', category=category),
+                                   shop=shop, external_id=1, model='iphone_15', price=100, price_rrc=100, quantity=5)
+
+    def names(self, query: str) -> list[str]:
+        return [item['product'] for item in self.client.get('/api/products/', {'name': query}).json()['results']]
+
+    def test_prefix_match(self):
+        self.assertEqual(self.names('теле елка'), ['Телефон Ёлка'])
+        self.assertEqual(self.names('телевизор'), [])
+        self.assertEqual(self.names('iphone_1'), ['Телефон Ёлка'])
+        if connection.vendor == 'sqlite':
+            # Подстрока внутри слова в SQLite не находится (в PostgreSQL её находят триграммы)
+            self.assertEqual(self.names('лефон'), [])
+
+    def test_like_pattern_escapes_wildcards(self):
+        self.assertEqual(search.like_pattern('iphone_15'), '%iphone\\_15%')
+        self.assertEqual(search.like_pattern('100%'), '%100\\%%')
+
+
+class ProductExportTests(APITestCase):
+    """
+    Выгрузка каталога магазина — прайс-лист, который можно загрузить обратно.
+    """
+
+    def setUp(self):
+        self.shop = Shop.objects.create(name='Связной')
+        category = Category.objects.create(name='Смартфоны')
+        ProductInfo.objects.create(product=Product.objects.create(name='Телефон', category=category),
+                                   shop=self.shop, external_id=1, model='m', price=100, price_rrc=100, quantity=5)
+
+    def test_shop_is_required(self):
+        response = self.client.get('/api/products/export/', {'category': Category.objects.get().pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'shop is required'})
+
+    def test_export_is_a_price_list(self):
+        response = self.client.get('/api/products/export/',
+                                   {'shop': self.shop.pk, 'category': Category.objects.get().pk})
+        self.assertEqual(response.status_code, 200)
+        feed = feeds.read_jsonl(iter(b''.join(response.streaming_content).splitlines()))
+        self.assertEqual(feed.shop, 'Связной')
+        self.assertEqual([(item['id'], item['name']) for item in feed.goods], [(1, 'Телефон')])
+
+
+class ProductDocumentTests(APITestCase):
+    """
+    Готовые документы предложений пишутся при изменении, а не при чтении каталога.
+    """
+
+    def setUp(self):
+        caches['catalog'].clear()
+        shop = Shop.objects.create(name='Связной')
+        product = Product.objects.create(name='Телефон', category=Category.objects.create(name='Смартфоны'))
+        self.info, = ProductInfo.objects.bulk_create([ProductInfo(product=product, shop=shop, external_id=1,
+                                                                  price=100, price_rrc=100, quantity=5)])
+
+    def test_read_does_not_write_documents(self):
+        response = self.client.get(f'/api/products/{self.info.pk}/')
+        self.assertEqual((response.status_code, response.json()['price']), (200, 100))
+        self.assertEqual(self.client.get('/api/products/').json()['results'][0]['id'], self.info.pk)
+        self.assertFalse(ProductDocument.objects.exists())
+
+        self.info.save()
+        self.assertEqual(fastjson.loads(ProductDocument.objects.get().data)['id'], self.info.pk)
+
+
+class KeysetPaginationTests(APITestCase):
+    """
+    Курсорная пагинация каталога: обход всех страниц выдаёт каждое предложение ровно один раз.
+    """
+
+    def setUp(self):
+        caches['catalog'].clear()
+        shop = Shop.objects.create(name='Связной')
+        category = Category.objects.create(name='Смартфоны')
+        # Повторяющиеся цены и количества: порядок внутри них задаёт id
+        for number, (price, quantity) in enumerate([(300, 1), (100, 5), (200, 1), (100, 2), (300, 5), (100, 1),
+                                                    (200, 2)]):
+            ProductInfo.objects.create(product=Product.objects.create(name=f'Товар {number}', category=category),
+                                       shop=shop, external_id=number, price=price, price_rrc=price, quantity=quantity)
+
+    def walk(self, ordering: str | None) -> list[int]:
+        ids, params = [], {'cursor': '', 'limit': 3, 'count': 1}
+        if ordering:
+            params['ordering'] = ordering
+        while True:
+            data = self.client.get('/api/products/', params).json()
+            self.assertEqual(data['count'], 7)
+            ids += [item['id'] for item in data['results']]
+            if data['next'] is None:
+                return ids
+            params['cursor'] = data['next']
+
+    def test_round_trip(self):
+        for ordering in (None, 'price', '-price', 'quantity', '-quantity'):
+            with self.subTest(ordering=ordering):
+                field = (ordering or 'id').lstrip('-')
+                expected = sorted(ProductInfo.objects.values_list(field, 'id'),
+                                  reverse=bool(ordering and ordering.startswith('-')))
+                self.assertEqual(self.walk(ordering), [pk for _, pk in expected])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/products/', {'cursor': 'garbage'})
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+        cursor = self.client.get('/api/products/', {'cursor': '', 'limit': 3, 'ordering': 'price'}).json()['next']
+        response = self.client.get('/api/products/', {'cursor': cursor, 'ordering': '-price'})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Cursor does not match ordering'}))
+
+
+class ShopStateTests(APITestCase):
+    """
+    Поставщик включает и выключает приём заказов; корзина и оформление это учитывают.
+    """
+
+    def setUp(self):
+        self.partner = User.objects.create_user(email='partner@example.com', type='shop', is_active=True)
+        self.shop = Shop.objects.create(name='Связной', user=self.partner)
+        category = Category.objects.create(name='Смартфоны')
+        self.info = ProductInfo.objects.create(product=Product.objects.create(name='Телефон', category=category),
+                                               shop=self.shop, external_id=1, price=100, price_rrc=100, quantity=5)
+        self.user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        self.contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', house='1', phone='1')
+        self.buyer = APIClient()
+        self.buyer.force_authenticate(self.user)
+        self.client.force_authenticate(self.partner)
+
+    def set_state(self, state) -> dict:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/partner/state/', {'state': state})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_toggle_order_acceptance(self):
+        self.assertEqual(self.buyer.post('/api/cart/add/', {'product_info': self.info.pk}).status_code, 201)
+        basket = Order.objects.get(user=self.user, state='basket')
+
+        self.assertEqual(self.set_state('off'), {'Status': True, 'State': False})
+        self.assertEqual(self.client.get('/api/partner/state/').json(), {'Status': True, 'State': False})
+        closed = [{'shop': self.shop.pk}]
+        response = self.buyer.post('/api/cart/add/', {'product_info': self.info.pk})
+        self.assertEqual((response.status_code, response.json()['items']), (409, closed))
+        response = self.buyer.post('/api/cart/batch/', {'operations': [{'op': 'add', 'product_info': self.info.pk}]},
+                                   format='json')
+        self.assertEqual((response.status_code, response.json()['items']), (409, closed))
+        response = self.buyer.post('/api/order/confirm/', {'order_id': basket.pk, 'contact_id': self.contact.pk})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(OrderItem.objects.get().quantity, 1)
+
+        self.assertEqual(self.set_state(True), {'Status': True, 'State': True})
+        self.assertEqual(self.buyer.post('/api/cart/add/', {'product_info': self.info.pk}).status_code, 201)
+        response = self.buyer.post('/api/order/confirm/', {'order_id': basket.pk, 'contact_id': self.contact.pk})
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_invalid_state(self):
+        response = self.client.post('/api/partner/state/', {'state': 'maybe'})
+        self.assertEqual((response.status_code, response.json()),
+                         (400, {'Status': False, 'Error': 'state must be true or false'}))
+        self.assertTrue(Shop.objects.get().state)
+
+
+class DisconnectingEmailBackend(locmem.EmailBackend):
+    """
+    Почтовый бэкенд, теряющий соединение после двух отправленных писем.
+    """
+
+    def send_messages(self, messages):
+        if len(mail.outbox) >= 2:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX_EAGER=False)
+class OutboxTests(TestCase):
+    """
+    Очередь писем: захват пачки с арендой, повторы с нарастающей задержкой.
+    """
+
+    def enqueue(self, count: int, **kwargs) -> list[OutboxEmail]:
+        return [outbox.enqueue(f'Письмо {number}', 'Текст', [f'user{number}@example.com'], **kwargs)
+                for number in range(count)]
+
+    def test_send_in_batches(self):
+        self.enqueue(5)
+        self.assertEqual(outbox.send_pending(batch_size=2), (5, 0))
+        self.assertEqual([message.subject for message in mail.outbox], [f'Письмо {number}' for number in range(5)])
+        self.assertEqual(set(OutboxEmail.objects.values_list('state', flat=True)), {'sent'})
+        self.assertEqual(outbox.send_pending(), (0, 0))
+
+    def test_lease(self):
+        self.enqueue(3)
+        claimed = outbox.claim_batch(2)
+        self.assertEqual(len(claimed), 2)
+        # Захваченные письма не достаются другому воркеру, пока не истечёт аренда
+        self.assertEqual([message.pk for message in outbox.claim_batch()], [OutboxEmail.objects.last().pk])
+        self.assertEqual(outbox.claim_batch(), [])
+        OutboxEmail.objects.filter(pk__in=[message.pk for message in claimed])\
+            .update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([message.pk for message in outbox.claim_batch()], [message.pk for message in claimed])
+
+    def test_retry_with_backoff(self):
+        broken, = self.enqueue(1, attachments=['/nonexistent/invoice.csv'])
+        for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+            started = timezone.now()
+            self.assertEqual(outbox.send_pending(), (0, 1))
+            broken.refresh_from_db()
+            self.assertEqual((broken.attempts, broken.lease), (attempt, ''))
+            if attempt < outbox.MAX_ATTEMPTS:
+                self.assertEqual(broken.state, 'pending')
+                self.assertGreaterEqual(broken.next_attempt_at, started + outbox.retry_delay(attempt))
+                # Пока задержка не прошла, письмо не отправляется
+                self.assertEqual(outbox.send_pending(), (0, 0))
+                OutboxEmail.objects.filter(pk=broken.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(broken.state, 'failed')
+        self.assertIn('invoice.csv', broken.error)
+        self.assertEqual(outbox.retry_delay(1), timedelta(seconds=30))
+        self.assertEqual(outbox.retry_delay(20), outbox.RETRY_MAX)
+
+    @override_settings(EMAIL_BACKEND='shop.tests.DisconnectingEmailBackend')
+    def test_connection_lost(self):
+        self.enqueue(4)
+        self.assertEqual(outbox.send_pending(), (2, 2))
+        states = list(OutboxEmail.objects.order_by('id').values_list('state', 'attempts'))
+        self.assertEqual(states, [('sent', 0), ('sent', 0), ('pending', 1), ('pending', 1)])
+
+
+@override_settings(EMAIL_OUTBOX_EAGER=False)
+class InvoiceTests(TemporaryMediaMixin, TestCase):
+    """
+    Накладные по оформленным заказам: письма покупателю, администраторам и поставщикам, сводки.
+    """
+
+    def setUp(self):
+        category = Category.objects.create(name='Смартфоны')
+        self.infos = []
+        for number, price in enumerate((100, 250), start=1):
+            partner = User.objects.create_user(email=f'shop{number}@example.com', type='shop', is_active=True)
+            shop = Shop.objects.create(name=f'Магазин {number}', user=partner)
+            self.infos.append(ProductInfo.objects.create(
+                product=Product.objects.create(name=f'Товар {number}', category=category), shop=shop,
+                external_id=number, price=price, price_rrc=price, quantity=10))
+        User.objects.create_user(email='admin@example.com', is_active=True, is_staff=True)
+        self.user = User.objects.create_user(email='buyer@example.com', is_active=True)
+        self.contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', house='1', phone='1')
+        self.order = self.place_order()
+
+    def place_order(self) -> Order:
+        order = Order.objects.create(user=self.user, state='basket')
+        for quantity, info in enumerate(self.infos, start=1):
+            OrderItem.objects.create(order=order, product_info=info, quantity=quantity)
+        inventory.confirm_order(order.pk, self.user, self.contact)
+        OutboxEmail.objects.all().delete()
+        return order
+
+    def invoice_emails(self) -> list[tuple[list[str], list[str]]]:
+        return [(message.recipients, [os.path.basename(path) for path in message.attachments])
+                for message in OutboxEmail.objects.order_by('id')]
+
+    def test_invoices_per_order(self):
+        call_command('send_invoices', workers=1, stdout=StringIO())
+        emails = self.invoice_emails()
+        self.assertEqual([recipients for recipients, _ in emails],
+                         [['buyer@example.com'], ['admin@example.com'], ['shop1@example.com'], ['shop2@example.com']])
+        self.assertEqual([len(attachments) for _, attachments in emails], [1, 2, 2, 2])
+
+        invoice, = invoices.load([self.order.pk])
+        self.assertEqual((invoice.total, invoice.address), (600, 'Москва, Тверская, 1'))
+        self.assertEqual(invoice.dt, Order.objects.get().confirmed_at)
+        path = invoices.render_cached(invoice, 'csv', self.infos[1].shop_id)
+        rows = list(csv.reader(StringIO(path.read_text(encoding='utf-8-sig'))))
+        line = [str(self.order.pk), invoice.dt.isoformat(), 'Магазин 2', 'Товар 2', '250', '2', '500']
+        self.assertEqual(rows, [invoices.CSV_COLUMNS, line])
+
+        # Повторный запуск не рассылает накладные второй раз
+        output = StringIO()
+        call_command('send_invoices', workers=1, stdout=output)
+        self.assertEqual((output.getvalue().strip(), OutboxEmail.objects.count()), ('No new orders', 4))
+
+    def test_cached_by_order_version(self):
+        invoice, = invoices.load([self.order.pk])
+        path = invoices.render_cached(invoice, 'html')
+        path.write_bytes(b'cached')
+        self.assertEqual(invoices.render_cached(invoice, 'html').read_bytes(), b'cached')
+
+        Order.objects.filter(pk=self.order.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        changed, = invoices.load([self.order.pk])
+        self.assertNotEqual(invoices.render_cached(changed, 'html'), path)
+        self.assertIn('Товар 1', invoices.render_cached(changed, 'html').read_text())
+
+    def test_digest(self):
+        second = self.place_order()
+        call_command('send_invoices', workers=1, digest=True, stdout=StringIO())
+        emails = self.invoice_emails()
+        self.assertEqual([recipients for recipients, _ in emails],
+                         [['buyer@example.com'], ['buyer@example.com'], ['admin@example.com'],
+                          ['shop1@example.com'], ['shop2@example.com']])
+        digest = Path(OutboxEmail.objects.get(recipients=['admin@example.com']).attachments[0])
+        orders = [row[0] for row in csv.reader(StringIO(digest.read_text(encoding='utf-8-sig')))][1:]
+        self.assertEqual(orders, [str(self.order.pk)] * 2 + [str(second.pk)] * 2)
+        self.assertFalse(Order.objects.filter(invoiced_at__isnull=True).exclude(state='basket').exists())
@@ -1,21 +1,29 @@
 from django.urls import path
 # from shop.views import PartnerUpdate, RegisterView, LoginView
-from shop.views.product import ProductListView, ProductDetailView
+from shop.views.product import ProductListView, ProductDetailView, ProductExportView
 from shop.views.registration import RegisterView, LoginView
-from shop.views.partner import PartnerUpdate
-from shop.views.cart import CartView, CartAddView, CartRemoveView
+from shop.views.partner import PartnerUpdate, PartnerUpdateStatus, PartnerOrderFeed, PartnerRevenue
+from shop.views.partner import PartnerState
+from shop.views.cart import CartView, CartAddView, CartRemoveView, CartBatchView
 from shop.views.contact import ContactListView, ContactCreateView, ContactDeleteView
 from shop.views.order import OrderConfirmView, OrderListView, OrderDetailView
 from shop.views.order import OrderStatusUpdateView
+from shop.views.metrics import MetricsView
 urlpatterns = [
     path('partner/update/', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/<int:pk>/', PartnerUpdateStatus.as_view(), name='partner-update-status'),
+    path('partner/state/', PartnerState.as_view(), name='partner-state'),
+    path('partner/orders/', PartnerOrderFeed.as_view(), name='partner-orders'),
+    path('partner/revenue/', PartnerRevenue.as_view(), name='partner-revenue'),
     path('user/register/', RegisterView.as_view(), name='user-register'),
     path('user/login/', LoginView.as_view(), name='user-login'),
+    path('products/export/', ProductExportView.as_view(), name='product-export'),
     path('products/<int:pk>/', ProductListView.as_view(), name='product-detail'),
     path('products/', ProductListView.as_view(), name='product-list'),
     path('cart/', CartView.as_view(), name='cart-view'),
     path('cart/add/', CartAddView.as_view(), name='cart-add'),
     path('cart/remove/', CartRemoveView.as_view(), name='cart-remove'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
     path('contacts/', ContactListView.as_view(), name='contact-list'),
     path('contacts/add/', ContactCreateView.as_view(), name='contact-add'),
     path('contacts/<int:pk>/', ContactDeleteView.as_view(), name='contact-delete'),
@@ -25,4 +33,5 @@ urlpatterns = [
 ]
 urlpatterns += [
     path('order/<int:pk>/status/', OrderStatusUpdateView.as_view(), name='order-status-update'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,223 @@
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F
+
+from shop.models import Order, OrderItem, ProductInfo
+from shop.utils import shop_state
+from shop.utils.inventory import ShopClosed
+
+ORDER_ITEM_TABLE = OrderItem._meta.db_table
+PRODUCT_INFO_TABLE = ProductInfo._meta.db_table
+
+
+def get_basket_id(user) -> int:
+    """
+    Возвращает id корзины пользователя, создавая её при необходимости.
+
+    Корзина у пользователя одна (ограничение unique_user_basket), поэтому
+    одновременные запросы не создадут вторую: проигравший вставку
+    просто читает корзину, созданную соседним запросом.
+    """
+    basket_id = Order.objects.filter(user=user, state='basket').values_list('id', flat=True).first()
+    if basket_id is not None:
+        return basket_id
+    Order.objects.bulk_create([Order(user=user, state='basket')], ignore_conflicts=True)
+    return Order.objects.filter(user=user, state='basket').values_list('id', flat=True).get()
+
+
+class UpsertBackend:
+    """
+    Добавление одним запросом: INSERT ... SELECT из активного предложения
+    с ON CONFLICT по (order, product_info), увеличивающим количество.
+    Синтаксис одинаков в SQLite (3.24+) и PostgreSQL.
+    """
+
+    # `WHERE` в SELECT обязателен: без него SQLite не отличает ON CONFLICT от соединения.
+    # Снимки названий заполняются при подтверждении заказа (shop.utils.inventory).
+    sql = (
+        f'INSERT INTO {ORDER_ITEM_TABLE} (order_id, product_info_id, quantity, product_name, shop_name) '
+        f"SELECT %s, id, %s, '', '' FROM {PRODUCT_INFO_TABLE} WHERE id = %s AND is_active{{condition}} "
+        f'ON CONFLICT (order_id, product_info_id) '
+        f'DO UPDATE SET quantity = {ORDER_ITEM_TABLE}.quantity + excluded.quantity'
+    )
+
+    def add(self, basket_id: int, product_info_id: int, quantity: int, closed: frozenset[int] = frozenset()) -> bool:
+        # Магазины, не принимающие заказы, исключаются тем же запросом
+        condition = f' AND shop_id NOT IN ({", ".join(["%s"] * len(closed))})' if closed else ''
+        with connection.cursor() as cursor:
+            cursor.execute(self.sql.format(condition=condition), [basket_id, quantity, product_info_id, *closed])
+            return cursor.rowcount > 0
+
+    def add_many(self, basket_id: int, quantities: dict[int, int]) -> None:
+        with connection.cursor() as cursor:
+            cursor.executemany(self.sql.format(condition=''),
+                               [[basket_id, quantity, pk] for pk, quantity in quantities.items()])
+
+
+class FallbackBackend:
+    """
+    Для прочих СУБД: атомарное увеличение через F(), вставка при отсутствии строки;
+    если строку успел вставить соседний запрос — повторное увеличение.
+    """
+
+    def add(self, basket_id: int, product_info_id: int, quantity: int, closed: frozenset[int] = frozenset()) -> bool:
+        if not ProductInfo.objects.filter(pk=product_info_id, is_active=True).exclude(shop_id__in=closed).exists():
+            return False
+        items = OrderItem.objects.filter(order_id=basket_id, product_info_id=product_info_id)
+        if items.update(quantity=F('quantity') + quantity):
+            return True
+        try:
+            with transaction.atomic():
+                OrderItem.objects.create(order_id=basket_id, product_info_id=product_info_id, quantity=quantity)
+        except IntegrityError:
+            items.update(quantity=F('quantity') + quantity)
+        return True
+
+    def add_many(self, basket_id: int, quantities: dict[int, int]) -> None:
+        for product_info_id, quantity in quantities.items():
+            self.add(basket_id, product_info_id, quantity)
+
+
+BACKENDS = {
+    'sqlite': UpsertBackend,
+    'postgresql': UpsertBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackBackend)()
+
+
+def add_item(basket_id: int, product_info_id: int, quantity: int = 1) -> bool:
+    """
+    Добавляет товар в корзину или увеличивает его количество, атомарно для параллельных запросов.
+
+    Состояния магазинов берутся из кэша процесса (shop.utils.shop_state), поэтому проверка
+    не добавляет запросов; магазин товара читается из базы, только если добавить его не удалось.
+
+    :return: False, если предложение не найдено или снято с продажи
+    :raises ShopClosed: если магазин товара не принимает заказы
+    """
+    closed = shop_state.closed_shop_ids()
+    if get_backend().add(basket_id, product_info_id, quantity, closed):
+        return True
+    if closed:
+        shop_id = ProductInfo.objects.filter(pk=product_info_id, is_active=True)\
+            .values_list('shop_id', flat=True).first()
+        if shop_id in closed:
+            raise ShopClosed('Shop is not accepting orders', [{'shop': shop_id}])
+    return False
+
+
+def remove_item(user, item_id: int) -> bool:
+    """
+    Удаляет позицию из корзины пользователя одним запросом.
+
+    :return: False, если позиция не найдена
+    """
+    deleted, _ = OrderItem.objects.filter(id=item_id, order__user=user, order__state='basket').delete()
+    return deleted > 0
+
+
+# Наибольшее число операций в одном пакетном запросе
+MAX_BATCH_OPERATIONS = 1000
+BATCH_OPERATIONS = ('add', 'set', 'remove')
+
+
+class InvalidCartOperation(ValueError):
+    """
+    Операция пакетного изменения корзины записана неверно или ссылается на несуществующий товар.
+    """
+
+
+def parse_operations(raw) -> list[tuple[str, int, int]]:
+    """
+    Проверяет список операций вида {"op": "add" | "set" | "remove", "product_info": id, "quantity": n}.
+    Для add количество по умолчанию 1 и должно быть положительным, для set — неотрицательным,
+    для remove не используется.
+
+    :return: Операции в виде (op, product_info_id, quantity)
+    :raises InvalidCartOperation: если операция записана неверно
+    """
+    if not isinstance(raw, list) or not raw:
+        raise InvalidCartOperation('operations must be a non-empty list')
+    if len(raw) > MAX_BATCH_OPERATIONS:
+        raise InvalidCartOperation(f'Too many operations: {len(raw)}, max {MAX_BATCH_OPERATIONS}')
+
+    operations = []
+    for number, item in enumerate(raw):
+        if not isinstance(item, dict) or item.get('op') not in BATCH_OPERATIONS:
+            raise InvalidCartOperation(f'Operation {number}: op must be one of {", ".join(BATCH_OPERATIONS)}')
+        product_info_id, quantity = item.get('product_info'), item.get('quantity', 1)
+        if type(product_info_id) is not int or type(quantity) is not int:
+            raise InvalidCartOperation(f'Operation {number}: product_info and quantity must be integers')
+        if quantity < (1 if item['op'] == 'add' else 0):
+            raise InvalidCartOperation(f'Operation {number}: invalid quantity {quantity}')
+        operations.append((item['op'], product_info_id, quantity))
+    return operations
+
+
+def fold_operations(operations: list[tuple[str, int, int]]) -> dict[int, tuple[str, int]]:
+    """
+    Сводит операции к одному действию на товар с сохранением их порядка:
+    ('add', n) — увеличить, ('set', n) — установить, ('remove', 0) — удалить.
+    """
+    result: dict[int, tuple[str, int]] = {}
+    for op, product_info_id, quantity in operations:
+        current = result.get(product_info_id)
+        if op == 'remove' or (op == 'set' and quantity == 0):
+            result[product_info_id] = ('remove', 0)
+        elif op == 'set':
+            result[product_info_id] = ('set', quantity)
+        elif current is None:
+            result[product_info_id] = ('add', quantity)
+        elif current[0] == 'remove':
+            result[product_info_id] = ('set', quantity)
+        else:
+            result[product_info_id] = (current[0], current[1] + quantity)
+    return result
+
+
+def apply_operations(basket_id: int, operations: list[tuple[str, int, int]]) -> list[int]:
+    """
+    Применяет пакет операций к корзине в одной транзакции: все добавляемые и
+    устанавливаемые товары проверяются одним запросом, затем выполняются
+    одно удаление, одна массовая вставка с заменой количества и пакет
+    атомарных увеличений.
+
+    Проверка идёт в той же транзакции, что и запись; в PostgreSQL строки предложений
+    блокируются до её конца. В SQLite блокировки строк нет, поэтому после записи
+    товары, снятые с продажи уже после проверки, убираются из корзины.
+
+    :return: id таких товаров (их позиций в корзине нет); обычно пустой список
+    :raises InvalidCartOperation: если часть товаров не найдена или снята с продажи
+    :raises ShopClosed: если магазин части товаров не принимает заказы
+    """
+    actions = fold_operations(operations)
+    needed = {pk for pk, (action, _) in actions.items() if action != 'remove'}
+    removed = [pk for pk, (action, _) in actions.items() if action == 'remove']
+    replaced = [OrderItem(order_id=basket_id, product_info_id=pk, quantity=quantity)
+                for pk, (action, quantity) in actions.items() if action == 'set']
+    added = {pk: quantity for pk, (action, quantity) in actions.items() if action == 'add'}
+
+    with transaction.atomic():
+        found = dict(ProductInfo.objects.select_for_update().filter(pk__in=needed, is_active=True)
+                     .order_by('id').values_list('id', 'shop_id'))
+        if needed - found.keys():
+            raise InvalidCartOperation(f'Products not found: {sorted(needed - found.keys())}')
+        closed = sorted(set(found.values()) & shop_state.closed_shop_ids())
+        if closed:
+            raise ShopClosed('Shop is not accepting orders', [{'shop': shop_id} for shop_id in closed])
+
+        if removed:
+            OrderItem.objects.filter(order_id=basket_id, product_info_id__in=removed).delete()
+        if replaced:
+            OrderItem.objects.bulk_create(replaced, update_conflicts=True, unique_fields=['order', 'product_info'],
+                                          update_fields=['quantity'])
+        if added:
+            get_backend().add_many(basket_id, added)
+
+        skipped = sorted(ProductInfo.objects.filter(pk__in=needed, is_active=False).values_list('id', flat=True))\
+            if needed else []
+        if skipped:
+            OrderItem.objects.filter(order_id=basket_id, product_info_id__in=skipped).delete()
+    return skipped
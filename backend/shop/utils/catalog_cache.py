@@ -0,0 +1,166 @@
+import hashlib
+import json
+import uuid
+from typing import Any, Iterable, Mapping
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Параметры фильтрации каталога: от них зависит число найденных товаров
+FILTER_PARAMS = ('category', 'shop', 'price_min', 'price_max', 'name', 'param')
+# Параметры запроса, от которых зависит ответ ProductListView
+LIST_PARAMS = FILTER_PARAMS + ('ordering', 'limit', 'offset', 'cursor', 'count', 'facets')
+# Параметры, которые могут повторяться в запросе (`param=Цвет:черный&param=Цвет:белый`)
+MULTI_PARAMS = ('param',)
+
+# Область, которая меняется при любом изменении каталога
+ALL = 'all'
+# Область, входящая во все ключи: её смена сбрасывает кэш целиком
+EPOCH = 'epoch'
+
+
+def _entries():
+    return caches[settings.CATALOG_CACHE]
+
+
+def _generations():
+    return caches[settings.CATALOG_CACHE_GENERATIONS]
+
+
+def _generation_key(scope: str) -> str:
+    return f'catalog:gen:{scope}'
+
+
+def get_generations(scopes: Iterable[str]) -> dict[str, str]:
+    """
+    Возвращает текущие поколения областей каталога, заводя недостающие.
+
+    Поколение — случайный токен, а не счётчик: если ключ поколения вытеснен
+    из кэша, новое значение гарантированно не совпадёт ни с одним старым.
+    """
+    keys = {scope: _generation_key(scope) for scope in scopes}
+    found = _generations().get_many(keys.values())
+    result = {}
+    for scope, key in keys.items():
+        if key not in found:
+            token = uuid.uuid4().hex
+            if not _generations().add(key, token, timeout=None):
+                token = _generations().get(key, token)
+            found[key] = token
+        result[scope] = found[key]
+    return result
+
+
+def bump(scopes: Iterable[str]) -> None:
+    """
+    Делает недействительными все записи, зависящие от указанных областей.
+    """
+    _generations().set_many({_generation_key(scope): uuid.uuid4().hex for scope in scopes}, timeout=None)
+
+
+def invalidate(shop_ids: Iterable[int] = (), category_ids: Iterable[int] = ()) -> None:
+    """
+    Сбрасывает кэш каталога для магазинов и категорий после фиксации транзакции.
+    """
+    scopes = [ALL, *(f'shop:{pk}' for pk in shop_ids), *(f'category:{pk}' for pk in category_ids)]
+    transaction.on_commit(lambda: bump(scopes))
+
+
+def invalidate_all() -> None:
+    """
+    Сбрасывает кэш каталога целиком (переименование товаров, параметров и т.п.).
+    """
+    transaction.on_commit(lambda: bump([EPOCH]))
+
+
+def _list_scopes(params: Mapping[str, str]) -> list[str]:
+    scopes = [EPOCH]
+    if params.get('shop'):
+        scopes.append(f'shop:{params["shop"]}')
+    if params.get('category'):
+        scopes.append(f'category:{params["category"]}')
+    if len(scopes) == 1:
+        scopes.append(ALL)
+    return scopes
+
+
+def _normalize(params: Mapping[str, str], name: str) -> str | list[str] | None:
+    # Отсутствующий параметр (None) отличается от пустого: `cursor=` включает курсорную пагинацию
+    if name not in params:
+        return None
+    if name in MULTI_PARAMS:
+        return sorted(value.strip() for value in params.getlist(name))
+    return params[name].strip()
+
+
+def _key(prefix: str, params: Mapping[str, str], names: Iterable[str]) -> str:
+    normalized = {name: _normalize(params, name) for name in names}
+    generations = get_generations(_list_scopes(normalized))
+    raw = json.dumps([normalized, generations], sort_keys=True)
+    return f'catalog:{prefix}:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def list_key(params: Mapping[str, str]) -> str:
+    """
+    Ключ списка товаров: нормализованные параметры запроса плюс поколения
+    магазина и категории из фильтра (или всего каталога, если фильтра нет).
+    """
+    return _key('list', params, LIST_PARAMS)
+
+
+def get_count(params: Mapping[str, str]) -> tuple[str, int | None]:
+    """
+    Возвращает ключ и закэшированное число товаров для набора фильтров (или None).
+    Не зависит от сортировки и пагинации, поэтому общее для всех страниц.
+    """
+    key = _key('count', params, FILTER_PARAMS)
+    return key, _entries().get(key)
+
+
+def set_count(key: str, count: int) -> None:
+    _entries().set(key, count, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_facets(params: Mapping[str, str]) -> tuple[str, Any]:
+    """
+    Возвращает ключ и закэшированные фасеты для набора фильтров (или None).
+    Как и число товаров, общие для всех страниц и сортировок.
+    """
+    key = _key('facets', params, FILTER_PARAMS)
+    return key, _entries().get(key)
+
+
+def set_facets(key: str, facets: Any) -> None:
+    _entries().set(key, facets, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_list(params: Mapping[str, str]) -> tuple[str, Any]:
+    """
+    Возвращает ключ и закэшированный ответ списка товаров (или None).
+    """
+    key = list_key(params)
+    return key, _entries().get(key)
+
+
+def set_list(key: str, data: Any) -> None:
+    _entries().set(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_detail(pk: int) -> Any:
+    """
+    Возвращает закэшированную карточку товара, если поколения его магазина
+    и категории не менялись с момента записи.
+    """
+    entry = _entries().get(f'catalog:detail:{pk}')
+    if entry is None:
+        return None
+    if get_generations(entry['generations']) != entry['generations']:
+        return None
+    return entry['data']
+
+
+def set_detail(pk: int, shop_id: int, category_id: int, data: Any) -> None:
+    generations = get_generations([EPOCH, f'shop:{shop_id}', f'category:{category_id}'])
+    _entries().set(f'catalog:detail:{pk}', {'generations': generations, 'data': data},
+                   timeout=settings.CATALOG_CACHE_TIMEOUT)
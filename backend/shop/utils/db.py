@@ -0,0 +1,73 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from typing import Any, Iterable, Iterator
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[list]:
+    """
+    Разбивает последовательность на списки фиксированного размера.
+
+    :param iterable: Исходная последовательность (может быть генератором)
+    :param size: Размер одной пачки
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+_bulk_changes: ContextVar[bool] = ContextVar('bulk_changes', default=False)
+
+
+@contextmanager
+def bulk_changes():
+    """
+    Изменения каталога внутри блока вызывающий код обрабатывает сам, одной пачкой
+    (как импорт прайс-листа): обработчики сигналов удаления (shop.signals) их пропускают.
+    """
+    token = _bulk_changes.set(True)
+    try:
+        yield
+    finally:
+        _bulk_changes.reset(token)
+
+
+def in_bulk_changes() -> bool:
+    return _bulk_changes.get()
+
+
+class QueryCounter:
+    """
+    Контекстный менеджер, считающий SQL-запросы и суммарное время их выполнения.
+
+    Работает через `connection.execute_wrapper`, поэтому не требует DEBUG=True.
+    """
+
+    def __init__(self, using: str = DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.count = 0
+        self.duration = 0.0
+        self._context = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+    def __enter__(self) -> 'QueryCounter':
+        self._context = self.connection.execute_wrapper(self)
+        self._context.__enter__()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._context.__exit__(*exc_info)
+        self._context = None
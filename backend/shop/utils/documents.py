@@ -0,0 +1,94 @@
+from typing import Iterable
+
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from shop import serializers
+from shop.models import ProductInfo, ProductDocument, ProductParameter
+from shop.utils import fastjson
+from shop.utils.db import chunked
+
+def render(data) -> bytes:
+    """
+    Кодирует данные так же, как JSONRenderer при обычном ответе DRF
+    (сам JSONRenderer превращает None в пустое тело, а не в `null`).
+    """
+    return fastjson.dumps(data)
+
+
+def build(ids: Iterable[int]) -> dict[int, bytes]:
+    """
+    Строит документы предложений (представление ProductInfoSerializer,
+    построенное его быстрым аналогом FastProductInfoSerializer), ничего не записывая.
+    """
+    infos = serializers.FastProductInfoSerializer(ProductInfo.objects.filter(pk__in=ids), many=True).data
+    return {info['id']: render(info) for info in infos}
+
+
+def rebuild(ids: Iterable[int]) -> int:
+    """
+    Пересобирает и сохраняет документы указанных предложений.
+
+    :return: Число записанных документов
+    """
+    written = 0
+    for batch in chunked(sorted(set(ids)), 500):
+        documents = [ProductDocument(product_info_id=pk, data=data) for pk, data in build(batch).items()]
+        ProductDocument.objects.bulk_create(documents, update_conflicts=True, unique_fields=['product_info'],
+                                            update_fields=['data'])
+        written += len(documents)
+    return written
+
+
+def rebuild_for_shop(shop_id: int) -> int:
+    return rebuild(ProductInfo.objects.filter(shop_id=shop_id).values_list('id', flat=True))
+
+
+def rebuild_for_product(product_id: int) -> int:
+    return rebuild(ProductInfo.objects.filter(product_id=product_id).values_list('id', flat=True))
+
+
+def rebuild_for_parameter(parameter_id: int) -> int:
+    return rebuild(ProductParameter.objects.filter(parameter_id=parameter_id).values_list('product_info_id', flat=True))
+
+
+def documents(rows: Iterable[tuple[int, bytes | memoryview | None]]) -> list[bytes]:
+    """
+    Возвращает документы строк (pk, data) в исходном порядке.
+
+    Документы записываются при изменении предложений (сигналы, импорт прайс-листа);
+    недостающие (например, до первого rebuild_product_documents) строятся в памяти,
+    чтобы чтение каталога ничего не писало в базу.
+    """
+    rows = list(rows)
+    missing = [pk for pk, data in rows if data is None]
+    built = build(missing) if missing else {}
+    return [bytes(data if data is not None else built[pk]) for pk, data in rows]
+
+
+def render_object(fields: dict) -> bytes:
+    """
+    Собирает JSON-объект из полей, часть которых уже закодирована (значения типа bytes),
+    в том же компактном виде, что и JSONRenderer.
+    """
+    parts = [
+        render(name) + b':' + (value if isinstance(value, bytes) else render(value))
+        for name, value in fields.items()
+    ]
+    return b'{' + b','.join(parts) + b'}'
+
+
+def render_list(items: list[bytes]) -> bytes:
+    return b'[' + b','.join(items) + b']'
+
+
+def document_response(request: Request, payload: bytes) -> HttpResponse | Response:
+    """
+    Отдаёт готовый JSON без повторной сериализации.
+    Для остальных рендереров (например, browsable API) данные декодируются обратно.
+    """
+    if isinstance(getattr(request, 'accepted_renderer', None), JSONRenderer):
+        return HttpResponse(payload, content_type=request.accepted_renderer.media_type)
+    return Response(fastjson.loads(payload))
@@ -1,17 +1,23 @@
-from django.core.mail import send_mail
-from django.conf import settings
+from shop.utils.outbox import enqueue
 
 
 def send_order_confirmation_email(user_email: str, order_id: int) -> None:
     """
-    Отправляет email-подтверждение пользователю о принятии заказа.
+    Ставит в очередь email-подтверждение пользователю о принятии заказа.
 
     :param user_email: Email пользователя
     :param order_id: Идентификатор заказа
     """
     subject = f'Ваш заказ №{order_id} подтвержден'
     message = f'Спасибо за заказ! Ваш заказ №{order_id} был успешно подтвержден и скоро будет обработан.'
-    from_email = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [user_email]
+    enqueue(subject, message, [user_email])
 
-    send_mail(subject, message, from_email, recipient_list)
+
+def send_welcome_email(user_email: str) -> None:
+    """
+    Ставит в очередь приветственное письмо после регистрации.
+
+    :param user_email: Email пользователя
+    """
+    enqueue('Добро пожаловать!', 'Вы успешно зарегистрировались на нашем сервисе. Спасибо, что выбрали нас!',
+            [user_email])
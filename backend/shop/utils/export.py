@@ -0,0 +1,105 @@
+import csv
+import io
+from typing import Iterator
+
+from django.db.models import QuerySet
+
+from shop.models import Category, ProductParameter, Shop
+from shop.utils import fastjson
+from shop.utils.db import chunked
+from shop.utils.feeds import CSV_PARAMETER_PREFIX
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_COLUMNS = ['id', 'category', 'category_name', 'name', 'model', 'price', 'price_rrc', 'quantity']
+
+# Сколько строк читается из базы за один fetch и кодируется одной пачкой
+CHUNK_SIZE = 2000
+
+ROW_FIELDS = ('id', 'external_id', 'product__category_id', 'product__category__name', 'product__name', 'model',
+              'price', 'price_rrc', 'quantity')
+
+
+def iter_rows(queryset: QuerySet, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Выдаёт предложения выборки в виде товаров прайс-листа (как в goods) по одному.
+
+    Строки читаются серверным курсором по chunk_size, параметры подтягиваются
+    одним запросом на пачку, поэтому память не зависит от размера каталога.
+    """
+    rows = queryset.order_by('id').values_list(*ROW_FIELDS).iterator(chunk_size=chunk_size)
+    for batch in chunked(rows, chunk_size):
+        parameters: dict[int, dict[str, str]] = {}
+        values = ProductParameter.objects.filter(product_info_id__in=[row[0] for row in batch])\
+            .order_by('id').values_list('product_info_id', 'parameter__name', 'value')
+        for info_id, name, value in values:
+            parameters.setdefault(info_id, {})[name] = value
+
+        for pk, external_id, category, category_name, name, model, price, price_rrc, quantity in batch:
+            yield {
+                'id': external_id,
+                'category': category,
+                'category_name': category_name,
+                'name': name,
+                'model': model,
+                'price': price,
+                'price_rrc': price_rrc,
+                'quantity': quantity,
+                'parameters': parameters.get(pk, {}),
+            }
+
+
+def categories_of(queryset: QuerySet) -> list[dict]:
+    """
+    Категории, встречающиеся в выборке, в виде заголовка прайс-листа.
+    """
+    ids = queryset.order_by().values('product__category_id')
+    return [{'id': pk, 'name': name}
+            for pk, name in Category.objects.filter(pk__in=ids).order_by('id').values_list('id', 'name')]
+
+
+def iter_jsonl(queryset: QuerySet, shop: Shop) -> Iterator[bytes]:
+    """
+    JSON Lines в формате read_jsonl: заголовок {shop, categories}, затем по товару в строке.
+    """
+    header = {'shop': shop.name, 'categories': categories_of(queryset)}
+    yield fastjson.dumps(header) + b'\n'
+    yield from fastjson.iter_lines(iter_rows(queryset), CHUNK_SIZE)
+
+
+def iter_csv(queryset: QuerySet) -> Iterator[bytes]:
+    """
+    CSV в формате read_csv: колонки товара и по колонке `param:<название>` на каждый параметр выборки.
+    """
+    names = sorted(set(ProductParameter.objects.filter(product_info__in=queryset.order_by().values('id'))
+                       .values_list('parameter__name', flat=True).distinct()))
+    columns = CSV_COLUMNS + [CSV_PARAMETER_PREFIX + name for name in names]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # BOM, чтобы Excel открывал файл в UTF-8; read_csv его пропускает
+    yield ('\ufeff' + buffer.getvalue()).encode()
+
+    for batch in chunked(iter_rows(queryset), CHUNK_SIZE):
+        buffer.seek(0)
+        buffer.truncate()
+        for item in batch:
+            row = [item[column] for column in CSV_COLUMNS]
+            row.extend(item['parameters'].get(name, '') for name in names)
+            writer.writerow(row)
+        yield buffer.getvalue().encode()
+
+
+def export(queryset: QuerySet, fmt: str, shop: Shop) -> Iterator[bytes]:
+    """
+    Потоковая выгрузка предложений магазина в формате, который принимает PartnerUpdate.
+
+    :raises ValueError: если формат не поддерживается
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+    return iter_jsonl(queryset, shop) if fmt == 'jsonl' else iter_csv(queryset)
@@ -0,0 +1,173 @@
+from typing import Iterable
+
+from django.db.models import Count, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+
+from shop.models import FacetValue, ProductFacet, ProductParameter
+from shop.utils.db import chunked
+
+# Разделитель имени параметра и значения в фильтре `param=Цвет:черный`
+PARAM_SEPARATOR = ':'
+
+
+class InvalidFacetFilter(ValueError):
+    """
+    Фильтр по параметру записан не в виде `Имя:Значение`.
+    """
+
+
+def parse_filters(raw: Iterable[str]) -> dict[str, set[str]]:
+    """
+    Разбирает фильтры `Имя:Значение` в словарь имя параметра -> допустимые значения.
+    Несколько значений одного параметра объединяются по ИЛИ, разные параметры — по И.
+
+    :raises InvalidFacetFilter: если фильтр записан неверно
+    """
+    filters: dict[str, set[str]] = {}
+    for item in raw:
+        name, separator, value = item.partition(PARAM_SEPARATOR)
+        name, value = name.strip(), value.strip()
+        if not separator or not name or not value:
+            raise InvalidFacetFilter(f'Invalid parameter filter: {item!r}, expected "Name:Value"')
+        filters.setdefault(name, set()).add(value)
+    return filters
+
+
+def filter_products(queryset: QuerySet, raw: Iterable[str]) -> QuerySet:
+    """
+    Оставляет в выборке предложения, подходящие под все фильтры по параметрам.
+
+    Вместо отдельного соединения с ProductParameter на каждый параметр выполняется
+    один проход по индексу ProductFacet: у предложения одно значение каждого параметра,
+    поэтому оно подходит, если число совпавших значений равно числу параметров в фильтре.
+
+    :raises InvalidFacetFilter: если фильтр записан неверно
+    """
+    filters = parse_filters(raw)
+    if not filters:
+        return queryset
+
+    groups: dict[str, list[int]] = {}
+    values = FacetValue.objects.filter(parameter__name__in=filters)\
+        .values_list('id', 'parameter__name', 'value')
+    for pk, name, value in values:
+        if value in filters[name]:
+            groups.setdefault(name, []).append(pk)
+    if len(groups) < len(filters):
+        return queryset.none()
+
+    matched = ProductFacet.objects.filter(facet_value_id__in=[pk for ids in groups.values() for pk in ids])\
+        .values('product_info_id').annotate(matches=Count('id')).filter(matches=len(groups))\
+        .values('product_info_id')
+    return queryset.filter(pk__in=matched)
+
+
+def _group(rows: Iterable[tuple[str, str, int]]) -> dict[str, dict[str, int]]:
+    result: dict[str, dict[str, int]] = {}
+    for name, value, count in sorted(rows, key=lambda row: (row[0], -row[2], row[1])):
+        result.setdefault(name, {})[value] = count
+    return result
+
+
+def count_facets(queryset: QuerySet) -> dict[str, dict[str, int]]:
+    """
+    Считает число предложений выборки по каждому значению каждого параметра.
+
+    Группировка идёт по целочисленному facet_value_id, строки подтягиваются
+    отдельным запросом только для найденных значений.
+
+    :return: {имя параметра: {значение: число предложений}}
+    """
+    counts = dict(
+        ProductFacet.objects.filter(product_info_id__in=queryset.order_by().values('id'))
+        .values('facet_value_id').annotate(count=Count('id')).values_list('facet_value_id', 'count')
+    )
+    names = FacetValue.objects.filter(pk__in=list(counts)).values_list('id', 'parameter__name', 'value')
+    return _group((name, value, counts[pk]) for pk, name, value in names)
+
+
+def catalog_facets() -> dict[str, dict[str, int]]:
+    """
+    Фасеты всего каталога из предпосчитанных FacetValue.product_count.
+    """
+    return _group(FacetValue.objects.filter(product_count__gt=0).values_list('parameter__name', 'value',
+                                                                            'product_count'))
+
+
+def _resolve_values(pairs: set[tuple[int, str]]) -> dict[tuple[int, str], int]:
+    """
+    Возвращает id значений фасетов для пар (parameter_id, value), создавая недостающие.
+    """
+    def lookup() -> dict[tuple[int, str], int]:
+        found = FacetValue.objects.filter(parameter_id__in={parameter for parameter, _ in pairs},
+                                          value__in={value for _, value in pairs})\
+            .values_list('parameter_id', 'value', 'id')
+        return {(parameter, value): pk for parameter, value, pk in found if (parameter, value) in pairs}
+
+    resolved = lookup()
+    missing = pairs - resolved.keys()
+    if missing:
+        FacetValue.objects.bulk_create(
+            [FacetValue(parameter_id=parameter, value=value) for parameter, value in missing], ignore_conflicts=True
+        )
+        resolved = lookup()
+    return resolved
+
+
+def reindex(ids: Iterable[int]) -> set[int]:
+    """
+    Приводит строки ProductFacet указанных предложений к их текущим параметрам.
+
+    Счётчики не пересчитываются: вызывающий код собирает затронутые значения
+    и передаёт их в `recount` один раз (например, в конце импорта).
+
+    :return: id значений фасетов, у которых изменился состав предложений
+    """
+    touched: set[int] = set()
+    for batch in chunked(sorted(set(ids)), 1000):
+        parameters = list(ProductParameter.objects.filter(product_info_id__in=batch)
+                          .values_list('product_info_id', 'parameter_id', 'value'))
+        values = _resolve_values({(parameter, value) for _, parameter, value in parameters})
+        desired = {(info_id, values[(parameter, value)]) for info_id, parameter, value in parameters}
+
+        current = {
+            (info_id, value_id): pk
+            for pk, info_id, value_id in ProductFacet.objects.filter(product_info_id__in=batch)
+            .values_list('id', 'product_info_id', 'facet_value_id')
+        }
+        new = desired - current.keys()
+        stale = [pk for key, pk in current.items() if key not in desired]
+
+        ProductFacet.objects.bulk_create([ProductFacet(product_info_id=info_id, facet_value_id=value_id)
+                                          for info_id, value_id in new])
+        if stale:
+            ProductFacet.objects.filter(pk__in=stale).delete()
+        touched.update(value_id for _, value_id in new)
+        touched.update(value_id for info_id, value_id in current if (info_id, value_id) not in desired)
+    return touched
+
+
+def values_of(ids: Iterable[int] | QuerySet) -> set[int]:
+    """
+    Значения фасетов предложений — их счётчики меняются при снятии с продажи или удалении.
+    """
+    return set(ProductFacet.objects.filter(product_info_id__in=ids).values_list('facet_value_id', flat=True)
+               .distinct())
+
+
+def recount(value_ids: Iterable[int]) -> None:
+    """
+    Пересчитывает число активных предложений для указанных значений фасетов.
+    """
+    active = ProductFacet.objects.filter(facet_value_id=OuterRef('pk'), product_info__is_active=True).order_by()\
+        .values('facet_value_id').annotate(count=Count('id')).values('count')
+    for batch in chunked(sorted(set(value_ids)), 500):
+        FacetValue.objects.filter(pk__in=batch).update(product_count=Coalesce(Subquery(active), 0))
+
+
+def update(ids: Iterable[int]) -> None:
+    """
+    Обновляет фасеты и счётчики предложений после изменения их параметров или статуса.
+    """
+    ids = list(ids)
+    recount(reindex(ids) | values_of(ids))
@@ -0,0 +1,199 @@
+import json
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils import encoders
+
+from shop.utils.db import chunked
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # необязательная зависимость
+    msgspec = None
+
+# Порядок выбора кодировщика при JSON_BACKEND = 'auto'
+BACKEND_PRIORITY = ('orjson', 'msgspec', 'json')
+
+_drf_encoder = encoders.JSONEncoder()
+
+
+def _default(obj: Any) -> Any:
+    """
+    Типы, которых нет в быстром кодировщике (Decimal, timedelta, QuerySet, lazy-строки и т.п.),
+    приводятся так же, как в DRF: Decimal -> float, timedelta -> секунды строкой и т.д.
+    (msgspec кодирует Decimal сам, см. MsgspecBackend).
+    """
+    return _drf_encoder.default(obj)
+
+
+def _escape_separators(raw: bytes) -> bytes:
+    # Как и JSONRenderer, экранируем U+2028/U+2029, чтобы ответ оставался подмножеством JavaScript
+    if b'\xe2\x80\xa8' in raw or b'\xe2\x80\xa9' in raw:
+        raw = raw.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return raw
+
+
+class StdlibBackend:
+    """
+    Стандартный модуль json с настройками JSONRenderer (компактно, UTF-8, без NaN).
+    """
+    name = 'json'
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, allow_nan=False,
+                          separators=(',', ':')).encode()
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw, parse_constant=_reject_constant)
+
+
+def _reject_constant(value: str):
+    # NaN и Infinity не входят в JSON (как STRICT_JSON в DRF)
+    raise ValueError(f'Out of range float values are not JSON compliant: {value!r}')
+
+
+class OrjsonBackend:
+    """
+    orjson: datetime/date/time, UUID и dataclass кодируются нативно (UTC — с суффиксом Z, как в DRF).
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        self.options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=_default, option=self.options)
+
+    def loads(self, raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+
+class MsgspecBackend:
+    """
+    msgspec: datetime кодируются нативно.
+
+    Decimal msgspec тоже кодирует сам, минуя enc_hook, поэтому вывод отличается от DRF:
+    число пишется в записи Decimal (Decimal('1.10') -> 1.10, в DRF — float: 1.1).
+    Значения при разборе совпадают, байты — нет. Сериализаторы DRF отдают Decimal
+    строками (COERCE_DECIMAL_TO_STRING), а в моделях магазина Decimal нет.
+    """
+    name = 'msgspec'
+
+    def __init__(self):
+        try:
+            self.encoder = msgspec.json.Encoder(enc_hook=_default, decimal_format='number')
+        except TypeError:  # старые версии без decimal_format: Decimal уходит в enc_hook
+            self.encoder = msgspec.json.Encoder(enc_hook=_default)
+        self.decoder = msgspec.json.Decoder()
+
+    def dumps(self, data: Any) -> bytes:
+        return self.encoder.encode(data)
+
+    def loads(self, raw: bytes) -> Any:
+        return self.decoder.decode(raw)
+
+
+BACKENDS = {
+    'orjson': (OrjsonBackend, lambda: orjson is not None),
+    'msgspec': (MsgspecBackend, lambda: msgspec is not None),
+    'json': (StdlibBackend, lambda: True),
+}
+
+_backend = None
+_stdlib = StdlibBackend()
+
+
+def available_backends() -> list[str]:
+    return [name for name in BACKEND_PRIORITY if BACKENDS[name][1]()]
+
+
+def get_backend(name: str | None = None):
+    """
+    Возвращает кодировщик по имени или выбранный настройкой JSON_BACKEND
+    ('auto' — первый установленный из BACKEND_PRIORITY).
+
+    :raises ValueError: если указанный кодировщик не установлен
+    """
+    global _backend
+    if name is None and _backend is not None:
+        return _backend
+
+    requested = name or getattr(settings, 'JSON_BACKEND', 'auto')
+    if requested == 'auto':
+        requested = available_backends()[0]
+    if requested not in BACKENDS or not BACKENDS[requested][1]():
+        raise ValueError(f'JSON backend is not available: {requested}')
+    backend = BACKENDS[requested][0]()
+    if name is None:
+        _backend = backend
+    return backend
+
+
+def dumps(data: Any, backend=None) -> bytes:
+    """
+    Кодирует данные в тот же JSON, что и JSONRenderer DRF (байт в байт для ответов API;
+    исключение — Decimal в msgspec), но выбранным быстрым кодировщиком. Если кодировщик не справился
+    (например, целое больше 64 бит), используется стандартный json.
+    """
+    backend = backend or get_backend()
+    try:
+        return _escape_separators(backend.dumps(data))
+    except (TypeError, ValueError, OverflowError):
+        if isinstance(backend, StdlibBackend):
+            raise
+        return _escape_separators(_stdlib.dumps(data))
+
+
+def loads(raw: bytes | str, backend=None) -> Any:
+    """
+    Разбирает JSON выбранным кодировщиком.
+
+    :raises ValueError: если JSON некорректен
+    """
+    backend = backend or get_backend()
+    if isinstance(raw, str):
+        raw = raw.encode()
+    try:
+        return backend.loads(raw)
+    except ValueError:
+        raise
+    except Exception as e:  # msgspec.DecodeError не наследует ValueError
+        raise ValueError(str(e)) from e
+
+
+def iter_array(items: Iterable, chunk_size: int = 500) -> Iterator[bytes]:
+    """
+    Кодирует JSON-массив по частям: в памяти одновременно только одна пачка элементов.
+    Результат совпадает с dumps(list(items)).
+    """
+    yield b'['
+    first = True
+    for batch in chunked(items, chunk_size):
+        # Пачка кодируется одним вызовом, внешние скобки массива отрезаются
+        body = dumps(batch)[1:-1]
+        yield body if first else b',' + body
+        first = False
+    yield b']'
+
+
+def stream_response(items: Iterable, content_type: str = 'application/json',
+                    chunk_size: int = 500) -> StreamingHttpResponse:
+    """
+    Потоковый ответ с JSON-массивом для больших списков: items может быть генератором,
+    который читает базу пачками по мере отправки.
+    """
+    return StreamingHttpResponse(iter_array(items, chunk_size), content_type=content_type)
+
+
+def iter_lines(items: Iterable, chunk_size: int = 500) -> Iterator[bytes]:
+    """
+    Кодирует элементы как NDJSON (по объекту в строке) пачками.
+    """
+    for batch in chunked(items, chunk_size):
+        yield b''.join(dumps(item) + b'\n' for item in batch)
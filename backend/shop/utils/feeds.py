@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import os
+from typing import Any, Iterator, IO
+
+import yaml
+from yaml.composer import Composer
+from yaml.constructor import SafeConstructor
+from yaml.events import MappingStartEvent, MappingEndEvent, SequenceStartEvent, SequenceEndEvent
+from yaml.resolver import Resolver
+
+from shop.utils.importer import PriceListError, PriceListFeed
+
+try:
+    from yaml.cyaml import CParser
+except ImportError:  # PyYAML собран без libyaml
+    CParser = None
+
+FEED_FORMATS = ('yaml', 'jsonl', 'csv')
+
+FORMAT_EXTENSIONS = {
+    '.yaml': 'yaml',
+    '.yml': 'yaml',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+}
+
+# Префикс колонок CSV с параметрами товара: "param:Цвет"
+CSV_PARAMETER_PREFIX = 'param:'
+
+
+if CParser is not None:
+    class StreamingLoader(CParser, Composer, SafeConstructor, Resolver):
+        """
+        SafeLoader на парсере libyaml, умеющий собирать документ по частям.
+        """
+
+        def __init__(self, stream: IO):
+            CParser.__init__(self, stream)
+            Composer.__init__(self)
+            SafeConstructor.__init__(self)
+            Resolver.__init__(self)
+else:
+    StreamingLoader = yaml.SafeLoader
+
+
+def detect_format(filename: str | None, fmt: str | None = None) -> str:
+    """
+    Определяет формат прайс-листа по явно переданному значению или расширению файла.
+    По умолчанию — YAML.
+    """
+    if fmt:
+        if fmt not in FEED_FORMATS:
+            raise PriceListError(f'Unknown price list format: {fmt}')
+        return fmt
+    _, ext = os.path.splitext(filename or '')
+    return FORMAT_EXTENSIONS.get(ext.lower(), 'yaml')
+
+
+def open_feed(file: IO, fmt: str | None = None, shop: str | None = None) -> PriceListFeed:
+    """
+    Открывает загруженный файл как потоковый прайс-лист.
+
+    :param file: Файл (обычно UploadedFile из request.FILES)
+    :param fmt: Формат: yaml, jsonl или csv; если не передан — по расширению файла
+    :param shop: Название магазина (нужно только для CSV, где его негде указать)
+    """
+    fmt = detect_format(getattr(file, 'name', None), fmt)
+    if fmt == 'jsonl':
+        return read_jsonl(file)
+    if fmt == 'csv':
+        return read_csv(file, shop)
+    return read_yaml(file)
+
+
+def read_yaml(stream: IO) -> PriceListFeed:
+    """
+    Читает YAML вида {shop, categories, goods} событиями парсера,
+    собирая в объекты только по одному элементу списка goods.
+
+    Потоково читаются только файлы, где shop и categories идут до goods;
+    если goods стоит раньше, список целиком загружается в память.
+    """
+    loader = StreamingLoader(stream)
+    header = {}
+    try:
+        loader.get_event()  # StreamStart
+        loader.get_event()  # DocumentStart
+        if not loader.check_event(MappingStartEvent):
+            raise PriceListError("Missing one of required keys: {'shop', 'categories', 'goods'}")
+        loader.get_event()
+
+        while not loader.check_event(MappingEndEvent):
+            key = loader.construct_document(loader.compose_node(None, None))
+            if key == 'goods' and {'shop', 'categories'}.issubset(header):
+                break
+            header[key] = loader.construct_document(loader.compose_node(None, None))
+        else:
+            loader.dispose()
+            if not {'shop', 'categories', 'goods'}.issubset(header):
+                raise PriceListError("Missing one of required keys: {'shop', 'categories', 'goods'}")
+            if not isinstance(header['goods'], list):
+                raise PriceListError('goods must be a list')
+            return PriceListFeed(shop=header['shop'], categories=header['categories'], goods=iter(header['goods']))
+    except yaml.YAMLError as e:
+        loader.dispose()
+        raise PriceListError(f'YAML read error: {e}')
+
+    if not loader.check_event(SequenceStartEvent):
+        loader.dispose()
+        raise PriceListError('goods must be a list')
+
+    def goods() -> Iterator[Any]:
+        try:
+            loader.get_event()
+            index = 0
+            while not loader.check_event(SequenceEndEvent):
+                yield loader.construct_document(loader.compose_node(None, index))
+                index += 1
+        except yaml.YAMLError as e:
+            raise PriceListError(f'YAML read error: {e}')
+        finally:
+            loader.dispose()
+
+    return PriceListFeed(shop=header['shop'], categories=header['categories'], goods=goods())
+
+
+def read_jsonl(stream: IO) -> PriceListFeed:
+    """
+    Читает JSON Lines: первая строка — {"shop": ..., "categories": [...]},
+    каждая следующая — один товар в том же виде, что и в YAML.
+    """
+    lines = _text_lines(stream)
+    try:
+        header = json.loads(next(lines))
+    except StopIteration:
+        raise PriceListError('Price list is empty')
+    except ValueError as e:
+        raise PriceListError(f'JSON read error: {e}')
+    if not isinstance(header, dict) or not {'shop', 'categories'}.issubset(header):
+        raise PriceListError('First line must contain shop and categories')
+
+    def goods() -> Iterator[Any]:
+        for number, line in enumerate(lines, start=2):
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise PriceListError(f'JSON read error in line {number}: {e}')
+
+    return PriceListFeed(shop=header['shop'], categories=header['categories'], goods=goods())
+
+
+def read_csv(stream: IO, shop: str | None) -> PriceListFeed:
+    """
+    Читает CSV с колонками id, category, category_name, name, model,
+    price, price_rrc, quantity и колонками параметров вида `param:<название>`.
+
+    Магазин передаётся отдельно, категории создаются по колонке category_name.
+    """
+    if not shop:
+        raise PriceListError('shop is required for CSV price lists')
+
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+    def goods() -> Iterator[dict]:
+        try:
+            for row in reader:
+                item = {'parameters': {}}
+                for column, value in row.items():
+                    if column is None:
+                        raise PriceListError(f'Too many values in line {reader.line_num}')
+                    if column.startswith(CSV_PARAMETER_PREFIX):
+                        if value not in (None, ''):
+                            item['parameters'][column[len(CSV_PARAMETER_PREFIX):]] = value
+                    elif value is not None:
+                        item[column] = value
+                yield item
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise PriceListError(f'CSV read error: {e}')
+
+    return PriceListFeed(shop=shop, categories=[], goods=goods())
+
+
+def _text_lines(stream: IO) -> Iterator[str]:
+    """
+    Построчно читает файл, пропуская пустые строки.
+    """
+    for line in stream:
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8-sig')
+            except UnicodeDecodeError as e:
+                raise PriceListError(f'Invalid encoding: {e}')
+        line = line.strip()
+        if line:
+            yield line
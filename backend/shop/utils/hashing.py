@@ -0,0 +1,66 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+_lock = threading.Lock()
+_pool: ThreadPoolExecutor | None = None
+_slots: threading.BoundedSemaphore | None = None
+# (pid, потоков, мест в очереди) пула: после fork или смены настроек пул создаётся заново
+_config: tuple[int, int, int] | None = None
+_local = threading.local()
+
+
+class HashingBusy(APIException):
+    """
+    Пул хэширования паролей и его очередь заняты: запрос отклоняется сразу, а не ждёт.
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password checks in progress, retry later'
+    default_code = 'hashing_busy'
+
+
+def _mark_worker() -> None:
+    _local.worker = True
+
+
+def _get_pool() -> tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    global _pool, _slots, _config
+    config = (os.getpid(), settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE)
+    with _lock:
+        if config != _config:
+            if _pool is not None and _config[0] == config[0]:
+                _pool.shutdown(wait=False)
+            _pool = ThreadPoolExecutor(config[1], thread_name_prefix='password-hashing', initializer=_mark_worker)
+            _slots = threading.BoundedSemaphore(config[1] + config[2])
+            _config = config
+        return _pool, _slots
+
+
+def run(func, *args, **kwargs):
+    """
+    Выполняет вычисление хэша пароля в пуле из PASSWORD_HASHING_WORKERS потоков.
+
+    PBKDF2, scrypt и Argon2 отпускают GIL, поэтому потоки пула хэшируют параллельно,
+    но не больше чем на PASSWORD_HASHING_WORKERS ядрах: всплеск входов не отнимает
+    процессор у остальных запросов. Ещё PASSWORD_HASHING_QUEUE вызовов ждут в очереди,
+    следующие сразу получают HashingBusy (503).
+    При PASSWORD_HASHING_WORKERS=0 и внутри самого пула функция вызывается напрямую.
+
+    :raises HashingBusy: если пул и очередь заполнены
+    """
+    if settings.PASSWORD_HASHING_WORKERS <= 0 or getattr(_local, 'worker', False):
+        return func(*args, **kwargs)
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = pool.submit(func, *args, **kwargs)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
@@ -0,0 +1,436 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+
+from django.db import IntegrityError, transaction
+
+from shop.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from shop.utils import catalog_cache, documents, facets, search
+from shop.utils.db import QueryCounter, bulk_changes, chunked
+
+logger = logging.getLogger(__name__)
+
+GOODS_REQUIRED_FIELDS = {'id', 'name', 'category', 'price', 'price_rrc', 'quantity', 'parameters'}
+
+# Поля ProductInfo, которые сравниваются при инкрементальном обновлении
+DIFF_FIELDS = ('product_id', 'model', 'price', 'price_rrc', 'quantity', 'is_active')
+
+IMPORT_MODES = ('diff', 'replace')
+
+
+class PriceListError(ValueError):
+    """
+    Ошибка структуры или содержимого прайс-листа.
+    """
+
+
+@dataclass
+class PriceListFeed:
+    """
+    Прайс-лист, товары которого читаются по одному.
+
+    `shop` и `categories` известны сразу, `goods` — итерируемый источник,
+    поэтому в памяти одновременно находится не больше одной пачки товаров.
+    """
+    shop: Any
+    categories: Any
+    goods: Iterable[Any]
+
+
+@dataclass
+class ImportStats:
+    """
+    Статистика одного импорта прайс-листа.
+    """
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    retired: int = 0
+    deleted: int = 0
+    parameters: int = 0
+    queries: int = 0
+    duration: float = 0.0
+    batches: int = field(default=0, repr=False)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.updated or self.retired or self.deleted or self.parameters)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.duration if self.duration else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'retired': self.retired,
+            'deleted': self.deleted,
+            'parameters': self.parameters,
+            'queries': self.queries,
+            'duration': round(self.duration, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа поставщика пакетными запросами.
+
+    Категории, товары и параметры разрешаются несколькими выборками на пачку,
+    а ProductInfo и ProductParameter пишутся через `bulk_create`/`bulk_update`.
+    Весь импорт выполняется в одной транзакции: при ошибке база не меняется.
+
+    Режимы:
+    - `diff` (по умолчанию) — предложения сопоставляются по (shop, external_id):
+      новые создаются, изменённые обновляются, отсутствующие в файле снимаются
+      с продажи (`is_active=False`), а не удаляются;
+    - `replace` — все предложения магазина удаляются и создаются заново.
+    """
+    batch_size = 1000
+
+    def __init__(self, user, batch_size: int | None = None, mode: str = 'diff',
+                 progress: Callable[[ImportStats], None] | None = None):
+        """
+        :param progress: Необязательный обработчик, вызываемый после каждой записанной пачки
+        """
+        if mode not in IMPORT_MODES:
+            raise PriceListError(f'Unknown import mode: {mode}')
+        self.user = user
+        self.mode = mode
+        self.progress = progress
+        if batch_size:
+            self.batch_size = batch_size
+        self.stats = ImportStats()
+        self._parameters: dict[str, int] = {}
+        self._categories: set[int] = set()
+        # external_id -> pk активных предложений магазина до импорта (режим diff)
+        self._active: dict[int, int] = {}
+        self._seen: set[int] = set()
+        # Изменённые предложения пачки: для них пересобираются поисковый документ,
+        # фасеты и готовое представление
+        self._dirty: set[int] = set()
+        # Значения фасетов, чьи счётчики пересчитываются в конце импорта
+        self._facet_values: set[int] = set()
+
+    def run(self, data: Any) -> ImportStats:
+        """
+        Импортирует разобранный прайс-лист (словарь с ключами shop, categories, goods).
+
+        :param data: Содержимое YAML-файла
+        :raises PriceListError: если структура файла неверна
+        """
+        required_keys = {'shop', 'categories', 'goods'}
+        if not isinstance(data, dict) or not required_keys.issubset(data):
+            raise PriceListError(f'Missing one of required keys: {required_keys}')
+        if not isinstance(data['goods'], list):
+            raise PriceListError('goods must be a list')
+        return self.run_feed(PriceListFeed(shop=data['shop'], categories=data['categories'], goods=data['goods']))
+
+    def run_feed(self, feed: PriceListFeed) -> ImportStats:
+        """
+        Импортирует прайс-лист, читая товары из `feed.goods` пачками по `batch_size`.
+
+        :raises PriceListError: если структура файла неверна
+        """
+        start = time.perf_counter()
+        with QueryCounter() as counter, transaction.atomic():
+            shop = self.import_shop(feed.shop)
+            self.import_categories(shop, feed.categories)
+
+            if self.mode == 'replace':
+                self._facet_values |= facets.values_of(ProductInfo.objects.filter(shop=shop).values('id'))
+                # Пачками: удаление загружает предложения и их параметры в память ради сигналов
+                ids = list(ProductInfo.objects.filter(shop=shop).values_list('id', flat=True))
+                with bulk_changes():
+                    for batch in chunked(ids, self.batch_size):
+                        _, deleted = ProductInfo.objects.filter(pk__in=batch).delete()
+                        self.stats.deleted += deleted.get(ProductInfo._meta.label, 0)
+            else:
+                self._active = dict(
+                    ProductInfo.objects.filter(shop=shop, is_active=True).values_list('external_id', 'id')
+                )
+
+            for batch in chunked(feed.goods, self.batch_size):
+                self.import_goods(shop, batch)
+
+            if self.mode == 'diff':
+                self.retire_missing()
+            facets.recount(self._facet_values)
+
+            if self.stats.changed:
+                category_ids = set(shop.categories.values_list('id', flat=True)) | self._categories
+                catalog_cache.invalidate([shop.pk], category_ids)
+
+        self.stats.queries = counter.count
+        self.stats.duration = time.perf_counter() - start
+        logger.info('Price list for shop %s imported: %s', shop.pk, self.stats.as_dict())
+        return self.stats
+
+    def import_shop(self, shop_name: Any) -> Shop:
+        if not isinstance(shop_name, str):
+            raise PriceListError('Invalid shop name')
+        shop, created = Shop.objects.get_or_create(user=self.user, defaults={'name': shop_name})
+        if not created and shop.name != shop_name:
+            shop.name = shop_name
+            shop.save(update_fields=['name'])
+        return shop
+
+    def import_categories(self, shop: Shop, categories: Any) -> None:
+        """
+        Создаёт недостающие категории, обновляет названия существующих
+        и привязывает их к магазину.
+        """
+        if not isinstance(categories, list):
+            raise PriceListError('categories must be a list')
+
+        names = {}
+        for category in categories:
+            if not isinstance(category, dict) or 'id' not in category or 'name' not in category:
+                raise PriceListError(f'Invalid category structure: {category}')
+            names[category['id']] = category['name']
+        if not names:
+            return
+
+        existing = Category.objects.in_bulk(list(names))
+        renamed = []
+        for cat_id, cat_obj in existing.items():
+            if cat_obj.name != names[cat_id]:
+                cat_obj.name = names[cat_id]
+                renamed.append(cat_obj)
+        if renamed:
+            Category.objects.bulk_update(renamed, ['name'], batch_size=self.batch_size)
+        Category.objects.bulk_create(
+            [Category(id=cat_id, name=name) for cat_id, name in names.items() if cat_id not in existing],
+            batch_size=self.batch_size,
+        )
+        shop.categories.add(*names)
+        self._categories.update(names)
+
+    def import_goods(self, shop: Shop, items: list) -> None:
+        """
+        Записывает одну пачку товаров: товары, предложения магазина и их параметры.
+        """
+        rows = [self._clean_item(item) for item in items]
+        self._check_categories(shop, rows)
+
+        products = self._resolve_products({(row['name'], row['category']) for row in rows})
+        parameters = self._resolve_parameters({name for row in rows for name in row['parameters']})
+
+        infos = [
+            ProductInfo(
+                product_id=products[(row['name'], row['category'])],
+                shop=shop,
+                external_id=row['id'],
+                model=row['model'],
+                price=row['price'],
+                price_rrc=row['price_rrc'],
+                quantity=row['quantity'],
+            )
+            for row in rows
+        ]
+        if self.mode == 'diff':
+            self._write_diff(shop, infos, rows, parameters)
+        else:
+            self._write_new(infos)
+            self._write_parameters(infos, rows, parameters, existing={})
+        search.reindex(self._dirty)
+        self._facet_values |= facets.reindex(self._dirty)
+        documents.rebuild(self._dirty)
+        self._dirty.clear()
+
+        self.stats.rows += len(rows)
+        self.stats.batches += 1
+        if self.progress:
+            self.progress(self.stats)
+
+    def retire_missing(self) -> None:
+        """
+        Снимает с продажи активные предложения, которых не было в файле.
+        """
+        missing = [pk for external_id, pk in self._active.items() if external_id not in self._seen]
+        for batch in chunked(missing, self.batch_size):
+            self._facet_values |= facets.values_of(batch)
+            self.stats.retired += ProductInfo.objects.filter(pk__in=batch).update(is_active=False)
+
+    def _write_new(self, infos: list[ProductInfo]) -> None:
+        try:
+            with transaction.atomic():
+                ProductInfo.objects.bulk_create(infos, batch_size=self.batch_size)
+        except IntegrityError as e:
+            raise PriceListError(f'Invalid product info: {e}')
+        self.stats.created += len(infos)
+        self._dirty.update(info.pk for info in infos)
+
+    def _write_diff(self, shop: Shop, infos: list[ProductInfo], rows: list[dict], parameters: dict[str, int]) -> None:
+        """
+        Сопоставляет пачку с текущими предложениями магазина по external_id
+        и пишет только новые и изменившиеся строки.
+        """
+        for info in infos:
+            if info.external_id in self._seen:
+                raise PriceListError(f'Duplicate product id: {info.external_id}')
+            self._seen.add(info.external_id)
+
+        current = {
+            obj.external_id: obj
+            for obj in ProductInfo.objects.filter(shop=shop, external_id__in=[info.external_id for info in infos])
+            .only('id', 'external_id', *DIFF_FIELDS)
+        }
+
+        new, changed = [], []
+        for info in infos:
+            obj = current.get(info.external_id)
+            if obj is None:
+                new.append(info)
+                continue
+            info.pk = obj.pk
+            if any(getattr(obj, name) != getattr(info, name) for name in DIFF_FIELDS):
+                changed.append(info)
+            else:
+                self.stats.unchanged += 1
+
+        if new:
+            self._write_new(new)
+        if changed:
+            try:
+                with transaction.atomic():
+                    ProductInfo.objects.bulk_update(changed, DIFF_FIELDS, batch_size=self.batch_size)
+            except IntegrityError as e:
+                raise PriceListError(f'Invalid product info: {e}')
+            self.stats.updated += len(changed)
+            self._facet_values |= facets.values_of(
+                [info.pk for info in changed if not current[info.external_id].is_active]
+            )
+            self._dirty.update(info.pk for info in changed)
+
+        existing = {}
+        if current:
+            queryset = ProductParameter.objects.filter(product_info_id__in=[obj.pk for obj in current.values()])\
+                .values_list('id', 'product_info_id', 'parameter_id', 'value')
+            for pk, info_id, parameter_id, value in queryset:
+                existing[(info_id, parameter_id)] = (pk, value)
+        self._write_parameters(infos, rows, parameters, existing)
+
+    def _write_parameters(self, infos: list[ProductInfo], rows: list[dict], parameters: dict[str, int],
+                          existing: dict[tuple[int, int], tuple[int, str]]) -> None:
+        """
+        Приводит параметры предложений к значениям из файла.
+
+        :param existing: Текущие параметры: (product_info_id, parameter_id) -> (pk, value)
+        """
+        to_create, to_update = [], []
+        for info, row in zip(infos, rows):
+            for name, value in row['parameters'].items():
+                key = (info.pk, parameters[name])
+                current = existing.pop(key, None)
+                if current is None:
+                    to_create.append(ProductParameter(product_info_id=info.pk, parameter_id=key[1], value=value))
+                    self._dirty.add(info.pk)
+                elif current[1] != value:
+                    to_update.append(ProductParameter(pk=current[0], value=value))
+                    self._dirty.add(info.pk)
+
+        ProductParameter.objects.bulk_create(to_create, batch_size=self.batch_size)
+        ProductParameter.objects.bulk_update(to_update, ['value'], batch_size=self.batch_size)
+        # Всё, что осталось в existing, в новом файле отсутствует
+        stale = [pk for pk, _ in existing.values()]
+        self._dirty.update(info_id for info_id, _ in existing)
+        with bulk_changes():
+            for batch in chunked(stale, self.batch_size):
+                ProductParameter.objects.filter(pk__in=batch).delete()
+        self.stats.parameters += len(to_create) + len(to_update) + len(stale)
+
+    def _clean_item(self, item: Any) -> dict:
+        if not isinstance(item, dict) or not GOODS_REQUIRED_FIELDS.issubset(item):
+            raise PriceListError(f'Missing fields in product item: {item}')
+
+        parameters = item['parameters']
+        if not isinstance(parameters, dict):
+            raise PriceListError(f'parameters must be dict in item: {item}')
+        for name in parameters:
+            if not isinstance(name, str):
+                raise PriceListError(f'Invalid parameter name: {name}')
+
+        try:
+            row = {
+                'id': int(item['id']),
+                'name': str(item['name']),
+                'category': int(item['category']),
+                'category_name': item.get('category_name'),
+                'model': item.get('model', ''),
+                'price': int(item['price']),
+                'price_rrc': int(item['price_rrc']),
+                'quantity': int(item['quantity']),
+                'parameters': {name: str(value) for name, value in parameters.items()},
+            }
+        except (TypeError, ValueError) as e:
+            raise PriceListError(f'Invalid product info: {e}')
+        for name in ('price', 'price_rrc', 'quantity'):
+            if row[name] < 0:
+                raise PriceListError(f'{name} must not be negative in product {row["id"]}')
+        return row
+
+    def _check_categories(self, shop: Shop, rows: list[dict]) -> None:
+        """
+        Проверяет, что категории товаров существуют. Категории, не описанные
+        в заголовке прайс-листа, создаются, если у товара указано `category_name`.
+        """
+        unknown = {row['category'] for row in rows} - self._categories
+        if unknown:
+            self._categories.update(Category.objects.filter(id__in=unknown).values_list('id', flat=True))
+            unknown -= self._categories
+        if not unknown:
+            return
+
+        names = {row['category']: row['category_name'] for row in rows
+                 if row['category'] in unknown and row['category_name']}
+        if unknown - names.keys():
+            raise PriceListError(f'Unknown categories: {sorted(unknown - names.keys())}')
+        self.import_categories(shop, [{'id': cat_id, 'name': name} for cat_id, name in names.items()])
+
+    def _resolve_products(self, keys: set[tuple[str, int]]) -> dict[tuple[str, int], int]:
+        """
+        Возвращает id товаров по парам (название, категория), создавая недостающие.
+        """
+        names = {name for name, _ in keys}
+        category_ids = {category_id for _, category_id in keys}
+
+        def lookup() -> dict[tuple[str, int], int]:
+            found = {}
+            queryset = Product.objects.filter(name__in=names, category_id__in=category_ids)\
+                .order_by('id').values_list('id', 'name', 'category_id')
+            for pk, name, category_id in queryset:
+                found.setdefault((name, category_id), pk)
+            return found
+
+        products = lookup()
+        missing = [Product(name=name, category_id=category_id) for name, category_id in keys - products.keys()]
+        if missing:
+            Product.objects.bulk_create(missing, batch_size=self.batch_size)
+            if all(product.pk for product in missing):
+                products.update({(product.name, product.category_id): product.pk for product in missing})
+            else:
+                products = lookup()
+        return products
+
+    def _resolve_parameters(self, names: set[str]) -> dict[str, int]:
+        """
+        Возвращает id параметров по названиям, создавая недостающие.
+        Найденные параметры запоминаются на всё время импорта.
+        """
+        missing = names - self._parameters.keys()
+        if missing:
+            self._parameters.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+            missing -= self._parameters.keys()
+        if missing:
+            created = Parameter.objects.bulk_create([Parameter(name=name) for name in missing])
+            if all(param.pk for param in created):
+                self._parameters.update({param.name: param.pk for param in created})
+            else:
+                self._parameters.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+        return self._parameters
@@ -0,0 +1,182 @@
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from shop.models import Contact, Order, OrderItem, ProductInfo
+from shop.utils import catalog_cache, documents, shop_state
+
+# Состояние, из которого заказ подтверждается с резервированием товара
+BASKET_STATE = 'basket'
+# Состояния, в которых товар заказа списан с остатков
+RESERVED_STATES = frozenset(('new', 'confirmed', 'assembled', 'sent', 'delivered'))
+
+
+class ReservationError(Exception):
+    """
+    Заказ нельзя подтвердить: корзина пуста, товара не хватает или магазин не принимает заказы.
+
+    :param items: Подробности по позициям, из-за которых резервирование не удалось
+    """
+
+    def __init__(self, message: str, items: list[dict] | None = None):
+        super().__init__(message)
+        self.items = items or []
+
+
+class OutOfStock(ReservationError):
+    pass
+
+
+class ShopClosed(ReservationError):
+    pass
+
+
+class Line(NamedTuple):
+    id: int
+    product_info_id: int
+    quantity: int
+    shop_id: int
+    category_id: int
+    price: int
+    product_name: str
+    shop_name: str
+
+
+def _lines(order_id: int) -> list[Line]:
+    # Строки сортируются по id предложения: все транзакции блокируют их в одном порядке
+    rows = OrderItem.objects.filter(order_id=order_id, product_info__isnull=False).order_by('product_info_id')\
+        .values_list('id', 'product_info_id', 'quantity', 'product_info__shop_id', 'product_info__product__category_id',
+                     'product_info__price', 'product_info__product__name', 'product_info__shop__name')
+    return [Line(*row) for row in rows]
+
+
+def _refresh_catalog(lines: list[Line]) -> None:
+    """
+    Остаток входит в готовые документы и кэш каталога; обновляем их после фиксации.
+    """
+    ids = [line.product_info_id for line in lines]
+    catalog_cache.invalidate({line.shop_id for line in lines}, {line.category_id for line in lines})
+    transaction.on_commit(lambda: documents.rebuild(ids))
+
+
+def reserve(order_id: int) -> list[Line]:
+    """
+    Списывает остатки по всем позициям заказа. Вызывается внутри транзакции:
+    при нехватке хотя бы одного товара исключение откатывает все списания.
+
+    Каждое списание — условный `UPDATE ... SET quantity = quantity - n WHERE quantity >= n`,
+    поэтому остаток не уходит в минус без предварительного чтения и блокировок в приложении.
+
+    :return: Позиции заказа
+    :raises ShopClosed: если магазин одной из позиций не принимает заказы
+    :raises OutOfStock: если товара не хватает или он снят с продажи
+    :raises ReservationError: если в заказе нет позиций
+    """
+    lines = _lines(order_id)
+    if not lines:
+        raise ReservationError('Basket is empty')
+
+    # Состояния магазинов — из кэша процесса (shop.utils.shop_state), без запросов на каждую позицию
+    closed = sorted({line.shop_id for line in lines} & shop_state.closed_shop_ids())
+    if closed:
+        raise ShopClosed('Shop is not accepting orders', [{'shop': shop_id} for shop_id in closed])
+
+    shortages = []
+    for line in lines:
+        updated = ProductInfo.objects.filter(pk=line.product_info_id, is_active=True, quantity__gte=line.quantity)\
+            .update(quantity=F('quantity') - line.quantity)
+        if not updated:
+            shortages.append((line.product_info_id, line.quantity))
+    if shortages:
+        available = dict(ProductInfo.objects.filter(pk__in=[pk for pk, _ in shortages], is_active=True)
+                         .values_list('id', 'quantity'))
+        raise OutOfStock('Not enough stock', [
+            {'product_info': pk, 'requested': quantity, 'available': available.get(pk, 0)}
+            for pk, quantity in shortages
+        ])
+    _refresh_catalog(lines)
+    return lines
+
+
+def release(order_id: int) -> bool:
+    """
+    Возвращает на склад товар, зарезервированный заказом. Повторный вызов ничего не делает.
+
+    :return: False, если у заказа нет резерва
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order_id, stock_reserved=True)\
+                .update(stock_reserved=False, updated_at=timezone.now()):
+            return False
+        lines = _lines(order_id)
+        for line in lines:
+            ProductInfo.objects.filter(pk=line.product_info_id).update(quantity=F('quantity') + line.quantity)
+        _refresh_catalog(lines)
+    return True
+
+
+def snapshot(order_id: int, lines: list[Line]) -> None:
+    """
+    Сохраняет в позициях цену, название товара и магазин, а в заказе — сумму,
+    чтобы история заказов и лента поставщика не зависели от дальнейших изменений каталога.
+    """
+    OrderItem.objects.bulk_update(
+        [OrderItem(pk=line.id, price=line.price, product_name=line.product_name, shop_name=line.shop_name,
+                   shop_id=line.shop_id)
+         for line in lines],
+        ['price', 'product_name', 'shop_name', 'shop'],
+    )
+    Order.objects.filter(pk=order_id).update(total=sum(line.price * line.quantity for line in lines),
+                                             updated_at=timezone.now())
+
+
+def confirm_order(order_id: int, user, contact: Contact) -> bool:
+    """
+    Подтверждает корзину, резервирует товар и фиксирует цены позиций в одной транзакции.
+
+    Смена состояния — условное обновление `state = 'basket'`, поэтому
+    параллельные подтверждения одной корзины резервируют товар один раз.
+    Позиции, чьё предложение удалено из каталога, из заказа убираются.
+
+    :return: False, если корзина не найдена (или уже подтверждена)
+    :raises ReservationError: если товар нельзя зарезервировать; корзина остаётся без изменений
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order_id, user=user, state=BASKET_STATE)\
+            .update(state='confirmed', contact=contact, stock_reserved=True, confirmed_at=now, updated_at=now)
+        if not updated:
+            return False
+        OrderItem.objects.filter(order_id=order_id, product_info__isnull=True).delete()
+        snapshot(order_id, reserve(order_id))
+    return True
+
+
+def set_state(order: Order, state: str) -> None:
+    """
+    Меняет состояние заказа так, чтобы резерв соответствовал состоянию: заказ без резерва
+    (корзина, отменённый), переводимый в RESERVED_STATES, резервирует товар так же, как
+    подтверждение, а при отмене или возврате в корзину резерв возвращается на склад.
+    Корзина, переведённая в заказ в обход подтверждения, получает снимки цен, сумму и время оформления.
+
+    Резерв захватывается условным `UPDATE ... WHERE stock_reserved = false`, поэтому
+    параллельные смены состояния и подтверждение списывают товар один раз.
+
+    :raises ReservationError: если товар нельзя зарезервировать; заказ остаётся без изменений
+    """
+    with transaction.atomic():
+        lines = None
+        if state in RESERVED_STATES and Order.objects.filter(pk=order.pk, stock_reserved=False)\
+                .update(stock_reserved=True):
+            lines = reserve(order.pk)
+        update_fields = ['state', 'updated_at']
+        if order.state == BASKET_STATE and state != BASKET_STATE:
+            snapshot(order.pk, lines if lines is not None else _lines(order.pk))
+            order.confirmed_at = timezone.now()
+            update_fields.append('confirmed_at')
+        order.state = state
+        order.save(update_fields=update_fields)
+        if state not in RESERVED_STATES:
+            release(order.pk)
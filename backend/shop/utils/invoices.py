@@ -0,0 +1,209 @@
+import csv
+import io
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+from django.conf import settings
+from django.db.models import F
+from django.template.loader import render_to_string
+
+from shop.models import OrderItem
+
+INVOICE_FORMATS = ('html', 'csv')
+CSV_COLUMNS = ['order', 'dt', 'shop', 'product', 'price', 'quantity', 'sum']
+# Сколько хранятся файлы накладных: дольше, чем письма с ними могут ждать повторной отправки
+RETENTION = timedelta(days=30)
+
+
+class InvoiceLine(NamedTuple):
+    shop_id: int | None
+    shop_name: str
+    product_name: str
+    price: int
+    quantity: int
+    sum: int
+
+
+class Invoice(NamedTuple):
+    """
+    Накладная заказа (или его части одного магазина) по снимкам цен позиций.
+    """
+    order_id: int
+    version: str
+    dt: datetime  # время оформления заказа
+    state: str
+    email: str
+    address: str
+    phone: str
+    lines: list[InvoiceLine]
+    shop_emails: dict[int, str]
+
+    @property
+    def total(self) -> int:
+        return sum(line.sum for line in self.lines)
+
+    @property
+    def shop_ids(self) -> list[int]:
+        return sorted({line.shop_id for line in self.lines if line.shop_id is not None})
+
+    def for_shop(self, shop_id: int) -> 'Invoice':
+        return self._replace(lines=[line for line in self.lines if line.shop_id == shop_id])
+
+
+def order_version(updated_at: datetime) -> str:
+    """
+    Версия заказа для ключа кэша: время последнего изменения в микросекундах.
+    """
+    return str(int(updated_at.timestamp() * 1_000_000))
+
+
+def load(order_ids: Iterable[int]) -> list[Invoice]:
+    """
+    Собирает накладные заказов одним запросом: позиции вместе с заказом, покупателем,
+    адресом доставки и почтой поставщика, сумма позиции считается базой.
+    """
+    rows = OrderItem.objects.filter(order_id__in=list(order_ids)).order_by('order_id', 'shop_name', 'id')\
+        .annotate(line_sum=F('price') * F('quantity'))\
+        .values_list('order_id', 'order__updated_at', 'order__confirmed_at', 'order__state', 'order__user__email',
+                     'order__contact__city', 'order__contact__street', 'order__contact__house',
+                     'order__contact__apartment', 'order__contact__phone', 'shop_id', 'shop__user__email',
+                     'shop_name', 'product_name', 'price', 'quantity', 'line_sum')
+    invoices: dict[int, Invoice] = {}
+    for (order_id, updated_at, dt, state, email, city, street, house, apartment, phone, shop_id, shop_email,
+         *line) in rows:
+        invoice = invoices.get(order_id)
+        if invoice is None:
+            address = ', '.join(part for part in (city, street, house, apartment) if part)
+            invoice = invoices[order_id] = Invoice(order_id, order_version(updated_at), dt, state, email, address,
+                                                   phone or '', [], {})
+        invoice.lines.append(InvoiceLine(shop_id, *line))
+        if shop_id is not None and shop_email:
+            invoice.shop_emails[shop_id] = shop_email
+    return list(invoices.values())
+
+
+def render(invoice: Invoice, fmt: str) -> bytes:
+    """
+    :raises ValueError: если формат не поддерживается
+    """
+    if fmt == 'html':
+        return render_to_string('shop/invoice.html', {'invoice': invoice}).encode()
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        write_csv_rows(csv.writer(buffer), [invoice], header=True)
+        # BOM, чтобы Excel открывал файл в UTF-8
+        return ('\ufeff' + buffer.getvalue()).encode()
+    raise ValueError(f'Unknown invoice format: {fmt}')
+
+
+def write_csv_rows(writer, invoices: Iterable[Invoice], header: bool = False) -> None:
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for invoice in invoices:
+        for line in invoice.lines:
+            writer.writerow([invoice.order_id, invoice.dt.isoformat(), line.shop_name, line.product_name,
+                             line.price, line.quantity, line.sum])
+
+
+def invoice_path(invoice: Invoice, fmt: str, shop_id: int | None = None) -> Path:
+    scope = f'shop-{shop_id}' if shop_id is not None else 'order'
+    return Path(settings.INVOICE_ROOT) / str(invoice.order_id) / f'{invoice.version}-{scope}.{fmt}'
+
+
+def render_cached(invoice: Invoice, fmt: str, shop_id: int | None = None) -> Path:
+    """
+    Возвращает файл накладной, отрисовывая его только при отсутствии в кэше на диске.
+
+    Ключ кэша — версия заказа, поэтому после изменения заказа накладная отрисовывается заново.
+    Файлы прежних версий остаются до prune(): на них могут ссылаться письма в очереди.
+    Запись атомарна (временный файл и rename): параллельные воркеры не увидят недописанный файл.
+    """
+    path = invoice_path(invoice, fmt, shop_id)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}')
+    tmp.write_bytes(render(invoice.for_shop(shop_id) if shop_id is not None else invoice, fmt))
+    os.replace(tmp, path)
+    return path
+
+
+def prune(retention: timedelta = RETENTION) -> int:
+    """
+    Удаляет файлы накладных и сводок старше retention.
+
+    :return: Число удалённых файлов
+    """
+    root = Path(settings.INVOICE_ROOT)
+    if not root.exists():
+        return 0
+    deadline = time.time() - retention.total_seconds()
+    removed = 0
+    for path in root.rglob('*'):
+        if path.is_file() and path.stat().st_mtime < deadline:
+            path.unlink(missing_ok=True)
+            removed += 1
+    for directory in root.iterdir():
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
+    return removed
+
+
+def render_orders(order_ids: list[int]) -> list[dict]:
+    """
+    Отрисовывает накладные заказов (целиком и по каждому магазину) во всех форматах.
+    Выполняется в процессах-воркерах команды send_invoices, поэтому возвращает только простые типы.
+
+    :return: По заказу: id, почта покупателя, файлы накладной и файлы с почтой по каждому магазину
+    """
+    result = []
+    for invoice in load(order_ids):
+        result.append({
+            'order': invoice.order_id,
+            'email': invoice.email,
+            'files': {fmt: str(render_cached(invoice, fmt)) for fmt in INVOICE_FORMATS},
+            'shops': [
+                {'shop': shop_id, 'email': invoice.shop_emails.get(shop_id),
+                 'files': {fmt: str(render_cached(invoice, fmt, shop_id)) for fmt in INVOICE_FORMATS}}
+                for shop_id in invoice.shop_ids
+            ],
+        })
+    return result
+
+
+def render_digests(order_ids: list[int], name: str,
+                   chunk_size: int = 500) -> tuple[Path, dict[int, tuple[str | None, Path]]]:
+    """
+    Сводные CSV-накладные по пачке заказов: общая для администратора и по одной на магазин.
+    Заказы читаются пачками по chunk_size, по одному запросу на пачку.
+
+    :return: Путь общей сводки и {id магазина: (почта поставщика, путь сводки магазина)}
+    """
+    root = Path(settings.INVOICE_ROOT) / 'digests'
+    root.mkdir(parents=True, exist_ok=True)
+    files, writers, emails = {}, {}, {}
+
+    def writer_for(key):
+        if key not in writers:
+            path = root / (f'{name}.csv' if key is None else f'{name}-shop-{key}.csv')
+            files[key] = path.open('w', encoding='utf-8-sig', newline='')
+            writers[key] = csv.writer(files[key])
+            writers[key].writerow(CSV_COLUMNS)
+        return writers[key]
+
+    try:
+        writer_for(None)
+        for start in range(0, len(order_ids), chunk_size):
+            for invoice in load(order_ids[start:start + chunk_size]):
+                write_csv_rows(writers[None], [invoice])
+                for shop_id in invoice.shop_ids:
+                    write_csv_rows(writer_for(shop_id), [invoice.for_shop(shop_id)])
+                emails.update(invoice.shop_emails)
+    finally:
+        for file in files.values():
+            file.close()
+    shops = {key: (emails.get(key), Path(file.name)) for key, file in files.items() if key is not None}
+    return Path(files[None].name), shops
@@ -0,0 +1,202 @@
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import F
+from django.utils import timezone
+
+from shop.models import ImportJob, User
+from shop.utils.feeds import detect_format, open_feed
+from shop.utils.importer import PriceListImporter, PriceListError, ImportStats, IMPORT_MODES
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в секундах) задание публикует свой прогресс
+PROGRESS_INTERVAL = 1.0
+# На сколько задание закрепляется за захватившим его воркером. Пока импорт идёт, воркер
+# продлевает аренду отметкой в кэше прогресса (в базе её не видно до конца транзакции импорта);
+# задание упавшего воркера после истечения аренды захватывается снова
+LEASE = timedelta(minutes=5)
+# Сколько раз задание запускается, прежде чем падения воркеров на нём считаются его ошибкой
+MAX_ATTEMPTS = 3
+
+
+def _progress_cache():
+    return caches[settings.IMPORT_JOBS_CACHE]
+
+
+def _progress_key(job_id: int) -> str:
+    return f'import-job:{job_id}:progress'
+
+
+def _heartbeat_key(job_id: int) -> str:
+    return f'import-job:{job_id}:heartbeat'
+
+
+def _heartbeat(job_id: int) -> None:
+    _progress_cache().set(_heartbeat_key(job_id), True, timeout=int(LEASE.total_seconds()))
+
+
+def enqueue_import(user: User, upload: UploadedFile, fmt: str | None = None, mode: str = 'diff',
+                   shop_name: str | None = None) -> ImportJob:
+    """
+    Сохраняет загруженный прайс-лист на диск и ставит задание на импорт в очередь.
+    При IMPORT_JOBS_EAGER=True задание выполняется сразу, в текущем процессе.
+
+    :raises PriceListError: если формат или режим импорта указаны неверно
+    """
+    detect_format(upload.name, fmt)
+    if mode not in IMPORT_MODES:
+        raise PriceListError(f'Unknown import mode: {mode}')
+
+    job = ImportJob(user=user, format=fmt or '', mode=mode, shop_name=shop_name or '', bytes_total=upload.size)
+    job.file.save(upload.name, upload, save=False)
+    job.save()
+
+    if settings.IMPORT_JOBS_EAGER:
+        run_import_job(job)
+    return job
+
+
+def _claim(jobs, now) -> bool:
+    """
+    Закрепляет задание за текущим воркером на LEASE.
+    """
+    return jobs.update(state='running', started_at=now, lease=uuid.uuid4().hex, lease_expires_at=now + LEASE,
+                       attempts=F('attempts') + 1) > 0
+
+
+def claim_next_job() -> ImportJob | None:
+    """
+    Забирает самое старое задание из очереди, а если очередь пуста — задание упавшего воркера:
+    оно осталось в состоянии running, его аренда истекла, а отметка воркера в кэше пропала.
+
+    Захват — условный UPDATE по состоянию (и метке прежнего воркера), поэтому несколько
+    воркеров могут безопасно разбирать одну очередь. Задание, на котором воркеры
+    падали MAX_ATTEMPTS раз, завершается ошибкой.
+    """
+    now = timezone.now()
+    pending = ImportJob.objects.filter(state='pending').order_by('id').values_list('id', flat=True)[:10]
+    for pk in pending:
+        if _claim(ImportJob.objects.filter(pk=pk, state='pending'), now):
+            return ImportJob.objects.select_related('user').get(pk=pk)
+
+    expired = ImportJob.objects.filter(state='running', lease_expires_at__lte=now).order_by('id')\
+        .values_list('id', 'lease', 'attempts')[:10]
+    for pk, lease, attempts in expired:
+        if _progress_cache().get(_heartbeat_key(pk)):
+            continue
+        jobs = ImportJob.objects.filter(pk=pk, state='running', lease=lease)
+        if attempts >= MAX_ATTEMPTS:
+            if jobs.update(state='failed', finished_at=now, lease='', lease_expires_at=None,
+                           error=f'Import worker stopped {attempts} times while running this job'):
+                _delete_file(ImportJob.objects.get(pk=pk))
+        elif _claim(jobs, now):
+            logger.warning('Import job %s: lease expired, job reclaimed', pk)
+            return ImportJob.objects.select_related('user').get(pk=pk)
+    return None
+
+
+def run_import_job(job: ImportJob) -> ImportJob:
+    """
+    Выполняет задание импорта и сохраняет итог (статистику или ошибку) в ImportJob.
+    """
+    if job.state == 'pending':
+        if not _claim(ImportJob.objects.filter(pk=job.pk, state='pending'), timezone.now()):
+            job.refresh_from_db()
+            return job
+        job.refresh_from_db()
+
+    _heartbeat(job.pk)
+    try:
+        with job.file.open('rb') as stream:
+            reporter = _ProgressReporter(job, stream)
+            feed = open_feed(stream, fmt=job.format or None, shop=job.shop_name or None)
+            stats = PriceListImporter(job.user, mode=job.mode, progress=reporter).run_feed(feed)
+    except PriceListError as e:
+        _finish(job, 'failed', error=str(e))
+    except Exception as e:
+        logger.exception('Import job %s failed', job.pk)
+        _finish(job, 'failed', error=f'Internal error: {e}')
+    else:
+        _finish(job, 'done', stats=stats)
+    return job
+
+
+def job_progress(job: ImportJob) -> dict:
+    """
+    Возвращает прогресс задания: для выполняющихся — из кэша прогресса,
+    для остальных — из сохранённых в базе итогов.
+    """
+    rows, processed = job.rows_processed, job.bytes_processed
+    if job.state == 'running':
+        live = _progress_cache().get(_progress_key(job.pk))
+        if live:
+            rows, processed = live['rows'], live['bytes']
+
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+
+    return {
+        'rows_processed': rows,
+        'bytes_processed': processed,
+        'percent': round(100 * processed / job.bytes_total, 1) if job.bytes_total else None,
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed else None,
+    }
+
+
+def _delete_file(job: ImportJob) -> None:
+    """
+    Удаляет сохранённый прайс-лист завершённого задания: повторно он не импортируется.
+    """
+    if job.file:
+        job.file.delete(save=False)
+        ImportJob.objects.filter(pk=job.pk).update(file='')
+
+
+def _finish(job: ImportJob, state: str, stats: ImportStats | None = None, error: str = '') -> None:
+    job.state = state
+    job.finished_at = timezone.now()
+    job.error = error
+    job.lease = ''
+    job.lease_expires_at = None
+    if stats:
+        job.stats = stats.as_dict()
+        job.rows_processed = stats.rows
+        job.bytes_processed = job.bytes_total
+    job.save(update_fields=['state', 'finished_at', 'error', 'stats', 'rows_processed', 'bytes_processed',
+                            'lease', 'lease_expires_at'])
+    _progress_cache().delete_many([_progress_key(job.pk), _heartbeat_key(job.pk)])
+    _delete_file(job)
+
+
+class _ProgressReporter:
+    """
+    Публикует прогресс импорта в кэш не чаще раза в PROGRESS_INTERVAL секунд
+    и заодно продлевает аренду задания.
+
+    Прогресс хранится вне базы: импорт идёт одной транзакцией,
+    и её промежуточное состояние другим соединениям не видно.
+    """
+
+    def __init__(self, job: ImportJob, stream):
+        self.job = job
+        self.stream = stream
+        self.published = 0.0
+
+    def __call__(self, stats: ImportStats) -> None:
+        now = time.monotonic()
+        if now - self.published < PROGRESS_INTERVAL:
+            return
+        self.published = now
+        try:
+            position = self.stream.tell()
+        except (OSError, ValueError):
+            position = 0
+        _progress_cache().set(_progress_key(self.job.pk), {'rows': stats.rows, 'bytes': position}, timeout=3600)
+        _heartbeat(self.job.pk)
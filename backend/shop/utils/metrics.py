@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Сколько последних задержек каждого эндпоинта хранится для перцентилей
+LATENCY_SAMPLES = 1000
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+_current: ContextVar['RequestMetrics | None'] = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_endpoints: dict[str, 'EndpointStats'] = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Запрос выполнил больше SQL-запросов, чем разрешает query_budget представления
+    (выбрасывается только при QUERY_BUDGET_STRICT, то есть в тестах).
+    """
+
+
+class RequestMetrics:
+    """
+    Метрики одного HTTP-запроса; время в секундах.
+    """
+    __slots__ = ('queries', 'db_time', 'serialization', 'total', 'budget')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization = 0.0
+        self.total = 0.0
+        self.budget: int | None = None
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+    def server_timing(self) -> str:
+        """
+        Значение заголовка Server-Timing (показывается в инструментах разработчика браузера).
+        """
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'serialization;dur={self.serialization * 1000:.1f}, total;dur={self.total * 1000:.1f}')
+
+
+class EndpointStats:
+    """
+    Накопленные метрики эндпоинта в этом процессе.
+    """
+    __slots__ = ('requests', 'errors', 'over_budget', 'queries', 'max_queries', 'db_time', 'serialization',
+                 'total', 'latencies')
+
+    def __init__(self):
+        self.requests = self.errors = self.over_budget = self.queries = self.max_queries = 0
+        self.db_time = self.serialization = self.total = 0.0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(share: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000, 2)
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'over_budget': self.over_budget,
+            'queries_avg': round(self.queries / self.requests, 2),
+            'queries_max': self.max_queries,
+            'db_ms_avg': round(self.db_time / self.requests * 1000, 2),
+            'serialization_ms_avg': round(self.serialization / self.requests * 1000, 2),
+            'total_ms_avg': round(self.total / self.requests * 1000, 2),
+            'total_ms_p50': percentile(0.5),
+            'total_ms_p95': percentile(0.95),
+            'total_ms_max': round(latencies[-1] * 1000, 2),
+        }
+
+
+def endpoint_key(method: str, route: str | None) -> str:
+    """
+    Ключ эндпоинта: метод и шаблон маршрута (api/order/<int:pk>/), а не конкретный путь,
+    поэтому число ключей ограничено числом маршрутов.
+    """
+    return f'{method if method in HTTP_METHODS else "OTHER"} {route if route is not None else "<unmatched>"}'
+
+
+@contextmanager
+def collect():
+    """
+    Делает метрики доступными коду запроса через current() на время блока.
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def current() -> RequestMetrics | None:
+    return _current.get()
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Добавляет время блока к времени сериализации текущего запроса (вне запроса ничего не делает).
+    """
+    metrics = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialization += time.perf_counter() - start
+
+
+def record(key: str, metrics: RequestMetrics, status_code: int) -> None:
+    with _lock:
+        stats = _endpoints.get(key)
+        if stats is None:
+            stats = _endpoints[key] = EndpointStats()
+        stats.requests += 1
+        stats.errors += status_code >= 500
+        stats.over_budget += metrics.over_budget
+        stats.queries += metrics.queries
+        stats.max_queries = max(stats.max_queries, metrics.queries)
+        stats.db_time += metrics.db_time
+        stats.serialization += metrics.serialization
+        stats.total += metrics.total
+        stats.latencies.append(metrics.total)
+
+
+def snapshot() -> dict[str, dict]:
+    """
+    Метрики эндпоинтов этого процесса: число запросов, ошибок 5xx и превышений бюджета,
+    SQL-запросы на запрос, время в базе, сериализации и полное время (среднее, p50, p95, максимум).
+    """
+    with _lock:
+        return {key: stats.as_dict() for key, stats in sorted(_endpoints.items())}
+
+
+def reset() -> None:
+    with _lock:
+        _endpoints.clear()
@@ -0,0 +1,134 @@
+import logging
+import smtplib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from shop.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# Сколько писем воркер захватывает и отправляет через одно соединение
+BATCH_SIZE = 100
+# На сколько захваченные письма скрываются от других воркеров: если воркер упал,
+# не отправив их, после этого срока письма снова попадут в очередь
+LEASE = timedelta(minutes=5)
+# Повторы с экспоненциальной задержкой: 30 с, 1 мин, 2 мин, ... но не больше часа
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+MAX_ATTEMPTS = 8
+# Ошибки соединения, после которых отправлять оставшиеся письма пачки бессмысленно
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def enqueue(subject: str, body: str, recipients: list[str], from_email: str | None = None,
+            attachments: list[str] = ()) -> OutboxEmail:
+    """
+    Ставит письмо в очередь. Запрос, вызвавший отправку, не ждёт почтовый сервер:
+    письмо отправит воркер (`python manage.py send_outbox`).
+    При EMAIL_OUTBOX_EAGER=True очередь отправляется сразу после фиксации транзакции.
+
+    :param attachments: Пути к файлам, которые прикладываются к письму при отправке
+    """
+    message = OutboxEmail.objects.create(subject=subject, body=body, recipients=list(recipients),
+                                         from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+                                         attachments=[str(path) for path in attachments])
+    if settings.EMAIL_OUTBOX_EAGER:
+        transaction.on_commit(send_pending)
+    return message
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Задержка перед следующей попыткой после attempts неудачных.
+    """
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def claim_batch(size: int = BATCH_SIZE) -> list[OutboxEmail]:
+    """
+    Захватывает пачку готовых к отправке писем.
+
+    Захват — один условный UPDATE, помечающий письма меткой воркера и откладывающий
+    их на LEASE, поэтому несколько воркеров могут разбирать одну очередь.
+    """
+    now = timezone.now()
+    lease = uuid.uuid4().hex
+    ready = OutboxEmail.objects.filter(state='pending', next_attempt_at__lte=now).order_by('id')\
+        .values_list('id', flat=True)[:size]
+    claimed = OutboxEmail.objects.filter(pk__in=list(ready), state='pending', next_attempt_at__lte=now)\
+        .update(lease=lease, next_attempt_at=now + LEASE)
+    if not claimed:
+        return []
+    return list(OutboxEmail.objects.filter(lease=lease, state='pending').order_by('id'))
+
+
+def send_batch(messages: list[OutboxEmail]) -> tuple[int, int]:
+    """
+    Отправляет пачку писем через одно SMTP-соединение и сохраняет итог.
+
+    Письма передаются бэкенду по одному в уже открытом соединении, чтобы ошибка
+    одного адреса не мешала остальным; при потере соединения оставшиеся письма
+    откладываются целиком.
+
+    :return: Число отправленных и неотправленных писем
+    """
+    sent, failed = [], []
+    try:
+        with get_connection(fail_silently=False) as connection:
+            for message in messages:
+                email = EmailMessage(message.subject, message.body, message.from_email or None, message.recipients,
+                                     connection=connection)
+                try:
+                    for path in message.attachments:
+                        email.attach_file(path)
+                    connection.send_messages([email])
+                except CONNECTION_ERRORS:
+                    raise
+                except (OSError, ValueError) as e:
+                    # Отказ сервера принять письмо (SMTPException — подкласс OSError), неверный заголовок,
+                    # пропавшее вложение
+                    failed.append((message, e))
+                    continue
+                sent.append(message)
+    except (OSError, ValueError) as e:
+        logger.warning('Outbox connection failed: %s', e)
+        done = {message.pk for message in sent} | {message.pk for message, _ in failed}
+        failed.extend((message, e) for message in messages if message.pk not in done)
+
+    now = timezone.now()
+    if sent:
+        OutboxEmail.objects.filter(pk__in=[message.pk for message in sent])\
+            .update(state='sent', sent_at=now, lease='', error='')
+    for message, error in failed:
+        message.attempts += 1
+        message.error = str(error)
+        message.lease = ''
+        if message.attempts >= MAX_ATTEMPTS:
+            message.state = 'failed'
+        else:
+            message.next_attempt_at = now + retry_delay(message.attempts)
+    if failed:
+        OutboxEmail.objects.bulk_update([message for message, _ in failed],
+                                        ['attempts', 'error', 'lease', 'state', 'next_attempt_at'])
+    return len(sent), len(failed)
+
+
+def send_pending(batch_size: int = BATCH_SIZE) -> tuple[int, int]:
+    """
+    Отправляет все готовые письма пачками по batch_size.
+
+    :return: Число отправленных и неотправленных писем
+    """
+    total_sent = total_failed = 0
+    while True:
+        messages = claim_batch(batch_size)
+        if not messages:
+            return total_sent, total_failed
+        sent, failed = send_batch(messages)
+        total_sent += sent
+        total_failed += failed
@@ -0,0 +1,86 @@
+import base64
+import json
+from datetime import date
+from typing import Any
+
+from django.db.models import Q, QuerySet
+
+
+class InvalidCursor(ValueError):
+    """
+    Курсор повреждён или получен для другой сортировки.
+    """
+
+
+def _encode_value(value: Any) -> str:
+    # Даты и время — в ISO 8601 (с микросекундами и смещением): такое значение база сравнивает точно
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def encode_cursor(ordering: str, value: Any, pk: int) -> str:
+    """
+    Упаковывает позицию последней записи страницы в непрозрачный токен.
+    """
+    raw = json.dumps([ordering, value, pk], separators=(',', ':'), default=_encode_value)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, ordering: str) -> tuple[Any, int]:
+    """
+    Распаковывает токен курсора и проверяет, что он выдан для той же сортировки.
+
+    :raises InvalidCursor: если токен не разбирается или сортировка другая
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor_ordering, value, pk = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if cursor_ordering != ordering or not isinstance(pk, int):
+        raise InvalidCursor('Cursor does not match ordering')
+    return value, pk
+
+
+def keyset_filter(queryset: QuerySet, ordering: str, value: Any = None, pk: int | None = None,
+                  pk_field: str = 'id') -> QuerySet:
+    """
+    Сортирует выборку по (ordering, pk) и, если передана позиция, оставляет записи после неё.
+
+    Условие записано как `field >= value AND (field > value OR pk > last_pk)`:
+    ведущее сравнение по полю позволяет базе начать чтение индекса (поле, pk)
+    сразу с нужного места, а не сканировать его от начала.
+    """
+    descending = ordering.startswith('-')
+    field = ordering.lstrip('-')
+    order_by = [ordering] if field == pk_field else [ordering, f'-{pk_field}' if descending else pk_field]
+    queryset = queryset.order_by(*order_by)
+    if pk is None:
+        return queryset
+
+    op = 'lt' if descending else 'gt'
+    if field == pk_field:
+        return queryset.filter(**{f'{pk_field}__{op}': pk})
+    return queryset.filter(**{f'{field}__{op}e': value})\
+        .filter(Q(**{f'{field}__{op}': value}) | Q(**{f'{pk_field}__{op}': pk}))
+
+
+def keyset_page(queryset: QuerySet, ordering: str, cursor: str | None, limit: int,
+                pk_field: str = 'id') -> tuple[list, str | None]:
+    """
+    Возвращает страницу, отсортированную по (ordering, pk), начиная после курсора.
+
+    Вместо OFFSET используется условие на ключ сортировки, поэтому глубокие
+    страницы стоят столько же, сколько первая (при наличии индекса по (поле, pk)).
+
+    :param ordering: Поле сортировки, с `-` для убывания; может совпадать с pk_field
+    :param cursor: Токен из предыдущей страницы (или None для первой)
+    :return: Записи страницы и токен следующей страницы (None, если это последняя)
+    :raises InvalidCursor: если курсор неверен
+    """
+    value, pk = decode_cursor(cursor, ordering) if cursor else (None, None)
+    items = list(keyset_filter(queryset, ordering, value, pk, pk_field)[:limit + 1])
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    last = items[-1]
+    return items, encode_cursor(ordering, getattr(last, ordering.lstrip('-')), getattr(last, pk_field))
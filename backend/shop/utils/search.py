@@ -0,0 +1,177 @@
+import re
+from typing import Iterable
+
+from django.db import connection
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+
+from shop.models import ProductInfo, ProductParameter, ProductSearchDocument
+from shop.utils.db import chunked
+
+# Внешняя (external content) таблица FTS5 поверх ProductSearchDocument, создаётся миграцией 0005_product_search
+FTS_TABLE = 'shop_productsearch_fts'
+DOCUMENT_TABLE = ProductSearchDocument._meta.db_table
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def like_pattern(token: str) -> str:
+    """
+    Шаблон LIKE для подстроки: `%`, `_` и обратная косая черта в слове экранируются
+    (подчёркивание TOKEN_RE считает частью слова).
+    """
+    escaped = token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def normalize(text: str) -> str:
+    """
+    Приводит текст к виду, в котором он хранится в индексе: нижний регистр, `ё` -> `е`.
+
+    Токенизатор unicode61 снимает диакритику только с латиницы, поэтому
+    `ёлка` и `елка` без этой замены были бы разными словами.
+    """
+    return text.lower().replace('ё', 'е')
+
+
+def parse_query(query: str) -> list[str]:
+    """
+    Разбивает поисковую строку на нормализованные слова (знаки препинания отбрасываются).
+    """
+    return TOKEN_RE.findall(normalize(query))
+
+
+def build_text(name: str, model: str = '', description: str = '', values: Iterable[str] = ()) -> str:
+    """
+    Собирает текст поискового документа из названия товара, модели,
+    описания предложения и значений его параметров.
+    """
+    return normalize(' '.join(part for part in (name, model, description, *values) if part))
+
+
+def reindex(ids: Iterable[int]) -> int:
+    """
+    Пересобирает поисковые документы указанных предложений.
+
+    Документ перезаписывается, только если его текст изменился: так индекс
+    не тратит время на строки, у которых поменялись лишь цена или остаток.
+
+    :return: Число записанных документов
+    """
+    written = 0
+    for batch in chunked(sorted(set(ids)), 1000):
+        rows = ProductInfo.objects.filter(pk__in=batch)\
+            .values_list('id', 'product__name', 'model', 'description')
+        values: dict[int, list[str]] = {}
+        parameters = ProductParameter.objects.filter(product_info_id__in=batch)\
+            .order_by('parameter_id').values_list('product_info_id', 'value')
+        for info_id, value in parameters:
+            values.setdefault(info_id, []).append(value)
+
+        current = dict(ProductSearchDocument.objects.filter(pk__in=batch).values_list('pk', 'text'))
+        documents = []
+        for pk, name, model, description in rows:
+            text = build_text(name, model, description, values.get(pk, ()))
+            if current.get(pk) != text:
+                documents.append(ProductSearchDocument(product_info_id=pk, text=text))
+
+        ProductSearchDocument.objects.bulk_create(documents, update_conflicts=True, unique_fields=['product_info'],
+                                                  update_fields=['text'])
+        written += len(documents)
+    return written
+
+
+def reindex_product(product_id: int) -> int:
+    """
+    Пересобирает документы всех предложений товара (после переименования товара).
+    """
+    return reindex(ProductInfo.objects.filter(product_id=product_id).values_list('id', flat=True))
+
+
+class SQLiteBackend:
+    """
+    Поиск по FTS5: префиксное совпадение всех слов запроса, ранжирование по bm25.
+    """
+
+    def _match(self, tokens: list[str]) -> str:
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def filter(self, queryset: QuerySet, tokens: list[str]) -> QuerySet:
+        matched = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [self._match(tokens)])
+        return queryset.filter(pk__in=matched)
+
+    def rank(self, queryset: QuerySet, tokens: list[str]) -> QuerySet:
+        # Ранг доступен только в запросе к самой FTS-таблице, поэтому она присоединяется
+        # к выборке: коррелированный подзапрос выполнял бы MATCH заново для каждой строки.
+        # bm25 тем меньше, чем релевантнее документ.
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {ProductInfo._meta.db_table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[self._match(tokens)],
+            select={'search_rank': f'{FTS_TABLE}.rank'},
+        ).order_by('search_rank', 'id')
+
+
+class PostgreSQLBackend:
+    """
+    Поиск по tsvector с префиксными лексемами плюс подстрочное совпадение
+    через триграммный индекс (как у прежнего icontains); ранжирование по ts_rank.
+    """
+
+    def _tsquery(self, tokens: list[str]) -> str:
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def filter(self, queryset: QuerySet, tokens: list[str]) -> QuerySet:
+        matched = RawSQL(
+            f"SELECT product_info_id FROM {DOCUMENT_TABLE} "
+            f"WHERE to_tsvector('simple', text) @@ to_tsquery('simple', %s) OR text LIKE ALL(%s)",
+            [self._tsquery(tokens), [like_pattern(token) for token in tokens]],
+        )
+        return queryset.filter(pk__in=matched)
+
+    def rank(self, queryset: QuerySet, tokens: list[str]) -> QuerySet:
+        queryset = self.filter(queryset, tokens)
+        rank = RawSQL(
+            f"SELECT ts_rank(to_tsvector('simple', text), to_tsquery('simple', %s)) FROM {DOCUMENT_TABLE} "
+            f"WHERE product_info_id = {ProductInfo._meta.db_table}.id",
+            [self._tsquery(tokens)],
+        )
+        return queryset.annotate(search_rank=rank).order_by('-search_rank', 'id')
+
+
+class FallbackBackend:
+    """
+    Для прочих СУБД: подстрочный поиск по нормализованному тексту документа, без ранжирования.
+    """
+
+    def filter(self, queryset: QuerySet, tokens: list[str]) -> QuerySet:
+        for token in tokens:
+            queryset = queryset.filter(search_document__text__contains=token)
+        return queryset
+
+    def rank(self, queryset: QuerySet, tokens: list[str]) -> QuerySet:
+        return self.filter(queryset, tokens)
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackBackend)()
+
+
+def search(queryset: QuerySet, query: str, ranked: bool = False) -> QuerySet:
+    """
+    Оставляет в выборке предложений те, чей поисковый документ содержит все слова запроса
+    (по префиксу, без учёта регистра и `ё`).
+
+    :param ranked: Отсортировать по релевантности (иначе порядок выборки не меняется)
+    """
+    tokens = parse_query(query)
+    if not tokens:
+        return queryset.none()
+    backend = get_backend()
+    return backend.rank(queryset, tokens) if ranked else backend.filter(queryset, tokens)
@@ -0,0 +1,71 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from shop.models import Shop
+
+VERSION_KEY = 'shops:state:version'
+
+_lock = threading.Lock()
+_version: str | None = None
+_closed: frozenset[int] = frozenset()
+
+
+def _versions():
+    return caches[settings.SHOP_STATE_CACHE]
+
+
+def _current_version() -> str:
+    version = _versions().get(VERSION_KEY)
+    if version is None:
+        # Как и поколения каталога — случайный токен: вытесненная версия не совпадёт со старой
+        version = uuid.uuid4().hex
+        if not _versions().add(VERSION_KEY, version, timeout=None):
+            version = _versions().get(VERSION_KEY, version)
+    return version
+
+
+def closed_shop_ids() -> frozenset[int]:
+    """
+    Возвращает id магазинов, которые сейчас не принимают заказы.
+
+    Множество хранится в памяти процесса и перечитывается из базы (одним запросом
+    на все магазины) только после смены версии в общем кэше, поэтому проверка
+    корзины из любого числа магазинов не добавляет запросов к базе.
+    """
+    global _version, _closed
+    version = _current_version()
+    if version == _version:
+        return _closed
+    with _lock:
+        if version != _version:
+            _closed = frozenset(Shop.objects.filter(state=False).values_list('id', flat=True))
+            _version = version
+        return _closed
+
+
+def is_open(shop_id: int) -> bool:
+    return shop_id not in closed_shop_ids()
+
+
+def invalidate() -> None:
+    """
+    Меняет версию состояний магазинов после фиксации транзакции:
+    все процессы перечитают их при следующей проверке.
+    """
+    transaction.on_commit(lambda: _versions().set(VERSION_KEY, uuid.uuid4().hex, timeout=None))
+
+
+def set_state(shop_id: int, state: bool) -> bool:
+    """
+    Включает или выключает приём заказов магазином.
+
+    :return: False, если магазин не найден
+    """
+    updated = Shop.objects.filter(pk=shop_id).update(state=state)
+    if updated:
+        invalidate()
+    return updated > 0
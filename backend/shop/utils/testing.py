@@ -0,0 +1,56 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.test import override_settings
+
+from shop.utils.db import QueryCounter
+
+
+class QueryBudgetMixin:
+    """
+    Примесь к django.test.TestCase: запросы тестового клиента к представлениям,
+    превысившие их query_budget, роняют тест (QUERY_BUDGET_STRICT), а у ответов
+    доступны метрики response.metrics (см. shop.middleware.RequestMetricsMiddleware).
+
+        class CartTests(QueryBudgetMixin, APITestCase):
+            def test_cart(self):
+                response = self.client.get('/api/cart/')
+                self.assertResponseQueries(response, 3)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(override_settings(QUERY_BUDGET_STRICT=True))
+
+    def assertResponseQueries(self, response, limit: int) -> None:
+        """
+        Проверяет, что запрос выполнил не больше limit SQL-запросов (строже, чем бюджет представления).
+        """
+        self.assertLessEqual(response.metrics.queries, limit,
+                             f'{response.metrics.queries} queries, expected at most {limit}')
+
+    @contextmanager
+    def assertMaxQueries(self, limit: int, using: str = 'default'):
+        """
+        Как assertNumQueries, но допускает и меньшее число запросов.
+        """
+        with QueryCounter(using) as counter:
+            yield counter
+        self.assertLessEqual(counter.count, limit, f'{counter.count} queries, expected at most {limit}')
+
+
+class TemporaryMediaMixin:
+    """
+    Примесь к тестам, которые пишут файлы (прайс-листы заданий импорта, накладные):
+    MEDIA_ROOT и INVOICE_ROOT на время класса — временный каталог, удаляемый после тестов.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = Path(tempfile.mkdtemp(prefix='shop-media-'))
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root, INVOICE_ROOT=cls.media_root / 'invoices'))
@@ -0,0 +1,172 @@
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from shop.models import User
+
+_lock = threading.Lock()
+# ключ токена -> (момент устаревания, версия пользователя, токен с загруженным пользователем);
+# порядок — от давно использованных
+_entries: OrderedDict[str, tuple[float, str, Token]] = OrderedDict()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _shared():
+    alias = settings.TOKEN_AUTH_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def _versions():
+    return caches[settings.TOKEN_AUTH_VERSIONS_CACHE]
+
+
+def _shared_key(key: str) -> str:
+    # В общем кэше (файлы, Redis) хранится не сам токен, а его хэш
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _version_key(user_id: int) -> str:
+    return f'auth:user:{user_id}:version'
+
+
+def _version(user_id: int) -> str:
+    """
+    Текущая версия пользователя в общем кэше: меняется при изменении пользователя и удалении его токенов.
+
+    Как и поколения каталога — случайный токен: вытесненная версия не совпадёт со старой.
+    """
+    key = _version_key(user_id)
+    version = _versions().get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not _versions().add(key, version, timeout=None):
+            version = _versions().get(key, version)
+    return version
+
+
+def get(key: str) -> Token | None:
+    """
+    Возвращает токен с пользователем из кэша процесса, затем из общего кэша (если он настроен).
+
+    Запись действительна, пока не изменилась версия пользователя в общем кэше, поэтому
+    сброс в одном процессе сразу видят все остальные. Общий кэш хранит только id и
+    признак активности пользователя, сам пользователь при этом читается из базы.
+
+    Пользователь отдаётся копией: изменения request.user в одном запросе
+    не попадают в кэш и в параллельные запросы.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+    if entry is not None:
+        expires, version, token = entry
+        if expires > now and version == _version(token.user_id):
+            with _lock:
+                if key in _entries:
+                    _entries.move_to_end(key)
+                _stats['local_hits'] += 1
+            return _copy(token)
+        with _lock:
+            if _entries.get(key) is entry:
+                del _entries[key]
+
+    token = _from_shared(key)
+    with _lock:
+        if token is None:
+            _stats['misses'] += 1
+            return None
+        _stats['shared_hits'] += 1
+    return _copy(token)
+
+
+def _from_shared(key: str) -> Token | None:
+    shared = _shared()
+    data = shared.get(_shared_key(key)) if shared else None
+    if data is None or not data['is_active']:
+        return None
+    # Версия читается до пользователя: сброс, случившийся после чтения, сделает запись устаревшей
+    version = _version(data['user_id'])
+    if version != data['version']:
+        return None
+    user = User.objects.filter(pk=data['user_id'], is_active=True).first()
+    if user is None:
+        return None
+    token = Token(key=key, user=user)
+    _put_local(key, version, token, time.monotonic())
+    return token
+
+
+def put(key: str, token: Token) -> None:
+    """
+    Кэширует токен активного пользователя (копию: вызывающий код может менять свой экземпляр).
+
+    Пользователь к этому моменту уже прочитан из базы: сброс, зафиксированный между чтением
+    и этим вызовом, не отменит запись, и она проживёт не дольше TOKEN_AUTH_CACHE_TTL.
+    """
+    if settings.TOKEN_AUTH_CACHE_TTL <= 0:
+        return
+    token = _copy(token)
+    version = _version(token.user_id)
+    _put_local(key, version, token, time.monotonic())
+    shared = _shared()
+    if shared:
+        data = {'user_id': token.user_id, 'is_active': token.user.is_active, 'version': version}
+        shared.set(_shared_key(key), data, timeout=settings.TOKEN_AUTH_CACHE_TTL)
+
+
+def _put_local(key: str, version: str, token: Token, now: float) -> None:
+    with _lock:
+        _entries[key] = (now + settings.TOKEN_AUTH_CACHE_TTL, version, token)
+        _entries.move_to_end(key)
+        while len(_entries) > settings.TOKEN_AUTH_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+
+def _copy(token: Token) -> Token:
+    token = copy.copy(token)
+    token.user = copy.copy(token.user)
+    return token
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Сбрасывает кэшированные токены пользователя (после изменения, деактивации пользователя
+    или удаления его токена): копии этого процесса удаляются сразу, а версия пользователя
+    в общем кэше меняется после фиксации транзакции — и записи всех процессов устаревают.
+    """
+    with _lock:
+        keys = [key for key, (_, _, token) in _entries.items() if token.user_id == user_id]
+        for key in keys:
+            del _entries[key]
+        _stats['invalidations'] += len(keys)
+    transaction.on_commit(lambda: _versions().set(_version_key(user_id), uuid.uuid4().hex, timeout=None))
+
+
+def stats() -> dict:
+    """
+    Счётчики кэша токенов этого процесса: попадания по уровням, промахи, доля попаданий и размер.
+    """
+    with _lock:
+        result = dict(_stats, size=len(_entries))
+    lookups = result['local_hits'] + result['shared_hits'] + result['misses']
+    result['hit_rate'] = round((result['local_hits'] + result['shared_hits']) / lookups, 4) if lookups else None
+    return result
+
+
+def clear(reset_stats: bool = True) -> None:
+    """
+    Очищает кэш процесса (общий кэш не затрагивается).
+    """
+    with _lock:
+        _entries.clear()
+        if reset_stats:
+            for name in _stats:
+                _stats[name] = 0
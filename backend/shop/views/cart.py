@@ -2,8 +2,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from shop.models import Order, OrderItem, ProductInfo
-from shop.serializers import CartSerializer
+from shop.models import Order
+from shop.serializers import FastCartSerializer
+from shop.utils import cart as cart_ops
+from shop.utils.inventory import ShopClosed
 from rest_framework.request import Request
 from rest_framework.response import Response
 
@@ -13,15 +15,15 @@ class CartView(APIView):
     """
 
     permission_classes = [IsAuthenticated]
+    # Первое обращение: создание корзины и загрузка состояний магазинов в процессе
+    query_budget = 7
 
     def get(self, request: Request) -> Response:
         """
         Возвращает содержимое корзины текущего пользователя.
         """
-        cart, _ = Order.objects.get_or_create(user=request.user, state='basket')
-        cart.refresh_from_db()
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        basket_id = cart_ops.get_basket_id(request.user)
+        return Response(FastCartSerializer(Order.objects.filter(pk=basket_id)).data)
 
 
 class CartAddView(APIView):
@@ -29,6 +31,7 @@ class CartAddView(APIView):
     Добавление товара в корзину. Если товар уже есть — увеличивает количество.
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 7
 
     def post(self, request: Request) -> Response:
         """
@@ -36,24 +39,26 @@ class CartAddView(APIView):
         - product_info: ID ProductInfo
         - quantity: количество (по умолчанию 1)
 
-        Создаёт новую запись или увеличивает количество.
+        Создаёт новую запись или увеличивает количество одним атомарным запросом
+        (см. shop.utils.cart), поэтому параллельные добавления не теряют количество.
+        Если магазин товара не принимает заказы, возвращается 409.
         """
-        product_info_id = request.data.get('product_info')
-        quantity = int(request.data.get('quantity', 1))
-
         try:
-            product_info = ProductInfo.objects.get(id=product_info_id)
-        except ProductInfo.DoesNotExist:
-            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        cart, _ = Order.objects.get_or_create(user=request.user, state='basket')
-
+            product_info_id = int(request.data.get('product_info'))
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            return Response({'error': 'product_info and quantity must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 1:
+            return Response({'error': 'quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        basket_id = cart_ops.get_basket_id(request.user)
         try:
-            item = OrderItem.objects.get(order=cart, product_info=product_info)
-            item.quantity += quantity
-            item.save()
-        except OrderItem.DoesNotExist:
-            OrderItem.objects.create(order=cart, product_info=product_info, quantity=quantity)
+            added = cart_ops.add_item(basket_id, product_info_id, quantity)
+        except ShopClosed as e:
+            return Response({'error': str(e), 'items': e.items}, status=status.HTTP_409_CONFLICT)
+        if not added:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
         return Response({'status': 'added'}, status=status.HTTP_201_CREATED)
 
@@ -64,6 +69,7 @@ class CartRemoveView(APIView):
     Удаление позиции из корзины пользователя по item_id.
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 3
 
     def post(self, request: Request) -> Response:
         """
@@ -72,10 +78,45 @@ class CartRemoveView(APIView):
 
         Удаляет позицию из корзины, если найдена.
         """
-        item_id = request.data.get('item_id')
         try:
-            item = OrderItem.objects.get(id=item_id, order__user=request.user, order__state='basket')
-            item.delete()
+            item_id = int(request.data.get('item_id'))
+        except (TypeError, ValueError):
+            return Response({'error': 'item_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if cart_ops.remove_item(request.user, item_id):
             return Response({'status': 'deleted'})
-        except OrderItem.DoesNotExist:
-            return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class CartBatchView(APIView):
+    """
+    Пакетное изменение корзины: список операций add/set/remove за один запрос.
+    """
+    permission_classes = [IsAuthenticated]
+    # Пакет с операциями всех трёх видов в новой корзине; от числа операций не зависит
+    query_budget = 14
+
+    def post(self, request: Request) -> Response:
+        """
+        Ожидает поле operations — список объектов:
+        - {"op": "add", "product_info": id, "quantity": n} — увеличить количество (по умолчанию на 1);
+        - {"op": "set", "product_info": id, "quantity": n} — установить количество (0 — удалить);
+        - {"op": "remove", "product_info": id} — удалить товар из корзины.
+
+        Операции применяются по порядку и атомарно: при ошибке корзина не меняется
+        (409 — если магазин одного из добавляемых товаров не принимает заказы).
+        Возвращает обновлённую корзину в том же виде, что и `cart/`, с полем skipped — id товаров,
+        снятых с продажи во время запроса и потому не попавших в корзину.
+        """
+        try:
+            operations = cart_ops.parse_operations(request.data.get('operations'))
+            basket_id = cart_ops.get_basket_id(request.user)
+            skipped = cart_ops.apply_operations(basket_id, operations)
+        except cart_ops.InvalidCartOperation as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ShopClosed as e:
+            return Response({'error': str(e), 'items': e.items}, status=status.HTTP_409_CONFLICT)
+
+        data = FastCartSerializer(Order.objects.filter(pk=basket_id)).data
+        data['skipped'] = skipped
+        return Response(data)
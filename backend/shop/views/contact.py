@@ -11,6 +11,7 @@ class ContactListView(APIView):
     Получение списка всех контактов текущего пользователя.
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 2
 
     def get(self, request: Request) -> Response:
         """
@@ -26,6 +27,7 @@ class ContactCreateView(APIView):
     Создание нового контактного адреса.
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 2
 
     def post(self, request: Request) -> Response:
         """
@@ -46,6 +48,8 @@ class ContactDeleteView(APIView):
     Удаление контактного адреса пользователя по его ID.
     """
     permission_classes = [IsAuthenticated]
+    # Вместе с контактом каскадно удаляются его заказы и их позиции
+    query_budget = 7
 
     def delete(self, request: Request, pk: int) -> Response:
         """
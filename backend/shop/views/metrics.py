@@ -0,0 +1,35 @@
+import os
+
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from shop.utils import metrics, token_cache
+
+
+class MetricsView(APIView):
+    """
+    Метрики запросов по эндпоинтам (см. shop.middleware.RequestMetricsMiddleware)
+    и кэша токенов. Только для администраторов (is_staff).
+
+    Метрики накапливаются в памяти процесса: при нескольких процессах сервера каждый
+    ответ описывает тот процесс, который его вернул (поле pid).
+    """
+    permission_classes = [IsAdminUser]
+    query_budget = 1
+
+    def get(self, request: Request) -> Response:
+        return Response({
+            'pid': os.getpid(),
+            'endpoints': metrics.snapshot(),
+            'token_cache': token_cache.stats(),
+        })
+
+    def delete(self, request: Request) -> Response:
+        """
+        Сбрасывает накопленные метрики эндпоинтов этого процесса.
+        """
+        metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
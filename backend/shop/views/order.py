@@ -1,19 +1,39 @@
+from typing import Iterator
+
 from rest_framework.views import APIView
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from shop.models import Order, Contact
-from shop.serializers import OrderSerializer
+from shop.models import Order, Contact, STATE_CHOICES
+from shop.serializers import FastOrderSerializer
+from shop.utils import fastjson, inventory
 from shop.utils.email import send_order_confirmation_email
 from rest_framework.request import Request
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from shop.utils.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+
+# История заказов: от недавно оформленных к старым, ключ курсора — (confirmed_at, id)
+ORDER_HISTORY_ORDERING = '-confirmed_at'
+ORDER_HISTORY_STATES = {state for state, _ in STATE_CHOICES} - {'basket'}
+MAX_ORDER_PAGE = 100
+# История без курсора отдаётся потоком: заказы читаются и кодируются пачками такого размера
+ORDER_STREAM_BATCH = 200
 
 
 class OrderConfirmView(APIView):
     """
     Подтверждает заказ пользователя, переводя его из состояния 'basket' в 'confirmed',
-    присваивает контакт (адрес доставки) и отправляет email-уведомление.
+    присваивает контакт (адрес доставки) и ставит в очередь email-уведомление.
+
+    Товар заказа резервируется (списывается с остатков) в той же транзакции,
+    см. shop.utils.inventory; при нехватке товара или закрытом магазине
+    возвращается 409, а корзина остаётся без изменений.
     """
     permission_classes = [IsAuthenticated]
+    # Без query_budget: остатки списываются условным UPDATE на каждую позицию заказа
 
     def post(self, request: Request) -> Response:
         order_id = request.data.get('order_id')
@@ -28,30 +48,119 @@ class OrderConfirmView(APIView):
             return Response({'error': 'Invalid contact'}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            order = Order.objects.get(id=order_id, user=request.user, state='basket')
-        except Order.DoesNotExist:
+            confirmed = inventory.confirm_order(order_id, request.user, contact)
+        except inventory.ReservationError as e:
+            return Response({'error': str(e), 'items': e.items}, status=status.HTTP_409_CONFLICT)
+        if not confirmed:
             return Response({'error': 'Basket not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        order.contact = contact
-        order.state = 'confirmed'
-        order.save()
-
-        # Отправка email-подтверждения
-        send_order_confirmation_email(request.user.email, order.id)
+        # Письмо отправит воркер очереди (send_outbox)
+        send_order_confirmation_email(request.user.email, order_id)
 
         return Response({'status': 'order confirmed and email sent'}, status=status.HTTP_200_OK)
 
 class OrderListView(APIView):
     """
     Возвращает список заказов текущего пользователя, исключая заказы в состоянии 'basket'.
+
+    Фильтры: `state` (можно повторять), `dt_from` и `dt_to` — дата или дата-время оформления
+    заказа (дата в `dt_to` включает весь день).
+
+    Без `cursor` вся история отдаётся одним JSON-массивом (от недавно оформленных заказов
+    к старым) потоком: заказы читаются и кодируются пачками, поэтому память не растёт
+    с длиной истории.
+
+    С параметром `cursor` (для первой страницы пустым) список отдаётся страницами
+    от недавно оформленных заказов к старым по ключу (confirmed_at, id): `{"next": ..., "results": [...]}`,
+    размер страницы — `limit` (по умолчанию 20, не больше 100).
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 3
 
     def get(self, request: Request) -> Response:
-        orders = Order.objects.filter(user=request.user).exclude(state='basket')\
-            .prefetch_related('ordered_items__product_info__product', 'ordered_items__product_info__shop')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        orders = Order.objects.filter(user=request.user).exclude(state='basket')
+
+        states = request.query_params.getlist('state')
+        if states:
+            if not set(states) <= ORDER_HISTORY_STATES:
+                return Response({'error': 'Invalid state'}, status=status.HTTP_400_BAD_REQUEST)
+            orders = orders.filter(state__in=states)
+        try:
+            dt_from = parse_period_bound(request.query_params.get('dt_from'))
+            dt_to = parse_period_bound(request.query_params.get('dt_to'), end=True)
+        except ValueError:
+            return Response({'error': 'dt_from and dt_to must be ISO dates or datetimes'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if dt_from:
+            orders = orders.filter(confirmed_at__gte=dt_from[0])
+        if dt_to:
+            orders = orders.filter(**{'confirmed_at__lt' if dt_to[1] else 'confirmed_at__lte': dt_to[0]})
+
+        if 'cursor' not in request.query_params:
+            if isinstance(getattr(request, 'accepted_renderer', None), JSONRenderer):
+                return fastjson.stream_response(iter_orders(orders), request.accepted_renderer.media_type)
+            return Response(list(iter_orders(orders)))
+
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= MAX_ORDER_PAGE:
+            return Response({'error': f'limit must be between 1 and {MAX_ORDER_PAGE}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        cursor = request.query_params.get('cursor')
+        try:
+            value, pk = decode_cursor(cursor, ORDER_HISTORY_ORDERING) if cursor else (None, None)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Страница читается вместе с одной лишней записью — по ней видно, есть ли следующая
+        serializer = FastOrderSerializer(keyset_filter(orders, ORDER_HISTORY_ORDERING, value, pk)[:limit + 1],
+                                         many=True)
+        page = serializer.data
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            # В курсор — исходное время, а не строка в формате DRF
+            next_cursor = encode_cursor(ORDER_HISTORY_ORDERING, serializer.raw(limit - 1, 'confirmed_at'),
+                                        page[-1]['id'])
+        return Response({'next': next_cursor, 'results': page})
+
+
+def iter_orders(orders, batch_size: int = ORDER_STREAM_BATCH) -> Iterator[dict]:
+    """
+    Заказы выборки в порядке истории, прочитанные пачками по ключу (confirmed_at, id).
+    """
+    value = pk = None
+    while True:
+        serializer = FastOrderSerializer(keyset_filter(orders, ORDER_HISTORY_ORDERING, value, pk)[:batch_size],
+                                         many=True)
+        page = serializer.data
+        yield from page
+        if len(page) < batch_size:
+            return
+        value, pk = serializer.raw(len(page) - 1, 'confirmed_at'), page[-1]['id']
+
+
+def parse_period_bound(value: str | None, end: bool = False) -> tuple[datetime, bool] | None:
+    """
+    Разбирает границу периода: дату-время или дату (начало дня; для конца периода — начало следующего дня).
+
+    :return: (момент, граница исключается) или None, если значение не передано
+    :raises ValueError: если значение не является датой
+    """
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is not None:
+        return (moment if timezone.is_aware(moment) else timezone.make_aware(moment)), False
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f'Invalid date: {value}')
+    if end:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min)), end
 
 
 class OrderDetailView(APIView):
@@ -59,22 +168,23 @@ class OrderDetailView(APIView):
     Возвращает подробную информацию о конкретном заказе пользователя по его id.
     """
     permission_classes = [IsAuthenticated]
+    query_budget = 3
 
     def get(self, request: Request, pk: int) -> Response:
-        try:
-            order = Order.objects.prefetch_related('ordered_items__product_info__product', 'ordered_items__product_info__shop')\
-                .get(pk=pk, user=request.user)
-        except Order.DoesNotExist:
+        data = FastOrderSerializer(Order.objects.filter(pk=pk, user=request.user)).data
+        if data is None:
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
+        return Response(data)
 
 class OrderStatusUpdateView(APIView):
     """
     Позволяет администратору изменить статус заказа.
+
+    Резерв товара следует за статусом (см. shop.utils.inventory.set_state): если товар
+    отменённого заказа или корзины уже нельзя зарезервировать, возвращается 409.
     """
     permission_classes = [IsAuthenticated]
+    # Без query_budget: резервирование и отмена — условный UPDATE на каждую позицию заказа
 
     def patch(self, request: Request, pk: int) -> Response:
         # Проверка, что пользователь — администратор
@@ -92,7 +202,9 @@ class OrderStatusUpdateView(APIView):
         except Order.DoesNotExist:
             return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        order.state = new_state
-        order.save()
+        try:
+            inventory.set_state(order, new_state)
+        except inventory.ReservationError as e:
+            return Response({'error': str(e), 'items': e.items}, status=status.HTTP_409_CONFLICT)
 
         return Response({"status": "updated", "new_state": order.state})
\ No newline at end of file
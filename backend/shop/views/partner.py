@@ -1,111 +1,247 @@
-import yaml
-from yaml.loader import SafeLoader
-from rest_framework.authentication import TokenAuthentication
+from shop.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
-from shop.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from shop.models import Shop, ImportJob, Order, OrderItem
+from shop.serializers import ImportJobSerializer, FastPartnerOrderSerializer
+from shop.utils.importer import PriceListError
+from shop.utils.jobs import enqueue_import
 from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from django.http import HttpRequest
 from typing import Any
+from datetime import timedelta
+from django.db.models import Count, Exists, F, OuterRef, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework import serializers
+from shop.utils import shop_state
+from shop.utils.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter
+from shop.views.order import parse_period_bound
+
+# Лента заказов поставщика: от старых изменений к новым, ключ курсора — (updated_at, id)
+PARTNER_FEED_ORDERING = 'updated_at'
+MAX_PARTNER_FEED_PAGE = 200
+# Изменения моложе этой задержки в ленту ещё не попадают: транзакция, начатая раньше
+# уже выданной записи, могла не успеть зафиксироваться, и курсор бы её перескочил
+PARTNER_FEED_DELAY = timedelta(seconds=5)
+# Отменённые заказы в выручку не входят
+REVENUE_EXCLUDED_STATES = ('basket', 'canceled')
+
+
+def partner_shop_id(request: HttpRequest) -> tuple[int | None, Response | None]:
+    """
+    Магазин текущего поставщика.
+
+    :return: (id магазина, None) или (None, ответ с ошибкой)
+    """
+    if request.user.type != 'shop':
+        return None, Response({'Status': False, 'Error': 'Only for shops'}, status=status.HTTP_403_FORBIDDEN)
+    shop_id = Shop.objects.filter(user=request.user).values_list('id', flat=True).first()
+    if shop_id is None:
+        return None, Response({'Status': False, 'Error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+    return shop_id, None
+
 
 class PartnerUpdate(APIView):
     """
-    API для загрузки поставщиком прайс-листа в формате YAML.
+    API для загрузки поставщиком прайс-листа в формате YAML, JSON Lines или CSV.
     Только пользователи с типом 'shop' имеют доступ.
+
+    Файл сохраняется на диск и импортируется в фоне (см. shop.utils.jobs и
+    команду `run_import_jobs`); ход импорта доступен по `partner/update/<job_id>/`.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser]
 
+    @staticmethod
+    def query_budget(request: HttpRequest) -> int | None:
+        # С IMPORT_JOBS_EAGER импорт идёт в запросе, и число запросов растёт с размером прайс-листа
+        return None if settings.IMPORT_JOBS_EAGER else 3
+
     def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> Response:
         """
-         Обработка POST-запроса с YAML-файлом:
+         Обработка POST-запроса с файлом прайс-листа:
          - Проверка авторизации и типа пользователя
-         - Валидация структуры YAML
-         - Очистка и обновление товаров магазина
-         - Сохранение параметров товаров
+         - Сохранение файла и постановка задания на импорт в очередь
+
+         Необязательное поле `mode`: `diff` (по умолчанию) — обновляются только изменившиеся
+         предложения, отсутствующие снимаются с продажи; `replace` — полная перезаливка.
+         Необязательное поле `format` (yaml, jsonl, csv) — иначе формат определяется по расширению.
+         Для CSV название магазина берётся из поля `shop` или из уже существующего магазина.
 
-         Возвращает JSON с ключом `Status` (True/False) и сообщением об ошибке, если есть.
+         Возвращает JSON с ключом `Status` (True/False), состоянием задания `Job`
+         и сообщением об ошибке, если есть.
          """
         if request.user.type != 'shop':
             return Response({'Status': False, 'Error': 'Only for shops'}, status=status.HTTP_403_FORBIDDEN)
 
-        yaml_file = request.FILES.get('file')
-        if not yaml_file:
+        price_file = request.FILES.get('file')
+        if not price_file:
             return Response({'Status': False, 'Error': 'File is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+        shop_name = request.data.get('shop') or \
+            Shop.objects.filter(user=request.user).values_list('name', flat=True).first()
+
+        try:
+            job = enqueue_import(request.user, price_file, fmt=request.data.get('format'),
+                                 mode=request.data.get('mode', 'diff'), shop_name=shop_name)
+        except PriceListError as e:
+            return Response({'Status': False, 'Error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_status = status.HTTP_202_ACCEPTED if job.state in ('pending', 'running') else status.HTTP_200_OK
+        return Response({'Status': job.state != 'failed', 'Job': ImportJobSerializer(job).data}, status=response_status)
+
+
+class PartnerUpdateStatus(APIView):
+    """
+    Состояние задания импорта прайс-листа текущего пользователя.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 2
+
+    def get(self, request: HttpRequest, pk: int) -> Response:
+        """
+        Возвращает прогресс, скорость обработки, ошибки и итоговые счётчики импорта.
+
+        :param pk: id задания, полученный при загрузке файла
+        """
+        try:
+            job = ImportJob.objects.get(pk=pk, user=request.user)
+        except ImportJob.DoesNotExist:
+            return Response({'Status': False, 'Error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'Status': True, 'Job': ImportJobSerializer(job).data})
+
+
+class PartnerOrderFeed(APIView):
+    """
+    Лента оформленных заказов, в которых есть товары магазина поставщика.
+    В каждом заказе — только позиции этого магазина (по снимкам цен на момент подтверждения)
+    и их сумма `total`.
+
+    Лента упорядочена по времени последнего изменения заказа (подтверждение, смена статуса),
+    поэтому поставщик может опрашивать её инкрементально: запрос с `cursor` из предыдущего
+    ответа возвращает только заказы, изменившиеся после него. Курсор `next` возвращается всегда,
+    в том числе на последней странице, — с ним же выполняется следующий опрос.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 4
+
+    def get(self, request: HttpRequest) -> Response:
+        """
+        Параметры: `cursor` (без него лента читается с начала), `limit` (по умолчанию 50, не больше 200).
+
+        Возвращает `{"Status": true, "Orders": [...], "next": ...}`.
+        """
+        shop_id, error = partner_shop_id(request)
+        if error:
+            return error
+
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            return Response({'Status': False, 'Error': 'limit must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= MAX_PARTNER_FEED_PAGE:
+            return Response({'Status': False, 'Error': f'limit must be between 1 and {MAX_PARTNER_FEED_PAGE}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        cursor = request.query_params.get('cursor')
+        try:
+            value, pk = decode_cursor(cursor, PARTNER_FEED_ORDERING) if cursor else (None, None)
+        except InvalidCursor as e:
+            return Response({'Status': False, 'Error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Магазин у позиции заполняется только при подтверждении, поэтому корзин в выборке нет.
+        # EXISTS, а не JOIN: заказ с несколькими позициями магазина не повторяется, а база читает
+        # индекс (updated_at, id) от курсора и проверяет каждый заказ по индексу (shop, order) —
+        # опрос стоит пропорционально числу изменений, а не всей истории магазина
+        shop_items = OrderItem.objects.filter(shop_id=shop_id, order_id=OuterRef('pk'))
+        orders = Order.objects.filter(Exists(shop_items), updated_at__lte=timezone.now() - PARTNER_FEED_DELAY)
+        serializer = FastPartnerOrderSerializer(keyset_filter(orders, PARTNER_FEED_ORDERING, value, pk)[:limit],
+                                                shop_id, many=True)
+        page = serializer.data
+        # В курсор — исходное время, а не строка в формате DRF
+        next_cursor = encode_cursor(PARTNER_FEED_ORDERING, serializer.raw(len(page) - 1, 'updated_at'),
+                                    page[-1]['id']) if page else cursor
+        return Response({'Status': True, 'Orders': page, 'next': next_cursor})
+
+
+class PartnerRevenue(APIView):
+    """
+    Выручка магазина поставщика по дням оформления (подтверждения) заказов, без отменённых,
+    посчитанная в базе по снимкам цен позиций.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request: HttpRequest) -> Response:
+        """
+        Параметры: `dt_from` и `dt_to` — дата или дата-время (дата в `dt_to` включает весь день).
+
+        Возвращает `{"Status": true, "Revenue": [{"day", "orders", "items", "revenue"}, ...], "Total": ...}`.
+        """
+        shop_id, error = partner_shop_id(request)
+        if error:
+            return error
+
         try:
-            data = yaml.load(yaml_file, Loader=SafeLoader)
-        except Exception as e:
-            return Response({'Status': False, 'Error': f'YAML read error: {e}'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Проверка ключей верхнего уровня
-        required_keys = {'shop', 'categories', 'goods'}
-        if not isinstance(data, dict) or not required_keys.issubset(data):
-            return Response({'Status': False, 'Error': f'Missing one of required keys: {required_keys}'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Проверка магазина
-        shop_name = data.get('shop')
-        if not isinstance(shop_name, str):
-            return Response({'Status': False, 'Error': 'Invalid shop name'}, status=status.HTTP_400_BAD_REQUEST)
-
-        shop, _ = Shop.objects.get_or_create(name=shop_name, user=request.user)
-
-        # Проверка категорий
-        categories = data.get('categories')
-        if not isinstance(categories, list):
-            return Response({'Status': False, 'Error': 'categories must be a list'}, status=status.HTTP_400_BAD_REQUEST)
-
-        for category in categories:
-            if not isinstance(category, dict) or 'id' not in category or 'name' not in category:
-                return Response({'Status': False, 'Error': f'Invalid category structure: {category}'}, status=status.HTTP_400_BAD_REQUEST)
-
-            cat_obj, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-            cat_obj.shops.add(shop)
-
-        ProductInfo.objects.filter(shop=shop).delete()
-
-        goods = data.get('goods')
-        if not isinstance(goods, list):
-            return Response({'Status': False, 'Error': 'goods must be a list'}, status=status.HTTP_400_BAD_REQUEST)
-
-        for item in goods:
-            required_fields = {'id', 'name', 'category', 'price', 'price_rrc', 'quantity', 'parameters'}
-            if not isinstance(item, dict) or not required_fields.issubset(item):
-                return Response({'Status': False, 'Error': f'Missing fields in product item: {item}'}, status=status.HTTP_400_BAD_REQUEST)
-
-            product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-            try:
-                product_info = ProductInfo.objects.create(
-                    product=product,
-                    external_id=item['id'],
-                    model=item.get('model', ''),
-                    price=int(item['price']),
-                    price_rrc=int(item['price_rrc']),
-                    quantity=int(item['quantity']),
-                    shop=shop
-                )
-            except Exception as e:
-                return Response({'Status': False, 'Error': f'Invalid product info: {e}'}, status=status.HTTP_400_BAD_REQUEST)
-
-            parameters = item['parameters']
-            if not isinstance(parameters, dict):
-                return Response({'Status': False, 'Error': f'parameters must be dict in item: {item}'},
-                                status=status.HTTP_400_BAD_REQUEST)
-
-            for name, value in parameters.items():
-                if not isinstance(name, str):
-                    return Response({'Status': False, 'Error': f'Invalid parameter name: {name}'},
-                                    status=status.HTTP_400_BAD_REQUEST)
-
-                param, _ = Parameter.objects.get_or_create(name=name)
-                ProductParameter.objects.create(
-                    product_info=product_info,
-                    parameter=param,
-                    value=str(value)
-                )
-
-        return Response({'Status': True}, status=status.HTTP_200_OK)
+            dt_from = parse_period_bound(request.query_params.get('dt_from'))
+            dt_to = parse_period_bound(request.query_params.get('dt_to'), end=True)
+        except ValueError:
+            return Response({'Status': False, 'Error': 'dt_from and dt_to must be ISO dates or datetimes'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        items = OrderItem.objects.filter(shop_id=shop_id).exclude(order__state__in=REVENUE_EXCLUDED_STATES)
+        if dt_from:
+            items = items.filter(order__confirmed_at__gte=dt_from[0])
+        if dt_to:
+            items = items.filter(**{'order__confirmed_at__lt' if dt_to[1] else 'order__confirmed_at__lte': dt_to[0]})
+
+        days = items.annotate(day=TruncDate('order__confirmed_at')).values('day').order_by('day').annotate(
+            orders=Count('order_id', distinct=True), items=Sum('quantity'), revenue=Sum(F('price') * F('quantity'))
+        )
+        revenue = [{'day': row['day'].isoformat(), 'orders': row['orders'], 'items': row['items'],
+                    'revenue': row['revenue']} for row in days]
+        return Response({'Status': True, 'Revenue': revenue, 'Total': sum(row['revenue'] for row in revenue)})
+
+
+class PartnerState(APIView):
+    """
+    Приём заказов магазином поставщика: пока он выключен, товары магазина
+    нельзя добавить в корзину, а корзины с ними — подтвердить.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request: HttpRequest) -> Response:
+        """
+        Возвращает `{"Status": true, "State": true | false}`.
+        """
+        shop_id, error = partner_shop_id(request)
+        if error:
+            return error
+        return Response({'Status': True, 'State': shop_state.is_open(shop_id)})
+
+    def post(self, request: HttpRequest) -> Response:
+        """
+        Ожидает поле `state`: true/false (или on/off, 1/0).
+        Новое состояние применяется во всех процессах со следующего запроса.
+        """
+        shop_id, error = partner_shop_id(request)
+        if error:
+            return error
+        try:
+            state = serializers.BooleanField().to_internal_value(request.data.get('state'))
+        except serializers.ValidationError:
+            return Response({'Status': False, 'Error': 'state must be true or false'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        shop_state.set_state(shop_id, state)
+        return Response({'Status': True, 'State': state})
@@ -2,17 +2,48 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.db.models import Q
+from django.db.models import F, Q, QuerySet
 from rest_framework.request import Request
-from shop.models import ProductInfo
+from django.http import HttpResponse, StreamingHttpResponse
+from shop.models import ProductInfo, Shop
 from shop.serializers import ProductInfoSerializer
+from shop.utils import catalog_cache, documents, export, facets, search
+from shop.utils.facets import InvalidFacetFilter
+from shop.utils.pagination import keyset_page, InvalidCursor
 from rest_framework.exceptions import PermissionDenied
 
+ORDERING_FIELDS = ['price', '-price', 'quantity', '-quantity']
+
+
 class ProductListView(APIView):
     """
     Представление для получения списка товаров или информации об одном товаре,
     а также для редактирования и удаления товара владельцем магазина.
+
+    Параметр `name` — полнотекстовый поиск (см. shop.utils.search) по названию,
+    модели, описанию и значениям параметров; без `ordering` результаты
+    упорядочены по релевантности.
+
+    Фильтр по параметрам: `param=Имя:Значение`, параметр можно повторять
+    (значения одного параметра объединяются по ИЛИ, разные параметры — по И).
+    `facets=1` добавляет в ответ число найденных товаров по каждому значению параметров.
+
+    Товары в ответах GET не сериализуются заново: ответ собирается из готовых
+    JSON-документов предложений (см. shop.utils.documents).
+
+    Ответы GET кэшируются (см. shop.utils.catalog_cache) и сбрасываются
+    при изменении предложений магазина или категории.
+
+    Список поддерживает два вида пагинации:
+    - limit/offset (по умолчанию) — с полным `count`;
+    - курсорную (передан параметр `cursor`, для первой страницы пустой) — по ключу
+      (ordering, id), с токеном `next` для следующей страницы; `count=1` добавляет
+      в ответ число товаров, которое считается один раз на набор фильтров и кэшируется.
     """
+    # GET — фильтр по параметрам с фасетами (сборка недостающих документов на месте добавляет ещё 3);
+    # изменение товара пересобирает его документ, поисковый индекс и фасеты
+    query_budget = {'GET': 5, 'HEAD': 5, 'PATCH': 19, 'DELETE': 13}
+
     def get_permissions(self):
         if self.request.method in ['PATCH', 'DELETE']:
             return [IsAuthenticated()]
@@ -23,33 +54,31 @@ class ProductListView(APIView):
         Получает объект товара, проверяет, принадлежит ли он текущему пользователю.
         """
         try:
-            product = ProductInfo.objects.select_related('shop').get(pk=pk)
-            if product.shop.user != user:
+            product = ProductInfo.objects.select_related('shop', 'product').get(pk=pk)
+            if product.shop.user_id != user.pk:
                 raise PermissionDenied("You do not have permission to modify this product.")
             return product
         except ProductInfo.DoesNotExist:
             return None
 
-    def get(self, request: Request, pk: int = None) -> Response:
+    def get(self, request: Request, pk: int = None) -> HttpResponse | Response:
         if pk:
-            try:
-                product = ProductInfo.objects.select_related('product', 'shop') \
-                    .prefetch_related('product_parameters__parameter').get(pk=pk)
-            except ProductInfo.DoesNotExist:
-                return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+            return get_product_detail(request, pk)
 
-            serializer = ProductInfoSerializer(product)
-            return Response(serializer.data)
+        cache_key, payload = catalog_cache.get_list(request.query_params)
+        if payload is not None:
+            return documents.document_response(request, payload)
 
         # если pk не передан — обычный список с фильтрацией и пагинацией:
-        products = ProductInfo.objects.select_related('product', 'shop') \
-            .prefetch_related('product_parameters__parameter')
+        products = ProductInfo.objects.filter(is_active=True)
 
         category = request.query_params.get('category')
         shop = request.query_params.get('shop')
         price_min = request.query_params.get('price_min')
         price_max = request.query_params.get('price_max')
         name = request.query_params.get('name')
+        ordering = request.query_params.get('ordering')
+        cursor_mode = 'cursor' in request.query_params
 
         if category:
             products = products.filter(product__category_id=category)
@@ -59,11 +88,24 @@ class ProductListView(APIView):
             products = products.filter(price__gte=price_min)
         if price_max:
             products = products.filter(price__lte=price_max)
+        param_filters = request.query_params.getlist('param')
+        if param_filters:
+            try:
+                products = facets.filter_products(products, param_filters)
+            except InvalidFacetFilter as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Ранжированная выборка не годится как подзапрос, поэтому фасеты считаются по неранжированной
+        filtered = products
         if name:
-            products = products.filter(product__name__icontains=name)
+            filtered = search.search(products, name)
+            ranked = not cursor_mode and ordering not in ORDERING_FIELDS
+            products = search.search(products, name, ranked=True) if ranked else filtered
 
-        ordering = request.query_params.get('ordering')
-        if ordering in ['price', '-price', 'quantity', '-quantity']:
+        if cursor_mode:
+            return self.get_cursor_page(request, products, ordering, cache_key)
+
+        if ordering in ORDERING_FIELDS:
             products = products.order_by(ordering)
 
         try:
@@ -72,12 +114,60 @@ class ProductListView(APIView):
         except ValueError:
             return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
 
-        paginated = products[offset:offset + limit]
-        serializer = ProductInfoSerializer(paginated, many=True)
-        return Response({
+        paginated = page_documents(products[offset:offset + limit])
+        data = {
             'count': products.count(),
-            'results': serializer.data
-        })
+            'results': documents.render_list(paginated)
+        }
+        if request.query_params.get('facets') == '1':
+            data['facets'] = self.get_facets(request, filtered)
+        payload = documents.render_object(data)
+        catalog_cache.set_list(cache_key, payload)
+        return documents.document_response(request, payload)
+
+    def get_cursor_page(self, request: Request, products, ordering: str | None,
+                        cache_key: str) -> HttpResponse | Response:
+        """
+        Курсорная пагинация списка товаров по (ordering, id).
+        """
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page, next_cursor = keyset_page(with_documents(products),
+                                            ordering if ordering in ORDERING_FIELDS else 'id',
+                                            request.query_params.get('cursor') or None, limit)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {'next': next_cursor, 'results': documents.render_list(page_documents(page))}
+        if request.query_params.get('count') == '1':
+            count_key, count = catalog_cache.get_count(request.query_params)
+            if count is None:
+                count = products.count()
+                catalog_cache.set_count(count_key, count)
+            data['count'] = count
+        if request.query_params.get('facets') == '1':
+            data['facets'] = self.get_facets(request, products)
+
+        payload = documents.render_object(data)
+        catalog_cache.set_list(cache_key, payload)
+        return documents.document_response(request, payload)
+
+    def get_facets(self, request: Request, products) -> dict:
+        """
+        Фасеты для набора фильтров; без фильтров берутся предпосчитанные счётчики каталога.
+        """
+        cache_key, data = catalog_cache.get_facets(request.query_params)
+        if data is None:
+            filtered = any(request.query_params.get(name) for name in catalog_cache.FILTER_PARAMS)
+            data = facets.count_facets(products) if filtered else facets.catalog_facets()
+            catalog_cache.set_facets(cache_key, data)
+        return data
 
     def patch(self, request: Request, pk: int) -> Response:
         """
@@ -101,6 +191,7 @@ class ProductListView(APIView):
         if not product:
             return Response({'error': 'Not found or forbidden', "request": request, "pk": pk}, status=status.HTTP_403_FORBIDDEN)
 
+        # Кэш каталога и фасеты сбрасывает обработчик удаления (shop.signals)
         product.delete()
         return Response({'status': 'deleted'}, status=status.HTTP_204_NO_CONTENT)
 
@@ -110,15 +201,82 @@ class ProductDetailView(APIView):
     Отдельное представление для получения детальной информации о товаре.
     """
     permission_classes = [AllowAny]
+    query_budget = 1
 
-    def get(self, request: Request, pk: int) -> Response:
+    def get(self, request: Request, pk: int) -> HttpResponse | Response:
         """
         Возвращает подробную информацию о товаре по ID.
         """
-        try:
-            product = ProductInfo.objects.select_related('product', 'shop').prefetch_related('product_parameters__parameter').get(pk=pk)
-        except ProductInfo.DoesNotExist:
-            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return get_product_detail(request, pk)
+
+
+class ProductExportView(APIView):
+    """
+    Потоковая выгрузка всех активных предложений магазина (целиком или одной категории)
+    в JSON Lines или CSV — в том же виде, что принимает `partner/update/`,
+    поэтому выгрузку можно загрузить обратно как прайс-лист.
+    """
+    permission_classes = [AllowAny]
+    query_budget = 1
+
+    def get(self, request: Request) -> StreamingHttpResponse | Response:
+        """
+        Параметры: `shop` (обязателен), `category` (необязателен), `file_format` — jsonl (по умолчанию)
+        или csv (имя `format` занято DRF под выбор рендерера).
+        """
+        fmt = request.query_params.get('file_format', 'jsonl')
+        if fmt not in export.EXPORT_FORMATS:
+            return Response({'error': f'file_format must be one of: {", ".join(export.EXPORT_FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        shop_id = request.query_params.get('shop')
+        category = request.query_params.get('category')
+        if not shop_id:
+            return Response({'error': 'shop is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(value.isdigit() for value in (shop_id, category) if value):
+            return Response({'error': 'shop and category must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        shop = Shop.objects.filter(pk=shop_id).first()
+        if shop is None:
+            return Response({'error': 'Shop not found'}, status=status.HTTP_404_NOT_FOUND)
+        products = ProductInfo.objects.filter(is_active=True, shop=shop)
+        if category:
+            products = products.filter(product__category_id=category)
+
+        response = StreamingHttpResponse(export.export(products, fmt, shop), content_type=export.CONTENT_TYPES[fmt])
+        filename = f'shop-{shop.pk}-category-{category}' if category else f'shop-{shop.pk}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+        return response
+
+
+def with_documents(products):
+    """
+    Выборка предложений без загрузки связанных объектов: только ключи сортировки
+    и готовый документ (shop.utils.documents) каждого предложения.
+    """
+    return products.only('id', 'price', 'quantity').annotate(document_data=F('document__data'))
+
+
+def page_documents(page) -> list[bytes]:
+    if isinstance(page, QuerySet):
+        page = with_documents(page)
+    return documents.documents((item.pk, item.document_data) for item in page)
+
+
+def get_product_detail(request: Request, pk: int) -> HttpResponse | Response:
+    """
+    Карточка товара с учётом кэша каталога.
+    """
+    payload = catalog_cache.get_detail(pk)
+    if payload is not None:
+        return documents.document_response(request, payload)
+
+    row = ProductInfo.objects.filter(pk=pk, is_active=True)\
+        .values_list('shop_id', 'product__category_id', 'document__data').first()
+    if row is None:
+        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = ProductInfoSerializer(product)
-        return Response(serializer.data)
+    shop_id, category_id, data = row
+    payload, = documents.documents([(pk, data)])
+    catalog_cache.set_detail(pk, shop_id, category_id, payload)
+    return documents.document_response(request, payload)
@@ -4,32 +4,39 @@ from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny
 from shop.serializers import RegisterSerializer, LoginSerializer
-from django.core.mail import send_mail
-from django.conf import settings
+from shop.utils.email import send_welcome_email
+from shop.utils.hashing import HashingBusy
 from rest_framework.request import Request
 
+
+def busy_response(exc: HashingBusy) -> Response:
+    """
+    Ответ 503 при переполненном пуле хэширования паролей: клиенту стоит повторить запрос позже.
+    """
+    return Response({'error': str(exc.detail)}, status=exc.status_code, headers={'Retry-After': '1'})
+
+
 class RegisterView(APIView):
     """
     Регистрация нового пользователя.
 
-    При успешной регистрации создаётся токен и отправляется письмо на указанный email.
+    При успешной регистрации создаётся токен и в очередь ставится письмо на указанный email.
     """
     permission_classes = [AllowAny]
+    # С EMAIL_OUTBOX_EAGER письмо отправляется в том же запросе (без него — 7)
+    query_budget = 12
 
     def post(self, request: Request) -> Response:
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            try:
+                user = serializer.save()
+            except HashingBusy as exc:
+                return busy_response(exc)
             token, _ = Token.objects.get_or_create(user=user)
 
-            # Отправка уведомления на email
-            send_mail(
-                subject='Добро пожаловать!',
-                message='Вы успешно зарегистрировались на нашем сервисе. Спасибо, что выбрали нас!',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+            # Письмо отправит воркер очереди (send_outbox), запрос не ждёт почтовый сервер
+            send_welcome_email(user.email)
 
             return Response({'token': token.key}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -39,13 +46,20 @@ class LoginView(APIView):
     """
     Авторизация пользователя по email и паролю.
 
-    Возвращает токен доступа.
+    Возвращает токен доступа. Пароль проверяется в пуле хэширования (shop.utils.hashing);
+    хэш, созданный по прежней политике PASSWORD_HASHER, при этом пересчитывается.
     """
     permission_classes = [AllowAny]
+    # Вход с хэшем по прежней политике сохраняет пересчитанный хэш
+    query_budget = 3
 
     def post(self, request: Request) -> Response:
         serializer = LoginSerializer(data=request.data)
-        if serializer.is_valid():
+        try:
+            valid = serializer.is_valid()
+        except HashingBusy as exc:
+            return busy_response(exc)
+        if valid:
             user = serializer.validated_data
             token, _ = Token.objects.get_or_create(user=user)
             return Response({'token': token.key})